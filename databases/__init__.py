@@ -1,4 +1,4 @@
-from databases.db import init_db, get_session
-from databases.models import User, Expense, FeedbackReport
+from databases.db import init_db, get_session, get_async_session
+from databases.models import User, Expense, FeedbackReport, DailyExpenseRollup, MonoAccount
 
-__all__ = ['init_db', 'get_session', 'User', 'Expense', 'FeedbackReport']
\ No newline at end of file
+__all__ = ['init_db', 'get_session', 'get_async_session', 'User', 'Expense', 'FeedbackReport', 'DailyExpenseRollup', 'MonoAccount']
\ No newline at end of file
@@ -1,8 +1,16 @@
 import os
 import json
+import logging
 from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 from databases.models import Base
+from databases.rollups import rebuild_rollups
+from databases.sync import prune_tombstones
+from utils.categories import LEGACY_CATEGORY_MAP, STORED_CATEGORIES
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./moneylytics_bot.db")
 
@@ -14,65 +22,55 @@ engine = create_engine(DATABASE_URL, echo=False)
 
 SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
 
+
+def _async_database_url(url: str):
+    """Same database, async driver: asyncpg for Postgres, aiosqlite for
+    SQLite. asyncpg spells libpq's `sslmode` query param as `ssl`."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "postgresql":
+        query = dict(parsed.query)
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        return parsed.set(drivername="postgresql+asyncpg", query=query)
+    if parsed.get_backend_name() == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite")
+    return parsed
+
+
+# The bot worker's handlers are coroutines, so they use this engine and never
+# block the event loop on a DB round trip. The webapp (FastAPI threadpool)
+# and init_db stay on the sync engine above, except for the Monobank webhook,
+# which queues deliveries from the event loop; both share one schema.
+async_engine = create_async_engine(_async_database_url(DATABASE_URL), echo=False)
+
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
 def _normalize_legacy_categories(conn):
     # Collapses old free-form/localized categories into the five canonical ones.
     # Idempotent — safe to run on every startup.
-    legacy_mappings = {
-        'еда': 'food',
-        'пища': 'food',
-        'пицца': 'food',
-        'pizza': 'food',
-        
-        'транспорт': 'transport',
-        'uber': 'transport',
-        'bolt': 'transport',
-        'taxi': 'transport',
-        'bus': 'transport',
-        'metro': 'transport',
-        'train': 'transport',
-        
-        'жилье': 'housing',
-        'жильё': 'housing',
-        'rent': 'housing',
-        'water': 'housing',
-        'electricity': 'housing',
-        'internet': 'housing',
-        'ikea': 'housing',
-        
-        'развлечения': 'entertainment',
-        'netflix': 'entertainment',
-        'spotify': 'entertainment',
-        'cinema': 'entertainment',
-        'steam': 'entertainment',
-        'bowling': 'entertainment',
-
-        'salon': 'beauty',
-        'beauty': 'beauty',
-        'краса': 'beauty',
-        'салон': 'beauty',
-        'косметика': 'beauty',
-
-        'другое': 'other',
-    }
-
     case_conditions = []
-    for legacy, canonical in legacy_mappings.items():
+    for legacy, canonical in LEGACY_CATEGORY_MAP.items():
         case_conditions.append(f"WHEN LOWER(category) = '{legacy.lower()}' THEN '{canonical}'")
     
     case_statement = '\n    '.join(case_conditions)
+    stored = ", ".join(f"'{c}'" for c in STORED_CATEGORIES)
 
-    normalize_query = f"""
-    UPDATE expenses
-    SET category = CASE
+    case_expr = f"""CASE
         {case_statement}
-        WHEN LOWER(category) IN ('food', 'transport', 'housing', 'entertainment', 'beauty', 'transfer', 'other')
+        WHEN LOWER(category) IN ({stored})
             THEN LOWER(category)
         ELSE 'other'
-    END
-    WHERE category IS NOT NULL
+    END"""
+
+    # Only touch rows that actually change, so the rowcount tells init_db
+    # whether the daily rollups need rebuilding.
+    normalize_query = f"""
+    UPDATE expenses
+    SET category = {case_expr}
+    WHERE category IS NOT NULL AND category <> {case_expr}
     """
-    
-    conn.execute(text(normalize_query))
+
+    return conn.execute(text(normalize_query)).rowcount
 
 def _migrate_budgets_to_json(conn, columns):
     """Adds the `budgets` JSON column and folds the legacy single-currency
@@ -123,8 +121,10 @@ def _migrate_budgets_to_json(conn, columns):
 
 
 def init_db():
+    existing_tables = set(inspect(engine).get_table_names())
     Base.metadata.create_all(bind=engine)
     inspector = inspect(engine)
+    rollups_stale = "daily_expense_rollups" not in existing_tables
     if "users" in inspector.get_table_names():
         columns = {column["name"] for column in inspector.get_columns("users")}
         with engine.begin() as conn:
@@ -156,11 +156,19 @@ def init_db():
                 conn.execute(text("ALTER TABLE expenses ADD COLUMN mono_tx_id VARCHAR(100)"))
             if "mono_counter_name" not in columns:
                 conn.execute(text("ALTER TABLE expenses ADD COLUMN mono_counter_name VARCHAR(255)"))
+            if "idempotency_key" not in columns:
+                conn.execute(text("ALTER TABLE expenses ADD COLUMN idempotency_key VARCHAR(64)"))
+            if "version" not in columns:
+                # Existing rows start at version 1, with every user's counter
+                # (below), so a first sync from 0 returns all of them.
+                conn.execute(text("ALTER TABLE expenses ADD COLUMN updated_at TIMESTAMP"))
+                conn.execute(text("ALTER TABLE expenses ADD COLUMN version BIGINT NOT NULL DEFAULT 1"))
+                conn.execute(text("UPDATE expenses SET updated_at = created_at"))
             conn.execute(text(
                 "CREATE UNIQUE INDEX IF NOT EXISTS ix_expenses_mono_tx_id "
                 "ON expenses (mono_tx_id)"
             ))
-            conn.execute(text(
+            backfilled = conn.execute(text(
                 """
                 UPDATE expenses
                 SET currency = COALESCE(
@@ -169,14 +177,71 @@ def init_db():
                 )
                 WHERE currency IS NULL OR currency = ''
                 """
-            ))
-            _normalize_legacy_categories(conn)
+            )).rowcount
+            if _normalize_legacy_categories(conn) or backfilled:
+                rollups_stale = True
 
     if "feedback_reports" not in inspector.get_table_names():
         Base.metadata.tables['feedback_reports'].create(bind=engine)
 
     if "subscriptions" not in inspector.get_table_names():
         Base.metadata.tables['subscriptions'].create(bind=engine)
+    else:
+        columns = {column["name"] for column in inspector.get_columns("subscriptions")}
+        if "version" not in columns:
+            with engine.begin() as conn:
+                conn.execute(text("ALTER TABLE subscriptions ADD COLUMN updated_at TIMESTAMP"))
+                conn.execute(text("ALTER TABLE subscriptions ADD COLUMN version BIGINT NOT NULL DEFAULT 1"))
+                conn.execute(text("UPDATE subscriptions SET updated_at = created_at"))
+
+    if "sync_versions" not in existing_tables and "users" in existing_tables:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO sync_versions (user_id, version, pruned_version) SELECT id, 1, 0 FROM users"
+            ))
+    # Each deploy/restart drops deletions too old for any client to need.
+    with engine.begin() as conn:
+        prune_tombstones(conn)
+
+    _create_missing_indexes()
+
+    # Fresh rollup table (first deploy) or categories rewritten underneath
+    # it: recompute from raw rows. Every later write keeps it incrementally.
+    if rollups_stale:
+        with engine.begin() as conn:
+            rebuild_rollups(conn)
+
+
+def missing_indexes() -> list:
+    """Model indexes on existing tables that the database doesn't have.
+    create_all() only builds indexes together with a brand-new table, so
+    composite indexes added to the models later show up here."""
+    inspector = inspect(engine)
+    missing = []
+    for table_name in ("expenses", "subscriptions", "daily_expense_rollups"):
+        existing = {index["name"] for index in inspector.get_indexes(table_name)}
+        missing.extend(index for index in Base.metadata.tables[table_name].indexes
+                       if index.name not in existing)
+    return missing
+
+
+def _create_missing_indexes():
+    """Build missing indexes on SQLite. On Postgres a plain CREATE INDEX
+    blocks writes to the table for the whole build, and every dyno would
+    race to run it at boot, so they are only reported here and built by
+    scripts/indexes.py with CREATE INDEX CONCURRENTLY."""
+    missing = missing_indexes()
+    if engine.dialect.name == "postgresql":
+        if missing:
+            logger.warning("missing indexes %s: run scripts/indexes.py",
+                           ", ".join(index.name for index in missing))
+        return
+    for index in missing:
+        index.create(bind=engine)
 
 def get_session() -> Session:
     return SessionLocal()
+
+
+def get_async_session() -> AsyncSession:
+    return AsyncSessionLocal()
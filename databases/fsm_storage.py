@@ -0,0 +1,180 @@
+"""Conversation state (aiogram FSM) that outlives the process and is shared
+by every bot worker.
+
+`make_fsm_storage()` picks the backend: Redis when REDIS_URL is set (or
+FSM_STORAGE=redis), otherwise the `fsm_states` table in the bot's own
+database. FSM_STORAGE=memory keeps aiogram's old per-process storage.
+
+`SQLAlchemyStorage` batches its writes. A handler typically calls
+set_state() and update_data() back to back, and clear() is two writes of
+its own; those only change an in-memory buffer, which reads see. The
+buffer is written out by `flush()` — one executemany upsert plus one
+DELETE for every key written since the last flush — and FSMFlushMiddleware
+calls it once each update has been handled, so a user's next update finds
+the state in the database whichever worker it lands on. Updates handled
+concurrently share a flush.
+
+Every write pushes a row's expiry FSM_STATE_TTL seconds out; expired rows
+read as empty and `fsm_state_sweeper()` deletes them, so a conversation
+abandoned halfway doesn't stay pending forever.
+"""
+
+import asyncio
+import copy
+import logging
+from datetime import datetime, timedelta
+from os import getenv
+from typing import Any, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import case, delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from databases.db import async_engine
+from databases.models import FsmState
+
+logger = logging.getLogger(__name__)
+
+_states = FsmState.__table__
+
+REDIS_URL = getenv("REDIS_URL")
+FSM_STORAGE = getenv("FSM_STORAGE") or ("redis" if REDIS_URL else "database")
+FSM_STATE_TTL = int(getenv("FSM_STATE_TTL", str(24 * 3600)))  # seconds
+SWEEP_INTERVAL = 600  # seconds between deletes of expired rows
+
+
+def _insert(conn):
+    return pg_insert if conn.dialect.name == "postgresql" else sqlite_insert
+
+
+def _write_batch(conn, batch: dict[str, dict], now: datetime, expires_at: datetime) -> None:
+    """Write buffered changes: rows left with no state and no data are
+    deleted, the rest upserted. An entry holds only the columns that were
+    written, so set_state() alone never overwrites another worker's data."""
+    gone = [key for key, cols in batch.items()
+            if "state" in cols and "data" in cols and cols["state"] is None and not cols["data"]]
+    if gone:
+        conn.execute(delete(_states).where(_states.c.key.in_(gone)))
+
+    by_columns: dict[tuple, list[dict]] = {}
+    for key, cols in batch.items():
+        if key not in gone:
+            by_columns.setdefault(tuple(sorted(cols)), []).append({"key": key, **cols})
+    for columns, rows in by_columns.items():
+        for row in rows:
+            row.setdefault("state", None)
+            row.setdefault("data", {})
+            row["expires_at"] = expires_at
+        stmt = _insert(conn)(_states)
+        set_ = {col: stmt.excluded[col] for col in (*columns, "expires_at")}
+        for col in {"state", "data"} - set(columns):
+            # An expired row's other half is stale: start it empty too.
+            set_[col] = case((_states.c.expires_at <= now, stmt.excluded[col]), else_=_states.c[col])
+        stmt = stmt.on_conflict_do_update(index_elements=["key"], set_=set_)
+        conn.execute(stmt, rows)
+
+
+class SQLAlchemyStorage(BaseStorage):
+    def __init__(self, ttl: int = FSM_STATE_TTL):
+        self.ttl = ttl
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True,
+                                             with_business_connection_id=True)
+        # key → the columns written since the last flush.
+        self._dirty: dict[str, dict] = {}
+        self._flushing: dict[str, dict] = {}
+        self._flush_lock = asyncio.Lock()
+        self.flushes = 0
+        self.rows_written = 0
+
+    def _buffered(self, key: str, column: str):
+        for batch in (self._dirty, self._flushing):
+            cols = batch.get(key)
+            if cols is not None and column in cols:
+                return True, cols[column]
+        return False, None
+
+    async def _read(self, key: str, column: str):
+        found, value = self._buffered(key, column)
+        if found:
+            return value
+        async with async_engine.connect() as conn:
+            return (await conn.execute(
+                select(_states.c[column])
+                .where(_states.c.key == key, _states.c.expires_at > datetime.now())
+            )).scalar()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        self._dirty.setdefault(self.key_builder.build(key), {})["state"] = value
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return await self._read(self.key_builder.build(key), "state")
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise TypeError(f"Data must be a dict, got {type(data).__name__}")
+        self._dirty.setdefault(self.key_builder.build(key), {})["data"] = copy.deepcopy(data)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return copy.deepcopy(await self._read(self.key_builder.build(key), "data") or {})
+
+    async def flush(self) -> None:
+        """Write every buffered change in one transaction. On failure the
+        changes stay buffered for the next flush."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return  # a flush we waited for already took our writes
+            batch, self._dirty = self._dirty, {}
+            self._flushing = batch
+            try:
+                now = datetime.now()
+                async with async_engine.begin() as conn:
+                    await conn.run_sync(_write_batch, batch, now, now + timedelta(seconds=self.ttl))
+                self.flushes += 1
+                self.rows_written += len(batch)
+            except BaseException:
+                for key, cols in batch.items():
+                    self._dirty[key] = {**cols, **self._dirty.get(key, {})}
+                raise
+            finally:
+                self._flushing = {}
+
+    async def close(self) -> None:
+        await self.flush()
+
+
+def prune_fsm_states(conn) -> int:
+    return conn.execute(delete(_states).where(_states.c.expires_at <= datetime.now())).rowcount
+
+
+async def fsm_state_sweeper(interval: float = SWEEP_INTERVAL) -> None:
+    """Delete expired states every `interval` seconds. Meant to be started
+    as a task next to the bot's polling loop when the database backend is
+    in use; Redis expires its keys itself."""
+    while True:
+        try:
+            async with async_engine.begin() as conn:
+                pruned = await conn.run_sync(prune_fsm_states)
+            if pruned:
+                logger.info("fsm: pruned %d expired state(s)", pruned)
+        except Exception:
+            logger.exception("fsm state sweep failed")
+        await asyncio.sleep(interval)
+
+
+def make_fsm_storage() -> BaseStorage:
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+    if FSM_STORAGE == "redis":
+        # Optional dependency: `pip install redis` where Redis is used.
+        from aiogram.fsm.storage.redis import RedisStorage
+
+        if not REDIS_URL:
+            raise ValueError("FSM_STORAGE=redis needs REDIS_URL")
+        return RedisStorage.from_url(REDIS_URL, state_ttl=FSM_STATE_TTL, data_ttl=FSM_STATE_TTL)
+    if FSM_STORAGE == "database":
+        return SQLAlchemyStorage()
+    raise ValueError(f"FSM_STORAGE must be 'database', 'redis' or 'memory', not {FSM_STORAGE!r}")
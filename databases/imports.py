@@ -0,0 +1,226 @@
+"""Bulk import of expenses from an uploaded file.
+
+The webapp and the bot read the file (utils.export) as batches of columns
+in the export layout — strings from CSV, typed values from Parquet — and
+an `ExpenseImport` takes them one batch at a time. `prepare()` validates a
+batch one column at a time: each column goes through a single converter,
+and currencies and categories, which repeat across a file, are resolved
+once per distinct value. A row with no category gets one from its
+description (utils.categorizer). `write()` drops the rows already stored
+and inserts the rest with one executemany INSERT, in the caller's
+transaction. Like the other Core write paths it updates the daily rollup
+and stamps sync versions itself.
+
+A row counts as already stored when its `id` is one of the user's
+expenses, or when another of the user's expenses has the same amount,
+currency and description in the same minute. The second rule is what
+makes a re-import add nothing when the ids don't help: the Mini App's CSV
+has none, and rows restored from an export get new ones.
+
+`import_expenses()` runs every batch on one connection. The bot reads and
+prepares each batch in a worker thread and writes it on the event loop,
+so a large file never stalls other updates.
+"""
+
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Iterable
+
+from sqlalchemy import insert, select
+
+from databases.models import Expense
+from databases.rollups import apply_rollup_deltas, expense_deltas
+from databases.sync import stamp_rows
+from utils.categories import normalize_category
+from utils.categorizer import predict_many
+from utils.currency import CURRENCY_MAP
+
+_expenses = Expense.__table__
+
+MAX_IMPORT_BYTES = 20 * 1024 * 1024  # also Telegram's limit on files a bot downloads
+MAX_ERRORS = 100  # per-row errors reported back; the count is always exact
+MAX_AMOUNT = 1_000_000  # same cap as a typed expense
+
+
+def _amount(value) -> float:
+    if isinstance(value, str):
+        value = value.strip().replace(" ", "").replace(",", ".")
+        if not value:
+            raise ValueError("missing")
+        try:
+            value = float(value)
+        except ValueError:
+            raise ValueError("not a number") from None
+    if value is None:
+        raise ValueError("missing")
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError("not a number")
+    if not math.isfinite(value) or value <= 0:
+        raise ValueError("must be positive")
+    if value > MAX_AMOUNT:
+        raise ValueError("too large")
+    return round(float(value), 2)
+
+
+def _timestamp(value) -> datetime:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError("missing")
+    try:
+        return datetime.fromisoformat(value.strip()).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError("not a date (YYYY-MM-DD HH:MM:SS)") from None
+
+
+@lru_cache(maxsize=256)
+def _currency(value: str) -> str:
+    code = CURRENCY_MAP.get(value.strip().upper())
+    if code is None:
+        raise ValueError(f"unknown {value!r}")
+    return code
+
+
+_category = lru_cache(maxsize=1024)(normalize_category)
+
+
+def _description(value) -> str | None:
+    return (str(value).strip().replace("\n", " ")[:500] or None) if value else None
+
+
+def _column(values: list, name: str, convert, bad: dict[int, str]) -> list:
+    """`convert` applied down one column; failures land in `bad` by index."""
+    out = []
+    for i, value in enumerate(values):
+        try:
+            out.append(convert(value))
+        except ValueError as e:
+            out.append(None)
+            bad.setdefault(i, f"{name}: {e}")
+    return out
+
+
+def _key(created_at: datetime, amount, currency: str, description: str | None) -> tuple:
+    """What makes two expenses the same one when their ids don't say so.
+    To the minute, as the Mini App's CSV has no seconds."""
+    return created_at.replace(second=0, microsecond=0), round(amount, 2), currency, description
+
+
+class ExpenseImport:
+    """One file's import into `user_id`'s expenses, a batch at a time.
+    `result` holds the counts so far."""
+
+    def __init__(self, user_id: int, default_currency: str = "EUR"):
+        self.user_id = user_id
+        self.default_currency = default_currency
+        self.imported = self.skipped = self.error_count = 0
+        self.errors: list[dict] = []
+        self._rows_read = 0
+        # Stored expenses a row was matched to, and the ones this import
+        # inserted: neither can stand for a row of a later batch.
+        self._taken: set[int] = set()
+
+    @property
+    def result(self) -> dict:
+        return {"imported": self.imported, "skipped": self.skipped,
+                "error_count": self.error_count, "errors": self.errors}
+
+    def prepare(self, batch: dict[str, list]) -> dict:
+        """Validate a batch of columns with no database access, so the bot
+        can run it off the event loop: the valid rows, the ids the file
+        gave them, and the others as {"row", "error"}. A row's number is its
+        `line` when the reader set one, else its 1-based position."""
+        size = max((len(column) for column in batch.values()), default=0)
+        first, self._rows_read = self._rows_read + 1, self._rows_read + size
+
+        def values(name: str) -> list:
+            return batch.get(name) or [None] * size
+
+        bad: dict[int, str] = {}
+        amounts = _column(values("amount"), "amount", _amount, bad)
+        dates = _column(values("created_at"), "created_at", _timestamp, bad)
+        currencies = _column(values("currency"), "currency",
+                             lambda c: _currency(c) if c else self.default_currency, bad)
+        categories = _column(values("category"), "category", _category, bad)
+        descriptions = _column(values("description"), "description", _description, bad)
+        # A row with no category gets the one its description suggests.
+        blank = [i for i, category in enumerate(values("category"))
+                 if descriptions[i] and not str(category or "").strip()]
+        for i, category in zip(blank, predict_many(descriptions[i] for i in blank)):
+            categories[i] = category
+
+        lines = batch.get("line") or range(first, first + size)
+        rows, ids, errors = [], [], []
+        for i, file_id in enumerate(values("id")):
+            if i in bad:
+                errors.append({"row": lines[i], "error": bad[i]})
+                continue
+            rows.append({
+                "user_id": self.user_id, "amount": amounts[i], "created_at": dates[i],
+                "currency": currencies[i], "category": categories[i], "description": descriptions[i],
+            })
+            ids.append(file_id)
+        return {"rows": rows, "ids": ids, "errors": errors}
+
+    def _stored(self, conn, rows: list[dict], ids: list) -> tuple[set, dict]:
+        """The batch's ids that are the user's expenses, and the ids of the
+        user's other expenses in the batch's time span by key (the span is
+        narrow: exports come out in rough date order)."""
+        file_ids = [i for i in ids if i is not None]
+        stored_ids = set(conn.execute(
+            select(_expenses.c.id)
+            .where(_expenses.c.user_id == self.user_id, _expenses.c.id.in_(file_ids))
+        ).scalars()) if file_ids else set()
+        dates = [row["created_at"] for row in rows]
+        span = conn.execute(
+            select(_expenses.c.id, _expenses.c.created_at, _expenses.c.amount,
+                   _expenses.c.currency, _expenses.c.description)
+            .where(_expenses.c.user_id == self.user_id,
+                   _expenses.c.created_at >= min(dates).replace(second=0, microsecond=0),
+                   _expenses.c.created_at < max(dates) + timedelta(minutes=1))
+        ).all()
+        by_key = defaultdict(list)
+        for row in span:
+            if row.id not in stored_ids and row.id not in self._taken:
+                by_key[_key(*row[1:])].append(row.id)
+        return stored_ids, by_key
+
+    def write(self, conn, prepared: dict) -> None:
+        """Insert a prepared batch, minus the rows already stored."""
+        rows, ids = prepared["rows"], prepared["ids"]
+        self.error_count += len(prepared["errors"])
+        self.errors.extend(prepared["errors"][:MAX_ERRORS - len(self.errors)])
+        if not rows:
+            return
+        stored_ids, by_key = self._stored(conn, rows, ids)
+        new = []
+        for row, file_id in zip(rows, ids):
+            if file_id in stored_ids:
+                self._taken.add(file_id)
+                continue
+            matches = by_key.get(_key(row["created_at"], row["amount"], row["currency"], row["description"]))
+            if matches:
+                self._taken.add(matches.pop())
+                continue
+            new.append(row)
+        self.skipped += len(rows) - len(new)
+        self.imported += len(new)
+        if new:
+            stamp_rows(conn, new)
+            self._taken.update(conn.execute(insert(_expenses).returning(_expenses.c.id), new).scalars())
+            apply_rollup_deltas(conn, expense_deltas(new))
+
+
+def import_expenses(conn, user_id: int, batches: Iterable[dict[str, list]],
+                    default_currency: str = "EUR") -> dict:
+    """Insert the rows of `batches` for `user_id`, skipping the ones already
+    stored (see above), so re-importing an export adds nothing. Returns
+    counts of imported, skipped and bad rows, plus the first MAX_ERRORS
+    errors as {"row": number, "error": message}; a bad row never stops the
+    others."""
+    job = ExpenseImport(user_id, default_currency)
+    for batch in batches:
+        job.write(conn, job.prepare(batch))
+    return job.result
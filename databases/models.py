@@ -1,5 +1,5 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import BigInteger, Boolean, String, Float, DateTime, Integer, ForeignKey, Date, JSON
+from sqlalchemy import BigInteger, Boolean, String, Float, DateTime, Integer, ForeignKey, Date, JSON, Index
 from datetime import datetime, date
 
 class Base(DeclarativeBase):
@@ -86,11 +86,32 @@ class Expense(Base):
     # Monobank counterparty name (statementItem.counterName) — the recipient
     # shown for auto-imported expenses; kept out of the free-form description.
     mono_counter_name: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    # Client-generated key of an expense queued offline in the Mini App
+    # (POST /api/expenses/batch); unique per user, so a resent batch
+    # doesn't add it twice.
+    idempotency_key: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # Stamped on every write with the owner's next change version, for the
+    # Mini App's delta sync (databases/sync.py).
+    updated_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    version: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+
+    # Almost every read is "this user's rows in a created_at window", often
+    # narrowed to one currency. On Postgres the INCLUDE columns make these
+    # covering, so sums/group-bys never touch the heap; SQLite ignores them.
+    __table_args__ = (
+        Index("ix_expenses_user_created", "user_id", "created_at",
+              postgresql_include=["amount", "currency", "category"]),
+        Index("ix_expenses_user_currency_created", "user_id", "currency", "created_at",
+              postgresql_include=["amount"]),
+        Index("ix_expenses_user_version", "user_id", "version"),
+        Index("ix_expenses_user_idempotency_key", "user_id", "idempotency_key", unique=True),
+    )
 
 class Subscription(Base):
-    """A recurring charge the user wants tracked. The webapp fires due ones
-    on each /api/stats hit (lazy, no cron) — turning them into normal
-    Expense rows and advancing `next_due_date` to the following period."""
+    """A recurring charge the user wants tracked. The worker's background
+    sweep (databases/subscriptions.py) fires due ones — turning them into
+    normal Expense rows and advancing `next_due_date` to the following
+    period."""
     __tablename__ = 'subscriptions'
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('users.id'))
@@ -103,6 +124,48 @@ class Subscription(Base):
     next_due_date: Mapped[date] = mapped_column(Date)
     active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    updated_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    version: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+
+    __table_args__ = (
+        Index("ix_subscriptions_user_active_due", "user_id", "active", "next_due_date"),
+        Index("ix_subscriptions_user_version", "user_id", "version"),
+        # The background sweep looks across all users for due rows.
+        Index("ix_subscriptions_active_due", "active", "next_due_date"),
+    )
+
+
+class DailyExpenseRollup(Base):
+    """Per-user daily totals, one row per (day, currency, category). Kept in
+    step with `expenses` by databases.rollups on every flush, so dashboard
+    totals, budget checks and activity counts never re-sum raw rows."""
+    __tablename__ = 'daily_expense_rollups'
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    currency: Mapped[str] = mapped_column(String(20), primary_key=True)
+    category: Mapped[str] = mapped_column(String(100), primary_key=True)
+    total: Mapped[float] = mapped_column(Float, default=0.0, nullable=False)
+    count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    # Admin DAU/WAU look across users by day.
+    __table_args__ = (
+        Index("ix_daily_expense_rollups_day", "day", "user_id"),
+    )
+
+
+class MonoAccount(Base):
+    """A Monobank account or jar belonging to a connected user, copied from
+    client-info at setup time and refreshed by the worker
+    (databases/mono_accounts.py). Webhook processing maps an incoming account
+    id to its owner with a primary-key lookup and reads the user's own IBANs
+    from here instead of calling Monobank."""
+    __tablename__ = 'mono_accounts'
+    account_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('users.id'), index=True)
+    iban: Mapped[str | None] = mapped_column(String(34), nullable=True)
+    currency: Mapped[str | None] = mapped_column(String(20), nullable=True)
+    is_jar: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
 
 
 class FeedbackReport(Base):
@@ -111,4 +174,129 @@ class FeedbackReport(Base):
     user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('users.id'))
     text: Mapped[str] = mapped_column(String(2000))
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
-    is_read: Mapped[bool] = mapped_column(default=False)
\ No newline at end of file
+    is_read: Mapped[bool] = mapped_column(default=False)
+
+class MonoWebhookEvent(Base):
+    """A raw Monobank webhook delivery. The webhook only appends here and
+    answers 200; the worker (databases/mono_events.py) applies pending rows
+    in order, retrying failures with backoff until they are dead-lettered.
+    Dead rows can be replayed with scripts/mono_events.py."""
+    __tablename__ = 'mono_webhook_events'
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    payload: Mapped[dict] = mapped_column(JSON)
+    tx_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # 'pending' → 'done', or 'dead' once every retry has failed.
+    status: Mapped[str] = mapped_column(String(20), default="pending", nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, nullable=False)
+    received_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    processed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    # What applying the event did: 'ok', 'duplicate', 'own_transfer', ...
+    result: Mapped[str | None] = mapped_column(String(40), nullable=True)
+    last_error: Mapped[str | None] = mapped_column(String(500), nullable=True)
+
+    # The worker claims the oldest due pending rows.
+    __table_args__ = (
+        Index("ix_mono_webhook_events_status_next", "status", "next_attempt_at", "id"),
+    )
+
+
+class MonoBackfill(Base):
+    """Progress of importing one Monobank account's statement history from
+    before the user connected (databases/mono_backfill.py). The importer
+    walks backwards from `until` to `since` one statement page at a time,
+    moving `cursor` in the same transaction as each page's inserts, so an
+    interrupted run resumes exactly where it stopped. Times are unix
+    seconds, as Monobank takes them."""
+    __tablename__ = 'mono_backfills'
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('users.id'), primary_key=True)
+    account_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    since: Mapped[int] = mapped_column(BigInteger)
+    until: Mapped[int] = mapped_column(BigInteger)
+    # Everything in [cursor, until] has been imported.
+    cursor: Mapped[int] = mapped_column(BigInteger)
+    # 'running' → 'done', or 'failed' once Monobank keeps refusing it.
+    status: Mapped[str] = mapped_column(String(20), default="running", nullable=False)
+    imported: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # Permanent errors in a row; see run_job().
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_error: Mapped[str | None] = mapped_column(String(500), nullable=True)
+    # A worker owns the job until this unix time; see claim_jobs().
+    lease_until: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_mono_backfills_status", "status", "updated_at"),
+    )
+
+
+class FsmState(Base):
+    """The bot's conversation state (aiogram FSM) per chat/user, shared by
+    every worker process; see databases/fsm_storage.py. Rows nobody has
+    touched for FSM_STATE_TTL seconds count as gone and are swept."""
+    __tablename__ = 'fsm_states'
+    # aiogram's storage key: "fsm:<bot>:<chat>:<user>:...".
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    data: Mapped[dict] = mapped_column(JSON, default=dict, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+
+
+class Broadcast(Base):
+    """An admin broadcast and how far it got (handlers/broadcast.py).
+    Recipients are sent to in user id order; everything up to `cursor` has
+    been handled, so a broadcast interrupted by a restart carries on from
+    there instead of starting over or being lost."""
+    __tablename__ = 'broadcasts'
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    text: Mapped[str] = mapped_column(String(4096))
+    # Language code, or None for every reachable user.
+    language: Mapped[str | None] = mapped_column(String(10), nullable=True)
+    # 'running' → 'done' | 'stopped'.
+    status: Mapped[str] = mapped_column(String(20), default="running", nullable=False)
+    # The admin's progress message, edited as the broadcast goes.
+    chat_id: Mapped[int] = mapped_column(BigInteger)
+    message_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    admin_lang: Mapped[str] = mapped_column(String(10), default="en", nullable=False)
+    total: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    sent: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    failed: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    blocked: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    cursor: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    # A worker owns the broadcast until this unix time.
+    lease_until: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_broadcasts_status", "status", "lease_until"),
+    )
+
+
+class SyncVersion(Base):
+    """Per-user change counter for the Mini App's delta sync. Every
+    transaction that writes a user's expenses or subscriptions takes the
+    next value and stamps it on the rows (and tombstones) it touches."""
+    __tablename__ = 'sync_versions'
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    # Tombstones at or below this version were pruned.
+    pruned_version: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+
+
+class SyncTombstone(Base):
+    """A deleted expense or subscription, so a client syncing from an
+    older version learns to drop it."""
+    __tablename__ = 'sync_tombstones'
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(BigInteger)
+    # 'expense' or 'subscription'.
+    kind: Mapped[str] = mapped_column(String(20))
+    object_id: Mapped[int] = mapped_column(Integer)
+    version: Mapped[int] = mapped_column(BigInteger)
+    deleted_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        Index("ix_sync_tombstones_user_version", "user_id", "version"),
+        Index("ix_sync_tombstones_deleted_at", "deleted_at"),
+    )
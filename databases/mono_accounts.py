@@ -0,0 +1,112 @@
+"""The Monobank account → user mapping behind the webhook.
+
+`mono_setup` stores a user's accounts and jars as soon as the token is
+saved; the worker's `mono_account_refresher()` re-reads client-info for
+every connected user once an interval to pick up new cards and jars (and,
+on its first pass after a deploy, fills the table for users who connected
+before it existed). Between full passes it retries, every
+UNMAPPED_INTERVAL, the connected users with no accounts stored — those
+whose client-info call failed at setup — so their webhook deliveries,
+which wait in the queue meanwhile, resolve within minutes. Webhook
+processing (databases/mono_events.py) then resolves an account id with one
+primary-key lookup and never calls Monobank on the hot path.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from os import getenv
+
+from cryptography.fernet import InvalidToken
+from sqlalchemy import delete, exists, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from databases.db import async_engine
+from databases.models import MonoAccount, User
+from databases.mono_backfill import schedule_backfills
+from utils.mono import MonoError, account_rows, decrypt_token, get_mono_client, mono_request
+
+logger = logging.getLogger(__name__)
+
+_accounts = MonoAccount.__table__
+_users = User.__table__
+
+REFRESH_INTERVAL = float(getenv("MONO_ACCOUNTS_REFRESH_INTERVAL", "3600"))  # seconds
+UNMAPPED_INTERVAL = 60  # seconds; Monobank allows one client-info call a minute
+# The client already keeps each token inside Monobank's one-call-per-60s
+# limit (a token used within the last minute is skipped until next pass);
+# spacing users out keeps a pass from bursting across many users at once.
+_REFRESH_PAUSE = 1.0  # seconds between users
+
+
+def store_accounts(conn, user_id: int, rows: list[dict]) -> None:
+    """Replace `user_id`'s accounts with `rows` inside the caller's
+    transaction. An account that moved to another user (token reconnected
+    elsewhere) is re-pointed by the upsert."""
+    if rows:
+        now = datetime.now()
+        params = [{**row, "user_id": user_id, "updated_at": now} for row in rows]
+        insert = pg_insert if conn.dialect.name == "postgresql" else sqlite_insert
+        stmt = insert(_accounts)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["account_id"],
+            set_={col: stmt.excluded[col]
+                  for col in ("user_id", "iban", "currency", "is_jar", "updated_at")},
+        )
+        conn.execute(stmt, params)
+    stale = delete(_accounts).where(_accounts.c.user_id == user_id)
+    if rows:
+        stale = stale.where(_accounts.c.account_id.not_in([r["account_id"] for r in rows]))
+    conn.execute(stale)
+    # Import the history of any card account seen for the first time.
+    schedule_backfills(conn, user_id, [r["account_id"] for r in rows if not r["is_jar"]])
+
+
+async def _fetch_rows(encrypted_token: str) -> list[dict]:
+    info = await mono_request("/personal/client-info", decrypt_token(encrypted_token))
+    return account_rows(info)
+
+
+async def refresh_mono_accounts(unmapped_only: bool = False) -> int:
+    """Re-read client-info for every connected user, or with `unmapped_only`
+    just those with no accounts stored. Returns the number of users
+    refreshed; a user whose fetch fails keeps their previous rows."""
+    query = select(_users.c.id, _users.c.mono_token).where(_users.c.mono_token.isnot(None))
+    if unmapped_only:
+        query = query.where(~exists().where(_accounts.c.user_id == _users.c.id))
+    async with async_engine.connect() as conn:
+        connected = (await conn.execute(query.order_by(_users.c.id))).all()
+
+    refreshed = 0
+    for user_id, encrypted in connected:
+        try:
+            rows = await _fetch_rows(encrypted)
+        except (InvalidToken, RuntimeError, MonoError) as exc:
+            logger.warning("mono client-info fetch failed for user=%s: %r", user_id, exc)
+        else:
+            async with async_engine.begin() as conn:
+                await conn.run_sync(store_accounts, user_id, rows)
+            refreshed += 1
+        await asyncio.sleep(_REFRESH_PAUSE)
+    return refreshed
+
+
+async def mono_account_refresher(interval: float = REFRESH_INTERVAL) -> None:
+    """Run forever, refreshing everyone every `interval` seconds and users
+    without accounts every UNMAPPED_INTERVAL. Meant to be started as a task
+    next to the bot's polling loop."""
+    last_full = float("-inf")
+    while True:
+        full = time.monotonic() - last_full >= interval
+        try:
+            refreshed = await refresh_mono_accounts(unmapped_only=not full)
+            if full:
+                last_full = time.monotonic()
+            if refreshed:
+                logger.info("refreshed mono accounts for %d users; client %s",
+                            refreshed, get_mono_client().metrics.snapshot())
+        except Exception:
+            logger.exception("mono account refresh failed")
+        await asyncio.sleep(min(interval, UNMAPPED_INTERVAL))
@@ -0,0 +1,354 @@
+"""Importing Monobank statement history from before the user connected.
+
+Every card account gets a `mono_backfills` job when it first lands in
+`mono_accounts` (at setup, or on the worker's account refresh), covering
+the last MONO_BACKFILL_DAYS days. The worker's `mono_backfill_worker()`
+walks each job backwards through /personal/statement in windows of at most
+31 days, paging within a window when Monobank returns a full 500 items.
+Statement calls go through the shared client and wait their turn on its
+per-token limiter, so a backfill never trips Monobank's 60s limit.
+
+Each page is classified with the webhook's own rules (databases.mono_events)
+and written with one bulk INSERT: ids already imported are dropped with a
+single IN query per page, and ON CONFLICT DO NOTHING covers a webhook
+delivery racing the import. The job's cursor moves in the same transaction,
+so a restart resumes from the last committed page. Jobs are leased with a
+compare-and-set, so several workers can share the queue.
+
+A job that hits a rate limit, a 5xx or a network error just waits for its
+lease to run out. One that Monobank refuses outright (the token can't be
+decrypted, or a 4xx: revoked token, closed account) is retried only
+MAX_ATTEMPTS times in a row, then marked 'failed' until the account shows
+up again in client-info.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from os import getenv
+
+from cryptography.fernet import InvalidToken
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from databases.db import async_engine
+from databases.models import Expense, MonoAccount, MonoBackfill, User
+from databases.mono_events import is_refund, statement_expense
+from databases.rollups import apply_rollup_deltas, expense_deltas
+from databases.sync import stamp_rows
+from utils.categorizer import predict_many
+from utils.mono import MonoAPIError, MonoError, decrypt_token, mono_request
+
+logger = logging.getLogger(__name__)
+
+_jobs = MonoBackfill.__table__
+_expenses = Expense.__table__
+_accounts = MonoAccount.__table__
+_users = User.__table__
+
+BACKFILL_DAYS = int(getenv("MONO_BACKFILL_DAYS", "90"))
+WINDOW = 31 * 86400  # Monobank serves at most 31 days (+1h) per call...
+PAGE_SIZE = 500  # ...and at most 500 items; a full page means "ask again"
+CONCURRENCY = 4  # jobs (of distinct users) one worker runs at once
+LEASE = 600  # seconds a claimed job stays ours; renewed on every page
+POLL_INTERVAL = 60  # seconds between looks for new jobs when idle
+REFUND_WINDOW = 30 * 86400  # same reach as the webhook's amount fallback
+MAX_ATTEMPTS = 3  # permanent errors in a row before a job is 'failed'
+
+
+def _insert(conn):
+    return pg_insert if conn.dialect.name == "postgresql" else sqlite_insert
+
+
+def schedule_backfills(conn, user_id: int, account_ids: list[str],
+                       days: int = BACKFILL_DAYS, reset: bool = False) -> None:
+    """Create a job for each account that has none, and resume any that
+    failed. With `reset`, existing jobs start over from now instead."""
+    if not account_ids:
+        return
+    until = int(time.time())
+    params = [
+        {"user_id": user_id, "account_id": acc, "since": until - days * 86400,
+         "until": until, "cursor": until, "status": "running", "imported": 0,
+         "attempts": 0, "last_error": None, "lease_until": 0, "updated_at": datetime.now()}
+        for acc in account_ids
+    ]
+    stmt = _insert(conn)(_jobs)
+    if reset:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "account_id"],
+            set_={col: stmt.excluded[col]
+                  for col in ("since", "until", "cursor", "status", "imported",
+                              "attempts", "last_error", "updated_at")},
+        )
+    else:
+        # The account is listed again, so its token works: a failed job
+        # resumes from its cursor.
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "account_id"],
+            set_={col: stmt.excluded[col]
+                  for col in ("status", "attempts", "last_error", "updated_at")},
+            where=_jobs.c.status == "failed",
+        )
+    conn.execute(stmt, params)
+
+
+def forget_backfills(conn, user_id: int) -> None:
+    conn.execute(delete(_jobs).where(_jobs.c.user_id == user_id))
+
+
+class _Reversals:
+    """Refunds seen so far in a run. History is read newest first, so a
+    refund shows up before the charge it reverses; that charge is dropped
+    when it arrives — by the original tx id when Monobank gives one, else
+    by amount within 30 days before the refund, like the webhook. Lives for
+    one run only: a refund read before a restart can no longer cancel a
+    charge read after it."""
+
+    def __init__(self):
+        self._seen: set[str] = set()
+        self._tx_ids: set[str] = set()
+        self._amounts: list[tuple[int, int]] = []  # (abs amount, refund time)
+
+    def add(self, item: dict) -> None:
+        if str(item["id"]) in self._seen:
+            return  # re-read on a page boundary
+        self._seen.add(str(item["id"]))
+        original = item.get("originalTxId") or item.get("originalTxID") or item.get("counterTxId")
+        if original:
+            self._tx_ids.add(str(original))
+        else:
+            self._amounts.append((abs(item["amount"]), item.get("time") or 0))
+
+    def cancels(self, item: dict) -> bool:
+        if str(item["id"]) in self._tx_ids:
+            self._tx_ids.discard(str(item["id"]))
+            return True
+        t = item.get("time") or 0
+        for i, (amount, refunded_at) in enumerate(self._amounts):
+            if abs(item["amount"]) == amount and refunded_at - REFUND_WINDOW <= t <= refunded_at:
+                del self._amounts[i]
+                return True
+        return False
+
+
+def page_rows(items: list[dict], own_ibans: set[str], reversals: _Reversals) -> list[dict]:
+    """Expense rows (without user_id) for the spending in one statement page."""
+    rows = []
+    for item in items:
+        if item.get("amount") is None or item.get("id") is None:
+            continue
+        if item["amount"] > 0:
+            # Income is never tracked; refunds cancel an older charge.
+            if is_refund(item):
+                reversals.add(item)
+            continue
+        if reversals.cancels(item):
+            continue
+        fields = statement_expense(item, own_ibans)
+        if fields is not None:
+            rows.append(fields)
+    # As the webhook does: an MCC we don't map leaves it to the description.
+    unmapped = [row for row in rows if row["category"] == "other"]
+    for row, category in zip(unmapped, predict_many(row["description"] for row in unmapped)):
+        row["category"] = category
+    return rows
+
+
+def import_rows(conn, user_id: int, rows: list[dict]) -> int:
+    """Bulk-insert the rows whose mono_tx_id isn't stored yet. Returns how
+    many were inserted."""
+    by_tx = {row["mono_tx_id"]: row for row in rows}
+    if not by_tx:
+        return 0
+    existing = set(conn.execute(
+        select(_expenses.c.mono_tx_id).where(_expenses.c.mono_tx_id.in_(list(by_tx)))
+    ).scalars())
+    new = [{**row, "user_id": user_id} for tx, row in by_tx.items() if tx not in existing]
+    if not new:
+        return 0
+    stamp_rows(conn, new)
+    stmt = (
+        _insert(conn)(_expenses)
+        .on_conflict_do_nothing(index_elements=["mono_tx_id"])
+        .returning(_expenses.c.user_id, _expenses.c.amount, _expenses.c.currency,
+                   _expenses.c.category, _expenses.c.created_at)
+    )
+    inserted = conn.execute(stmt, new).all()
+    apply_rollup_deltas(conn, expense_deltas(inserted))
+    return len(inserted)
+
+
+def _save_page(conn, job, rows: list[dict], cursor: int) -> int:
+    """Import one page and move the job's cursor in the same transaction."""
+    imported = import_rows(conn, job.user_id, rows)
+    conn.execute(
+        update(_jobs)
+        .where(_jobs.c.user_id == job.user_id, _jobs.c.account_id == job.account_id)
+        .values(
+            cursor=cursor,
+            imported=_jobs.c.imported + imported,
+            status="done" if cursor <= job.since else "running",
+            attempts=0,
+            last_error=None,
+            lease_until=int(time.time()) + LEASE,
+            updated_at=datetime.now(),
+        )
+    )
+    return imported
+
+
+def claim_jobs(conn, limit: int = CONCURRENCY) -> list:
+    """Lease up to `limit` unfinished jobs, at most one per user (their
+    accounts share one statement rate limit anyway)."""
+    now = int(time.time())
+    candidates = conn.execute(
+        select(_jobs.c.user_id, _jobs.c.account_id, _jobs.c.since, _jobs.c.until,
+               _jobs.c.cursor, _jobs.c.lease_until, _users.c.mono_token)
+        .join(_users, _users.c.id == _jobs.c.user_id)
+        .where(_jobs.c.status == "running", _jobs.c.lease_until < now,
+               _users.c.mono_token.isnot(None))
+        .order_by(_jobs.c.updated_at)
+        .limit(limit * 4)
+    ).all()
+    claimed, users = [], set()
+    for job in candidates:
+        if job.user_id in users:
+            continue
+        # Compare-and-set: another worker that leased it first wins.
+        won = conn.execute(
+            update(_jobs)
+            .where(_jobs.c.user_id == job.user_id, _jobs.c.account_id == job.account_id,
+                   _jobs.c.lease_until == job.lease_until)
+            .values(lease_until=now + LEASE)
+        ).rowcount
+        if won:
+            claimed.append(job)
+            users.add(job.user_id)
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def _is_permanent(exc: Exception) -> bool:
+    """Whether retrying `exc` can't help: anything but a rate limit, a
+    Monobank 5xx or a network error."""
+    if isinstance(exc, MonoAPIError):
+        return exc.status != 429 and exc.status < 500
+    return not isinstance(exc, MonoError)
+
+
+def _record_failure(conn, job, exc: Exception) -> int:
+    """Count a permanent failure, marking the job 'failed' after
+    MAX_ATTEMPTS in a row. Returns the count."""
+    where = (_jobs.c.user_id == job.user_id, _jobs.c.account_id == job.account_id)
+    attempts = conn.execute(
+        update(_jobs).where(*where)
+        .values(attempts=_jobs.c.attempts + 1, last_error=repr(exc)[:500], updated_at=datetime.now())
+        .returning(_jobs.c.attempts)
+    ).scalar_one()
+    if attempts >= MAX_ATTEMPTS:
+        conn.execute(update(_jobs).where(*where).values(status="failed"))
+    return attempts
+
+
+async def _fail(job, cursor: int, exc: Exception) -> None:
+    if not _is_permanent(exc):
+        # Transient: the job is picked up again once its lease runs out.
+        logger.warning("mono backfill user=%s account=%s failed at %s: %r",
+                       job.user_id, job.account_id, cursor, exc)
+        return
+    async with async_engine.begin() as conn:
+        attempts = await conn.run_sync(_record_failure, job, exc)
+    if attempts >= MAX_ATTEMPTS:
+        logger.error("mono backfill user=%s account=%s failed after %d refusals: %r",
+                     job.user_id, job.account_id, attempts, exc)
+    else:
+        logger.warning("mono backfill user=%s account=%s refused at %s (attempt %d): %r",
+                       job.user_id, job.account_id, cursor, attempts, exc)
+
+
+async def run_job(job) -> int:
+    """Import a leased job page by page until it is done or Monobank
+    fails; see the module docstring for what happens to a failed job.
+    Returns the number of expenses imported."""
+    try:
+        token = decrypt_token(job.mono_token)
+    except (InvalidToken, RuntimeError) as exc:
+        await _fail(job, job.cursor, exc)
+        return 0
+    async with async_engine.connect() as conn:
+        own_ibans = set((await conn.execute(
+            select(_accounts.c.iban)
+            .where(_accounts.c.user_id == job.user_id, _accounts.c.iban.isnot(None))
+        )).scalars())
+
+    reversals = _Reversals()
+    cursor, total = job.cursor, 0
+    while cursor > job.since:
+        start = max(job.since, cursor - WINDOW)
+        try:
+            items = await mono_request(
+                f"/personal/statement/{job.account_id}/{start}/{cursor}", token, max_wait=None
+            )
+        except MonoError as exc:
+            await _fail(job, cursor, exc)
+            return total
+        if len(items) >= PAGE_SIZE:
+            # Newest first: continue below the oldest item we got. It is
+            # read again on the next page and dropped as already imported.
+            oldest = min(item["time"] for item in items)
+            next_cursor = oldest if oldest < cursor else cursor - 1
+        else:
+            next_cursor = start
+
+        rows = page_rows(items, own_ibans, reversals)
+        async with async_engine.begin() as conn:
+            total += await conn.run_sync(_save_page, job, rows, next_cursor)
+        cursor = next_cursor
+        done = (job.until - cursor) / max(1, job.until - job.since)
+        logger.info("mono backfill user=%s account=%s: %.0f%% (%d imported this run)",
+                    job.user_id, job.account_id, min(done, 1) * 100, total)
+    return total
+
+
+async def run_pending_backfills() -> int:
+    """Claim and run jobs until none are left. Returns expenses imported."""
+    total = 0
+    while True:
+        async with async_engine.begin() as conn:
+            jobs = await conn.run_sync(claim_jobs)
+        if not jobs:
+            return total
+        for result in await asyncio.gather(*(run_job(job) for job in jobs),
+                                           return_exceptions=True):
+            if isinstance(result, BaseException):
+                logger.error("mono backfill job failed", exc_info=result)
+            else:
+                total += result
+
+
+def backfill_progress(conn, user_id: int | None = None) -> list[dict]:
+    stmt = select(_jobs).order_by(_jobs.c.user_id, _jobs.c.account_id)
+    if user_id is not None:
+        stmt = stmt.where(_jobs.c.user_id == user_id)
+    return [
+        {**row._mapping,
+         "done": min(1.0, (row.until - row.cursor) / max(1, row.until - row.since))}
+        for row in conn.execute(stmt)
+    ]
+
+
+async def mono_backfill_worker(interval: float = POLL_INTERVAL) -> None:
+    """Run forever, importing whatever jobs are waiting every `interval`
+    seconds. Meant to be started as a task next to the bot's polling loop."""
+    while True:
+        try:
+            imported = await run_pending_backfills()
+            if imported:
+                logger.info("mono backfill imported %d expenses", imported)
+        except Exception:
+            logger.exception("mono backfill failed")
+        await asyncio.sleep(interval)
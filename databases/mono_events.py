@@ -0,0 +1,381 @@
+"""Durable queue between the Monobank webhook and the expenses table.
+
+The webhook validates a delivery, appends the raw payload to
+`mono_webhook_events` and answers 200 straight away. The worker's
+`mono_event_worker()` drains pending rows in id order, in batches, and
+applies each one — refund matching, own-transfer filtering, MCC
+categorisation (utils.categorizer guesses from the description when the
+MCC isn't mapped) — inside its own savepoint, so one bad event never
+blocks the rest of its batch. A failing event is retried with exponential backoff
+and marked 'dead' after MAX_ATTEMPTS; scripts/mono_events.py lists and
+replays dead events once the cause is fixed. A delivery for an account
+missing from mono_accounts is retried the same way, giving the account
+refresher (databases/mono_accounts.py) time to map it; one for an account
+whose user has since disconnected is marked done as 'disconnected'.
+
+Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED on Postgres, so
+several workers can drain at once. Applying an event is idempotent: the
+unique `mono_tx_id` makes a re-applied expense a 'duplicate'.
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from os import getenv
+
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from databases.db import async_engine, get_async_session
+from databases.models import Expense, MonoAccount, MonoWebhookEvent, User
+from utils.categorizer import predict as predict_category
+from utils.mono import (
+    MONO_CURRENCY,
+    MONO_MCC_CATEGORY,
+    MONO_OWN_TRANSFER_PHRASES,
+    MONO_REFUND_MARKERS,
+    MONO_TRANSFER_MCC,
+)
+
+logger = logging.getLogger(__name__)
+
+_events = MonoWebhookEvent.__table__
+
+POLL_INTERVAL = float(getenv("MONO_EVENTS_POLL_INTERVAL", "2"))  # seconds
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 8
+RETRY_BASE = 30  # seconds; doubles per attempt
+RETRY_MAX = 3600  # seconds
+# Applied events are kept this long for debugging, then pruned; dead ones
+# longer, so there is time to look at them and replay.
+RETENTION = timedelta(days=7)
+DEAD_RETENTION = timedelta(days=30)
+_PRUNE_EVERY = timedelta(hours=1)
+
+
+async def enqueue_event(body: dict) -> bool:
+    """Append a webhook delivery to the queue. Returns False for payloads
+    that can never become an expense, which are not stored."""
+    if body.get("type") != "StatementItem":
+        return False
+    item = (body.get("data") or {}).get("statementItem") or {}
+    if item.get("amount") is None or item.get("id") is None:
+        return False
+    async with async_engine.begin() as conn:
+        await conn.execute(insert(_events).values(payload=body, tx_id=str(item["id"])))
+    return True
+
+
+def resolve_mono_user(session: Session, account_id: str):
+    """Map a Monobank account id to the owning User with one primary-key
+    lookup in mono_accounts. Accounts land there at setup time and are kept
+    fresh by the worker (databases/mono_accounts.py)."""
+    return session.scalars(
+        select(User)
+        .join(MonoAccount, MonoAccount.user_id == User.id)
+        .where(MonoAccount.account_id == account_id, User.mono_token.isnot(None))
+    ).first()
+
+
+def _unresolved(session: Session, account_id: str | None) -> str:
+    """Why `resolve_mono_user` found no one: 'disconnected' when the
+    account is mapped to a user who has since removed their token (nothing
+    will ever apply it), 'no_user' when it isn't mapped yet."""
+    if account_id and session.scalar(
+        select(MonoAccount.user_id).where(MonoAccount.account_id == account_id)
+    ):
+        return "disconnected"
+    return "no_user"
+
+
+def user_own_ibans(session: Session, user) -> set[str]:
+    """The user's own account and jar IBANs (stored normalised), so
+    self-transfers can be skipped."""
+    return set(session.scalars(
+        select(MonoAccount.iban)
+        .where(MonoAccount.user_id == user.id, MonoAccount.iban.isnot(None))
+    ))
+
+
+def _apply_reversal(session: Session, data: dict, item: dict, tx_id) -> str:
+    # Refund: undo the original charge. Find the user first so we can scope
+    # the search to their expenses.
+    account_id = data.get("account")
+    user = resolve_mono_user(session, account_id) if account_id else None
+    if not user:
+        logger.info(
+            "mono webhook reversal: no matching expense found for tx=%s "
+            "(unknown account)", tx_id,
+        )
+        return _unresolved(session, account_id)
+
+    # Monobank sometimes references the original tx id explicitly.
+    original_tx = (
+        item.get("originalTxId")
+        or item.get("originalTxID")
+        or item.get("counterTxId")
+    )
+    target = None
+    if original_tx:
+        target = session.scalars(select(Expense).where(
+            and_(Expense.user_id == user.id,
+                 Expense.mono_tx_id == str(original_tx))
+        )).first()
+    if target is None:
+        # Fall back to matching by amount within the last 30 days.
+        refund_amount = abs(item["amount"]) / 100
+        cutoff = datetime.utcnow() - timedelta(days=30)
+        target = session.scalars(select(Expense).where(
+            and_(
+                Expense.user_id == user.id,
+                Expense.amount == refund_amount,
+                Expense.created_at >= cutoff,
+                Expense.mono_tx_id.isnot(None),
+            )
+        ).order_by(Expense.created_at.desc())).first()
+
+    if target is None:
+        logger.info(
+            "mono webhook reversal: no matching expense found for tx=%s",
+            tx_id,
+        )
+        return "reversal_no_match"
+
+    logger.info(
+        "mono webhook reversal: deleted expense id=%s tx=%s",
+        target.id, tx_id,
+    )
+    session.delete(target)
+    return "reversal"
+
+
+def is_refund(item: dict) -> bool:
+    """A positive amount is income unless Monobank marks it as a reversal
+    of an earlier charge."""
+    desc_l = (item.get("description") or "").strip().lower()
+    return any(m in desc_l for m in MONO_REFUND_MARKERS)
+
+
+def statement_expense(item: dict, own_ibans: set[str]) -> dict | None:
+    """Expense columns (all but user_id) for a spending statement item, or
+    None when it is a move between the user's own accounts. Shared by the
+    webhook queue and the statement backfill (databases/mono_backfill.py)."""
+    counter_iban = (item.get("counterIban") or "").strip().upper()
+    counter_edrpou = (item.get("counterEdrpou") or "").strip()
+    counter_name = (item.get("counterName") or "").strip()
+    mcc = item.get("mcc")
+    # Monobank's auto `description` (merchant name / self-transfer phrase /
+    # P2P recipient name) is distinct from `comment`, the note the user
+    # types when sending money. They serve different roles below.
+    mono_desc = (item.get("description") or "").strip()
+    comment = (item.get("comment") or "").strip()
+
+    # Monobank tags money transfers (not retail purchases) with MCC 4829.
+    # A non-empty counterEdrpou means the counterparty is a registered
+    # business, so it's a real payment, not a personal transfer.
+    is_transfer = mcc == MONO_TRANSFER_MCC and not counter_edrpou
+
+    # Skip the user's own movements between their own accounts/jars
+    # (not spending). Two shapes:
+    #   * IBAN transfer to one of the user's own IBANs.
+    #   * MCC 4829 with no counterName and a generic Monobank
+    #     self-transfer phrase as the description ("Переказ на
+    #     картку ...", "Між своїми", etc). A real P2P to another
+    #     person also has an empty counterName, but its description
+    #     is the recipient's name, not one of these phrases.
+    desc_lower = mono_desc.lower()
+    is_own_phrase = any(
+        desc_lower.startswith(p) for p in MONO_OWN_TRANSFER_PHRASES
+    )
+    own_transfer = (counter_iban and counter_iban in own_ibans) or (
+        is_transfer and not counter_name and is_own_phrase
+    )
+    if own_transfer:
+        return None
+
+    # Monobank sends two currency fields: `currencyCode` is the account's
+    # currency and `amount` is the charge in that currency; for foreign
+    # purchases `operationCurrencyCode` + `operationAmount` carry the
+    # original currency of the transaction. Prefer the operation currency
+    # when it differs so a USD purchase shows up as USD, not UAH.
+    currency_code = item.get("currencyCode")
+    op_currency_code = item.get("operationCurrencyCode")
+    op_amount = item.get("operationAmount")
+    if (op_currency_code and op_amount is not None
+            and op_currency_code != currency_code):
+        expense_amount = abs(op_amount) / 100
+        currency = MONO_CURRENCY.get(op_currency_code, "UAH")
+    else:
+        expense_amount = abs(item["amount"]) / 100
+        currency = MONO_CURRENCY.get(currency_code, "UAH")
+    # Monobank's `time` is a unix timestamp in UTC — keep it naive UTC.
+    created_at = datetime.utcfromtimestamp(item.get("time")) if item.get("time") else datetime.utcnow()
+    # The expense description is always the user-written `comment` when
+    # present. For a (non-skipped) MCC 4829 P2P transfer the recipient
+    # is counterName, or Monobank's auto description when that's empty,
+    # and is kept only in its dedicated column. For everything else the
+    # comment falls back to Monobank's merchant description.
+    if is_transfer:
+        category = "transfer"
+        counter_name = counter_name or mono_desc or None
+        description = comment
+    else:
+        category = MONO_MCC_CATEGORY.get(mcc, "other")
+        counter_name = counter_name or None
+        description = comment or mono_desc
+
+    return {
+        "amount": expense_amount,
+        "category": category,
+        "currency": currency,
+        "description": description,
+        "created_at": created_at,
+        "mono_tx_id": str(item["id"]),
+        "mono_counter_name": counter_name,
+    }
+
+
+def apply_statement(session: Session, body: dict) -> str:
+    """Turn one StatementItem delivery into an Expense (or delete the one a
+    refund reverses) without committing. Returns what happened."""
+    data = body.get("data") or {}
+    item = data.get("statementItem") or {}
+    amount = item.get("amount")
+    tx_id = item.get("id")
+    if body.get("type") != "StatementItem" or amount is None or tx_id is None:
+        return "ignored"
+
+    if amount > 0:
+        if not is_refund(item):
+            # Genuine income (salary, top-up, etc) — we only track spending.
+            return "skipped"
+        return _apply_reversal(session, data, item, tx_id)
+
+    if session.scalar(select(Expense.id).where(Expense.mono_tx_id == str(tx_id))):
+        return "duplicate"
+
+    account_id = data.get("account")
+    user = resolve_mono_user(session, account_id) if account_id else None
+    if not user:
+        return _unresolved(session, account_id)
+
+    own_ibans = user_own_ibans(session, user)
+    logger.info(
+        "mono webhook tx=%s user=%s mcc=%s counterIban=%r counterEdrpou=%r "
+        "counterName=%r description=%r comment=%r own_ibans=%r",
+        tx_id, user.id, item.get("mcc"), item.get("counterIban"), item.get("counterEdrpou"),
+        item.get("counterName"), item.get("description"), item.get("comment"), own_ibans,
+    )
+    fields = statement_expense(item, own_ibans)
+    if fields is None:
+        logger.info("mono webhook tx=%s skipped: own transfer", tx_id)
+        return "own_transfer"
+    if fields["category"] == "other":
+        fields["category"] = predict_category(fields["description"])
+    session.add(Expense(user_id=user.id, **fields))
+    return "ok"
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX))
+
+
+def drain_batch(session: Session, batch_size: int = BATCH_SIZE) -> int:
+    """Claim and apply up to `batch_size` due events, then commit. Returns
+    how many were claimed."""
+    now = datetime.now()
+    events = session.scalars(
+        select(MonoWebhookEvent)
+        .where(MonoWebhookEvent.status == "pending",
+               MonoWebhookEvent.next_attempt_at <= now)
+        .order_by(MonoWebhookEvent.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+    for event in events:
+        event.attempts += 1
+        try:
+            with session.begin_nested():
+                result = apply_statement(session, event.payload)
+                if result == "no_user":
+                    # An account not mapped yet (setup couldn't read
+                    # client-info, or a card newer than the last refresh),
+                    # so it's retried rather than dropped.
+                    raise LookupError("account not in mono_accounts")
+        except IntegrityError:
+            # A concurrent delivery of the same tx won the unique-index race.
+            result = "duplicate"
+        except Exception as exc:
+            event.last_error = repr(exc)[:500]
+            if event.attempts >= MAX_ATTEMPTS:
+                event.status = "dead"
+                event.processed_at = now
+                logger.error("mono event id=%s tx=%s dead after %d attempts: %r",
+                             event.id, event.tx_id, event.attempts, exc)
+            else:
+                event.next_attempt_at = now + _retry_delay(event.attempts)
+                logger.warning("mono event id=%s tx=%s failed (attempt %d): %r",
+                               event.id, event.tx_id, event.attempts, exc)
+            continue
+        event.status = "done"
+        event.result = result
+        event.processed_at = now
+        event.last_error = None
+    session.commit()
+    return len(events)
+
+
+def replay_events(conn, ids: list[int] | None = None) -> int:
+    """Put dead events (all of them, or just `ids`) back in the queue with a
+    fresh retry budget. Returns how many were requeued."""
+    stmt = (
+        update(_events)
+        .where(_events.c.status == "dead")
+        .values(status="pending", attempts=0, next_attempt_at=datetime.now(), processed_at=None)
+    )
+    if ids:
+        stmt = stmt.where(_events.c.id.in_(ids))
+    return conn.execute(stmt).rowcount
+
+
+def prune_events(
+    conn, older_than: timedelta = RETENTION, dead_older_than: timedelta = DEAD_RETENTION,
+) -> int:
+    """Delete applied events processed more than `older_than` ago and dead
+    ones given up on more than `dead_older_than` ago."""
+    now = datetime.now()
+    return conn.execute(
+        delete(_events).where(or_(
+            and_(_events.c.status == "done", _events.c.processed_at < now - older_than),
+            # Rows dead-lettered before processed_at was set go by arrival.
+            and_(_events.c.status == "dead",
+                 func.coalesce(_events.c.processed_at, _events.c.received_at) < now - dead_older_than),
+        ))
+    ).rowcount
+
+
+def queue_counts(conn) -> dict[str, int]:
+    rows = conn.execute(select(_events.c.status, func.count()).group_by(_events.c.status))
+    return {status: n for status, n in rows}
+
+
+async def mono_event_worker(interval: float = POLL_INTERVAL) -> None:
+    """Run forever: drain back-to-back while full batches keep coming, then
+    poll every `interval` seconds. Meant to be started as a task next to the
+    bot's polling loop."""
+    last_prune = datetime.min
+    while True:
+        claimed = 0
+        try:
+            async with get_async_session() as session:
+                claimed = await session.run_sync(drain_batch)
+            if datetime.now() - last_prune >= _PRUNE_EVERY:
+                async with async_engine.begin() as conn:
+                    await conn.run_sync(prune_events)
+                last_prune = datetime.now()
+        except Exception:
+            logger.exception("mono event drain failed")
+        if claimed < BATCH_SIZE:
+            await asyncio.sleep(interval)
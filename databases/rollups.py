@@ -0,0 +1,183 @@
+"""Incremental maintenance of `daily_expense_rollups`.
+
+A `before_flush` hook on every Session turns inserted, edited and deleted
+Expense rows into (user, day, currency, category) deltas and upserts them in
+the same transaction, so any ORM write path — webapp, webhook, bot handlers —
+keeps the rollup exact without calling anything. Core bulk inserts bypass
+the ORM and must call `apply_rollup_deltas(conn, expense_deltas(rows))`.
+Rebuild/check from the command line with scripts/rollups.py.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime
+
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from databases.models import DailyExpenseRollup, Expense
+
+RollupKey = tuple[int, date, str, str]
+
+_rollups = DailyExpenseRollup.__table__
+_TRACKED = ("user_id", "amount", "currency", "category", "created_at")
+
+
+def rollup_key(user_id: int, created_at: datetime, currency: str | None, category: str | None) -> RollupKey:
+    return (user_id, created_at.date(), currency or "EUR", category or "other")
+
+
+def _field(row, name: str):
+    return row.get(name) if isinstance(row, dict) else getattr(row, name)
+
+
+def expense_deltas(rows, sign: int = 1) -> dict[RollupKey, list]:
+    """Deltas for plain mappings (Core bulk inserts) or Expense objects."""
+    deltas: dict[RollupKey, list] = defaultdict(lambda: [0.0, 0])
+    for row in rows:
+        key = rollup_key(_field(row, "user_id"), _field(row, "created_at"),
+                         _field(row, "currency"), _field(row, "category"))
+        deltas[key][0] += sign * float(_field(row, "amount") or 0.0)
+        deltas[key][1] += sign
+    return deltas
+
+
+def apply_rollup_deltas(conn, deltas: dict[RollupKey, list]) -> None:
+    """Upsert `total += amount, count += n` for each key, then drop buckets
+    that no longer hold any expense."""
+    params = [
+        {"user_id": k[0], "day": k[1], "currency": k[2], "category": k[3],
+         "total": v[0], "count": v[1]}
+        for k, v in deltas.items() if v[1] or v[0]
+    ]
+    if not params:
+        return
+    insert = pg_insert if conn.dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(_rollups)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "day", "currency", "category"],
+        set_={
+            "total": _rollups.c.total + stmt.excluded.total,
+            "count": _rollups.c["count"] + stmt.excluded["count"],
+        },
+    )
+    conn.execute(stmt, params)
+    user_ids = {p["user_id"] for p in params}
+    conn.execute(delete(_rollups).where(
+        _rollups.c.user_id.in_(user_ids), _rollups.c["count"] <= 0,
+    ))
+
+
+def _committed(state, attr: str):
+    """The attribute's value as last loaded from the database."""
+    hist = state.attrs[attr].history
+    if hist.deleted:
+        return hist.deleted[0]
+    if hist.unchanged:
+        return hist.unchanged[0]
+    return getattr(state.obj(), attr)
+
+
+@event.listens_for(Session, "before_flush")
+def _track_expense_changes(session, flush_context, instances):
+    deltas: dict[RollupKey, list] = defaultdict(lambda: [0.0, 0])
+
+    def add(key, amount, n):
+        deltas[key][0] += amount
+        deltas[key][1] += n
+
+    for obj in session.new:
+        if isinstance(obj, Expense):
+            if obj.created_at is None:
+                # Fix the column default here so the rollup and the row agree.
+                obj.created_at = datetime.now()
+            add(rollup_key(obj.user_id, obj.created_at, obj.currency, obj.category),
+                float(obj.amount or 0.0), 1)
+
+    for obj in session.deleted:
+        if isinstance(obj, Expense):
+            state = inspect(obj)
+            old = {a: _committed(state, a) for a in _TRACKED}
+            add(rollup_key(old["user_id"], old["created_at"], old["currency"], old["category"]),
+                -float(old["amount"] or 0.0), -1)
+
+    for obj in session.dirty:
+        if not isinstance(obj, Expense) or obj in session.deleted:
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[a].history.has_changes() for a in _TRACKED):
+            continue
+        old = {a: _committed(state, a) for a in _TRACKED}
+        add(rollup_key(old["user_id"], old["created_at"], old["currency"], old["category"]),
+            -float(old["amount"] or 0.0), -1)
+        add(rollup_key(obj.user_id, obj.created_at, obj.currency, obj.category),
+            float(obj.amount or 0.0), 1)
+
+    if deltas:
+        apply_rollup_deltas(session.connection(), deltas)
+
+
+def rollup_total_query(user_id: int, currency: str, start: date, end: date):
+    """SELECT of a user's spending in one currency over the days [start, end].
+    Returned unexecuted so sync and async sessions can both run it."""
+    return select(func.coalesce(func.sum(_rollups.c.total), 0.0)).where(
+        _rollups.c.user_id == user_id,
+        _rollups.c.currency == currency,
+        _rollups.c.day >= start,
+        _rollups.c.day <= end,
+    )
+
+
+def _raw_buckets(user_id: int | None = None):
+    day_col = func.date(Expense.created_at)
+    cur_col = func.coalesce(Expense.currency, "EUR")
+    cat_col = func.coalesce(Expense.category, "other")
+    stmt = select(
+        Expense.user_id, day_col, cur_col, cat_col,
+        func.sum(Expense.amount), func.count(Expense.id),
+    ).group_by(Expense.user_id, day_col, cur_col, cat_col)
+    if user_id is not None:
+        stmt = stmt.where(Expense.user_id == user_id)
+    return stmt
+
+
+def rebuild_rollups(conn, user_id: int | None = None) -> None:
+    """Recompute the rollup from raw expenses (all users, or one)."""
+    wipe = delete(_rollups)
+    if user_id is not None:
+        wipe = wipe.where(_rollups.c.user_id == user_id)
+    conn.execute(wipe)
+    conn.execute(_rollups.insert().from_select(
+        ["user_id", "day", "currency", "category", "total", "count"],
+        _raw_buckets(user_id),
+    ))
+
+
+def _day(value) -> date:
+    return date.fromisoformat(value[:10]) if isinstance(value, str) else value
+
+
+def check_rollups(conn, user_id: int | None = None) -> list[tuple]:
+    """Compare the rollup with raw rows. Returns (key, expected, actual)
+    for every bucket whose sum or count disagrees."""
+    expected = {
+        (uid, _day(day), cur, cat): (float(total or 0.0), int(n))
+        for uid, day, cur, cat, total, n in conn.execute(_raw_buckets(user_id))
+    }
+    stmt = select(_rollups.c.user_id, _rollups.c.day, _rollups.c.currency,
+                  _rollups.c.category, _rollups.c.total, _rollups.c["count"])
+    if user_id is not None:
+        stmt = stmt.where(_rollups.c.user_id == user_id)
+    actual = {
+        (uid, day, cur, cat): (float(total or 0.0), int(n))
+        for uid, day, cur, cat, total, n in conn.execute(stmt)
+    }
+    mismatches = []
+    for key in expected.keys() | actual.keys():
+        exp = expected.get(key, (0.0, 0))
+        act = actual.get(key, (0.0, 0))
+        if exp[1] != act[1] or abs(exp[0] - act[0]) > 0.005:
+            mismatches.append((key, exp, act))
+    return sorted(mismatches)
+
@@ -0,0 +1,174 @@
+"""Charging due subscriptions in the background.
+
+A sweep walks every active subscription whose `next_due_date` has arrived,
+in batches ordered by id. Each batch claims its rows, writes one Expense per
+missed period with a single bulk INSERT, advances the due dates and updates
+the daily rollup — all in one transaction. Rows are claimed (after the
+owners' sync versions, see `charge_due_batch()`) with
+SELECT ... FOR UPDATE SKIP LOCKED on Postgres plus a compare-and-set on
+`next_due_date`, so several workers (or a worker and the webapp) can sweep
+at the same time without charging a period twice.
+
+The bot worker runs `subscription_sweeper()`; the webapp charges a single
+user's subscriptions only when they create or edit one.
+"""
+
+import asyncio
+import logging
+from datetime import date, datetime, time, timedelta
+from os import getenv
+
+from sqlalchemy import insert, select, update
+
+from databases.db import async_engine
+from databases.models import Expense, Subscription
+from databases.rollups import apply_rollup_deltas, expense_deltas
+from databases.sync import bump_versions
+
+logger = logging.getLogger(__name__)
+
+_subs = Subscription.__table__
+_expenses = Expense.__table__
+
+SWEEP_INTERVAL = float(getenv("SUBSCRIPTION_SWEEP_INTERVAL", "300"))  # seconds
+SWEEP_BATCH_SIZE = 500
+# Catch-up cap per subscription per sweep, as a runaway guard. Anything
+# still overdue is picked up by the next sweep.
+MAX_CATCH_UP = 24
+
+
+def advance_due_date(d: date, period: str) -> date:
+    """Step a recurring charge's due date forward by one period. Weekly is
+    a flat 7 days. Monthly tries the same day-of-month; when the next month
+    is shorter (e.g. Jan 31 → Feb), it clamps to that month's last day."""
+    if period == "weekly":
+        return d + timedelta(days=7)
+    # monthly
+    month = d.month + 1
+    year = d.year
+    if month > 12:
+        month = 1
+        year += 1
+    # Find last valid day of target month.
+    if month == 12:
+        next_first = date(year + 1, 1, 1)
+    else:
+        next_first = date(year, month + 1, 1)
+    last_day = (next_first - timedelta(days=1)).day
+    return date(year, month, min(d.day, last_day))
+
+
+def _charges(sub, today: date) -> tuple[list[dict], date]:
+    """Expense rows for every period of `sub` due by `today`, and the due
+    date that follows them."""
+    rows = []
+    due = sub.next_due_date
+    while due <= today and len(rows) < MAX_CATCH_UP:
+        rows.append({
+            "user_id": sub.user_id,
+            "amount": float(sub.amount),
+            "category": (sub.category or "other").lower(),
+            "currency": sub.currency or "EUR",
+            "description": sub.name,
+            "created_at": datetime.combine(due, time(12, 0)),
+        })
+        due = advance_due_date(due, sub.period)
+    return rows, due
+
+
+def charge_due_batch(
+    conn,
+    today: date,
+    after_id: int = 0,
+    user_id: int | None = None,
+    batch_size: int = SWEEP_BATCH_SIZE,
+) -> tuple[int, int | None]:
+    """Charge one batch of due subscriptions with id > after_id inside the
+    caller's transaction. Returns (expenses created, last id seen); the id
+    is None once nothing is left.
+
+    The batch is found without locking, then the owners' sync versions are
+    bumped, and only then are the subscription rows locked. The ORM's
+    before_flush hook takes the same two locks in that order when the webapp
+    edits a subscription, so the two can't deadlock on Postgres."""
+    due = (
+        _subs.c.active == True,  # noqa: E712
+        _subs.c.next_due_date <= today,
+    )
+    stmt = (
+        select(_subs.c.id, _subs.c.user_id)
+        .where(*due, _subs.c.id > after_id)
+        .order_by(_subs.c.id)
+        .limit(batch_size)
+    )
+    if user_id is not None:
+        stmt = stmt.where(_subs.c.user_id == user_id)
+    found = conn.execute(stmt).all()
+    if not found:
+        return 0, None
+
+    versions = bump_versions(conn, (row.user_id for row in found))
+    subs = conn.execute(
+        select(_subs.c.id, _subs.c.user_id, _subs.c.name, _subs.c.amount,
+               _subs.c.currency, _subs.c.category, _subs.c.period,
+               _subs.c.next_due_date)
+        .where(*due, _subs.c.id.in_([row.id for row in found]))
+        .order_by(_subs.c.id)
+        .with_for_update(skip_locked=True)
+    ).all()
+    now = datetime.now()
+    expenses: list[dict] = []
+    for sub in subs:
+        rows, next_due = _charges(sub, today)
+        # Compare-and-set: if another sweeper already advanced this row
+        # (SQLite has no SKIP LOCKED), nothing matches and we skip it.
+        claimed = conn.execute(
+            update(_subs)
+            .where(_subs.c.id == sub.id, _subs.c.next_due_date == sub.next_due_date)
+            .values(next_due_date=next_due, version=versions[sub.user_id], updated_at=now)
+        ).rowcount
+        if claimed:
+            for row in rows:
+                row.update(version=versions[sub.user_id], updated_at=now)
+            expenses.extend(rows)
+
+    if expenses:
+        conn.execute(insert(_expenses), expenses)
+        apply_rollup_deltas(conn, expense_deltas(expenses))
+    return len(expenses), found[-1].id
+
+
+def charge_due_subscriptions(conn, user_id: int | None = None, today: date | None = None) -> int:
+    """Charge everything due (optionally for one user) inside the caller's
+    transaction. Returns the number of expenses created."""
+    today = today or datetime.now().date()
+    total, after_id = 0, 0
+    while after_id is not None:
+        created, after_id = charge_due_batch(conn, today, after_id, user_id)
+        total += created
+    return total
+
+
+async def sweep_due_subscriptions(today: date | None = None) -> int:
+    """One sweep across all users, committing after every batch so a long
+    sweep never holds locks on more than one batch."""
+    today = today or datetime.now().date()
+    total, after_id = 0, 0
+    while after_id is not None:
+        async with async_engine.begin() as conn:
+            created, after_id = await conn.run_sync(charge_due_batch, today, after_id)
+        total += created
+    return total
+
+
+async def subscription_sweeper(interval: float = SWEEP_INTERVAL) -> None:
+    """Run forever, sweeping every `interval` seconds. Meant to be started
+    as a task next to the bot's polling loop."""
+    while True:
+        try:
+            created = await sweep_due_subscriptions()
+            if created:
+                logger.info("subscription sweep created %d expenses", created)
+        except Exception:
+            logger.exception("subscription sweep failed")
+        await asyncio.sleep(interval)
@@ -0,0 +1,119 @@
+"""Change versions for the Mini App's delta sync (GET /api/sync).
+
+Every user has a counter in `sync_versions`. A transaction that writes any
+of the user's expenses or subscriptions bumps it once and stamps the new
+value, plus `updated_at`, on each row it inserts or changes; a delete
+leaves a `sync_tombstones` row with the same version. A client that last
+synced at version N asks for everything with version > N and is handed the
+current version to ask from next time.
+
+The bump is an upsert that row-locks the user's counter until commit, so a
+user's writers go one at a time and versions become visible in order: a
+sync can never see version N+1 and later pick up an N that committed
+after it.
+
+A `before_flush` hook does this for every ORM write. Core statements that
+bypass the ORM (the subscription sweeper, the Monobank backfill) call
+`bump_versions()` and `stamp_rows()` themselves.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, delete, event, func, inspect, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from databases.models import Expense, Subscription, SyncTombstone, SyncVersion
+
+_versions = SyncVersion.__table__
+_tombstones = SyncTombstone.__table__
+
+_KINDS = {Expense: "expense", Subscription: "subscription"}
+# Deletions are remembered this long; see `prune_tombstones()`.
+TOMBSTONE_TTL = timedelta(days=90)
+
+
+def _insert(conn):
+    return pg_insert if conn.dialect.name == "postgresql" else sqlite_insert
+
+
+def bump_versions(conn, user_ids) -> dict[int, int]:
+    """Take the next change version of each user. Users are locked in id
+    order so two transactions over the same users can't deadlock."""
+    versions = {}
+    for user_id in sorted(set(user_ids)):
+        stmt = _insert(conn)(_versions).values(user_id=user_id, version=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id"], set_={"version": _versions.c.version + 1},
+        ).returning(_versions.c.version)
+        versions[user_id] = conn.execute(stmt).scalar_one()
+    return versions
+
+
+def stamp_rows(conn, rows: list[dict]) -> list[dict]:
+    """Set `version` and `updated_at` on rows about to be bulk-inserted."""
+    versions = bump_versions(conn, (row["user_id"] for row in rows))
+    now = datetime.now()
+    for row in rows:
+        row["version"] = versions[row["user_id"]]
+        row["updated_at"] = now
+    return rows
+
+
+def sync_state_query(user_id: int):
+    """SELECT of a user's (version, pruned_version), unexecuted."""
+    return select(_versions.c.version, _versions.c.pruned_version).where(_versions.c.user_id == user_id)
+
+
+def prune_tombstones(conn, ttl: timedelta = TOMBSTONE_TTL) -> int:
+    """Delete tombstones older than `ttl`, first recording per user the
+    newest version dropped: a client that last synced below it may still
+    hold a deleted row and must reload everything."""
+    cutoff = datetime.now() - ttl
+    stale = _tombstones.c.deleted_at < cutoff
+    floors = conn.execute(
+        select(_tombstones.c.user_id, func.max(_tombstones.c.version))
+        .where(stale).group_by(_tombstones.c.user_id)
+    ).all()
+    if not floors:
+        return 0
+    conn.execute(
+        update(_versions)
+        .where(_versions.c.user_id == bindparam("uid"))
+        .values(pruned_version=bindparam("upto")),
+        [{"uid": user_id, "upto": upto} for user_id, upto in floors],
+    )
+    return conn.execute(delete(_tombstones).where(stale)).rowcount
+
+
+def _user_id(obj):
+    """The owner as last loaded, for rows being deleted."""
+    hist = inspect(obj).attrs.user_id.history
+    return (hist.deleted or hist.unchanged or [obj.user_id])[0]
+
+
+@event.listens_for(Session, "before_flush")
+def _stamp_changes(session, flush_context, instances):
+    new = [obj for obj in session.new if type(obj) in _KINDS]
+    dirty = [obj for obj in session.dirty
+             if type(obj) in _KINDS and obj not in session.deleted
+             and session.is_modified(obj, include_collections=False)]
+    deleted = [obj for obj in session.deleted if type(obj) in _KINDS]
+    if not (new or dirty or deleted):
+        return
+
+    conn = session.connection()
+    owners = [obj.user_id for obj in new + dirty] + [_user_id(obj) for obj in deleted]
+    versions = bump_versions(conn, owners)
+    now = datetime.now()
+    for obj in new + dirty:
+        obj.version = versions[obj.user_id]
+        obj.updated_at = now
+    tombstones = [
+        {"user_id": _user_id(obj), "kind": _KINDS[type(obj)], "object_id": obj.id,
+         "version": versions[_user_id(obj)], "deleted_at": now}
+        for obj in deleted
+    ]
+    if tombstones:
+        conn.execute(_tombstones.insert(), tombstones)
@@ -4,23 +4,27 @@ let _token = null
 
 export const setToken = (t) => { _token = t }
 
-const request = async (method, path, body = undefined) => {
-  const headers = { 'Content-Type': 'application/json' }
+const send = async (method, path, body = undefined) => {
+  // FormData (file uploads) sets its own multipart Content-Type.
+  const form = body instanceof FormData
+  const headers = form ? {} : { 'Content-Type': 'application/json' }
   if (_token) headers['Authorization'] = `Bearer ${_token}`
 
   const res = await fetch(path, {
     method,
     headers,
-    body: body !== undefined ? JSON.stringify(body) : undefined,
+    body: form || body === undefined ? body : JSON.stringify(body),
   })
 
   if (!res.ok) {
     const err = await res.text()
     throw new Error(err || `HTTP ${res.status}`)
   }
-  return res.json()
+  return res
 }
 
+const request = async (method, path, body = undefined) => (await send(method, path, body)).json()
+
 export const authUser  = (initData) => request('POST', '/api/auth', { initData })
 
 const rangeQS = (range) => {
@@ -29,7 +33,23 @@ const rangeQS = (range) => {
 }
 
 export const getExpenses    = (period = 'week', range)    => request('GET', `/api/expenses?period=${period}${rangeQS(range)}`)
+// One page, newest first. `next` is the cursor for the following page, or
+// null on the last one.
+export const getExpensesPage = async (period = 'week', range, cursor = null, limit = 100) => {
+  const qs = `period=${period}${rangeQS(range)}&limit=${limit}${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''}`
+  const res = await send('GET', `/api/expenses?${qs}`)
+  return { items: await res.json(), next: res.headers.get('X-Next-Cursor') }
+}
+// Changes since a version from an earlier sync (0: everything). Apply
+// `deleted` first, then upsert `expenses`/`subscriptions`; with `reset`,
+// replace the local copy. Keep `version` for the next call.
+export const sync = (since = 0) => request('GET', `/api/sync?since=${since}`)
 export const createExpense  = (data)               => request('POST', '/api/expenses', data)
+// Flushes expenses queued offline: each item is a createExpense body plus
+// a client-generated `idempotency_key` (e.g. crypto.randomUUID()), so the
+// same batch can be resent after a lost response. Resolves to
+// { results: [{ idempotency_key, status: 'created'|'duplicate'|'error', expense?, error? }] }.
+export const createExpenses = (items) => request('POST', '/api/expenses/batch', items)
 export const updateExpense  = (id, data)           => request('PUT', `/api/expenses/${id}`, data)
 export const deleteExpense  = (id)                 => request('DELETE', `/api/expenses/${id}`)
 
@@ -37,22 +57,31 @@ export const getStats        = (period = 'week', currency, range) =>
   request('GET', `/api/stats?period=${period}${currency ? `&currency=${encodeURIComponent(currency)}` : ''}${rangeQS(range)}`)
 export const getAlltimeStats = ()                => request('GET', '/api/stats/alltime')
 
-export const exportCSV = async () => {
+// format: 'csv' or 'parquet'.
+export const exportCSV = async (format = 'csv') => {
   const headers = {}
   if (_token) headers['Authorization'] = `Bearer ${_token}`
-  const res = await fetch('/api/expenses/export', { headers })
+  const res = await fetch(`/api/expenses/export?format=${format}`, { headers })
   if (!res.ok) throw new Error(`HTTP ${res.status}`)
   const blob = await res.blob()
   const url  = URL.createObjectURL(blob)
   const a    = document.createElement('a')
   a.href     = url
-  a.download = 'moneylytics_export.csv'
+  a.download = `moneylytics_export.${format}`
   document.body.appendChild(a)
   a.click()
   document.body.removeChild(a)
   URL.revokeObjectURL(url)
 }
 
+// Loads an export back: the Mini App's or the bot's CSV, or Parquet.
+// Returns { imported, skipped, error_count, errors }.
+export const importExpenses = (file) => {
+  const form = new FormData()
+  form.append('file', file)
+  return request('POST', '/api/expenses/import', form)
+}
+
 export const getUser    = ()     => request('GET', '/api/user')
 export const updateUser = (data) => request('PUT', '/api/user', data)
 
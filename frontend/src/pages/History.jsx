@@ -1,6 +1,6 @@
 import { useState, useEffect, useCallback, useRef } from 'react'
 import { Plus, X } from 'lucide-react'
-import { getExpenses, deleteExpense, updateExpense } from '../api.js'
+import { getExpensesPage, deleteExpense, updateExpense } from '../api.js'
 import AddExpenseModal from '../components/AddExpenseModal.jsx'
 import BottomSheet from '../components/BottomSheet.jsx'
 import ExpenseDetailModal from '../components/ExpenseDetailModal.jsx'
@@ -199,6 +199,8 @@ function ExpenseEditModal({ expense, language, onClose, onSaved }) {
 export default function History({ user }) {
   const [period,      setPeriod]      = useState('week')
   const [expenses,    setExpenses]    = useState([])
+  const [nextCursor,  setNextCursor]  = useState(null)
+  const [loadingMore, setLoadingMore] = useState(false)
   const [loading,     setLoading]     = useState(true)
   const [showModal,   setShowModal]   = useState(false)
   const [deletingId,  setDeletingId]  = useState(null)
@@ -215,16 +217,51 @@ export default function History({ user }) {
   const locale = localeFor(lang)
   const t = useTranslation(lang)
 
+  // Bumped on every reload, so a page requested for the old period can't
+  // land in the new list.
+  const generation = useRef(0)
+
   const load = useCallback(() => {
+    generation.current += 1
     setLoading(true)
-    getExpenses(period)
-      .then(setExpenses)
+    setNextCursor(null)
+    getExpensesPage(period)
+      .then(({ items, next }) => { setExpenses(items); setNextCursor(next) })
       .catch(console.error)
       .finally(() => setLoading(false))
   }, [period])
 
   useEffect(() => { load() }, [load])
 
+  // Further pages load as the sentinel below the list scrolls into view.
+  const loadMore = useCallback(() => {
+    if (!nextCursor || loadingMore) return
+    setLoadingMore(true)
+    const gen = generation.current
+    getExpensesPage(period, undefined, nextCursor)
+      .then(({ items, next }) => {
+        if (gen !== generation.current) return
+        setExpenses((prev) => {
+          const have = new Set(prev.map((e) => e.id))
+          return [...prev, ...items.filter((e) => !have.has(e.id))]
+        })
+        setNextCursor(next)
+      })
+      .catch(console.error)
+      .finally(() => setLoadingMore(false))
+  }, [period, nextCursor, loadingMore])
+
+  const sentinel = useRef(null)
+  useEffect(() => {
+    const el = sentinel.current
+    if (!el || !nextCursor) return
+    const observer = new IntersectionObserver((entries) => {
+      if (entries[0].isIntersecting) loadMore()
+    }, { rootMargin: '400px' })
+    observer.observe(el)
+    return () => observer.disconnect()
+  }, [loadMore, nextCursor])
+
   // Optimistic delete with a 5-second undo window. We remove the row from
   // local state right away so the UI feels instant, then either fire the
   // real DELETE on timeout or restore the row if the user taps Undo. The
@@ -311,7 +348,8 @@ export default function History({ user }) {
         <h1 className="page-title">{t('page.history')}</h1>
         {!loading && expenses.length > 0 && (
           <p className="page-subtitle">
-            {expenses.length} {t('history.transactions')} · {totalsStr}
+            {/* Totals only once every page is in; until then they'd undercount. */}
+            {expenses.length}{nextCursor ? '+' : ''} {t('history.transactions')}{nextCursor ? '' : ` · ${totalsStr}`}
           </p>
         )}
       </div>
@@ -425,6 +463,12 @@ export default function History({ user }) {
         ))
       )}
 
+      {!loading && nextCursor && (
+        <div ref={sentinel}>
+          {loadingMore && <ListSkeleton rows={2} />}
+        </div>
+      )}
+
       <button
         className={`fab${fabCollapsed ? ' collapsed' : ''}`}
         onClick={() => { impact('light'); setShowModal(true) }}
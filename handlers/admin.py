@@ -1,45 +1,51 @@
+import asyncio
+import logging
+import time
+
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
 from os import getenv
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import case, func, select, update
+
+from databases import get_async_session, User, FeedbackReport
+from databases.models import DailyExpenseRollup
+from handlers.broadcast import create_broadcast, deliver, start_broadcast, stop_broadcast
+from handlers.reports import chart_cache
+from utils.translations import t
 
-from databases import get_session, User, FeedbackReport
-from databases.models import Expense
-from utils.translations import t, get_user_language
+logger = logging.getLogger(__name__)
 
 router = Router()
 ADMIN_ID = int(getenv("ADMIN_ID", "0"))
 PAGE_SIZE = 5
+STATS_TTL = float(getenv("ADMIN_STATS_TTL", "60"))  # seconds a stats snapshot is served as fresh
+STATS_WAIT = 2.0  # seconds a Refresh tap waits for the recompute before showing the old one
 
 
 def is_admin(user_id: int) -> bool:
     return user_id == ADMIN_ID
 
 
-def get_admin_lang() -> str:
-    with get_session() as session:
-        admin = session.query(User).filter(User.id == ADMIN_ID).first()
-        return get_user_language(admin, "en")
-
-
 class BroadcastStates(StatesGroup):
     waiting_for_text = State()
 
 
 @router.message(Command("admin"))
-async def admin_menu(message: Message):
+async def admin_menu(message: Message, lang: str):
     if not is_admin(message.from_user.id):
         return
+    if _stats_stale():
+        # Usually the next tap is Stats: have the snapshot ready by then.
+        _refresh_stats_in_background()
 
-    lang = get_admin_lang()
-
-    with get_session() as session:
-        unread = session.query(FeedbackReport).filter(FeedbackReport.is_read == False).count()
+    async with get_async_session() as session:
+        unread = await session.scalar(
+            select(func.count(FeedbackReport.id)).where(FeedbackReport.is_read == False)  # noqa: E712
+        )
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(
@@ -59,8 +65,10 @@ async def admin_menu(message: Message):
 
 
 async def render_admin_menu(callback: CallbackQuery, lang: str):
-    with get_session() as session:
-        unread = session.query(FeedbackReport).filter(FeedbackReport.is_read == False).count()
+    async with get_async_session() as session:
+        unread = await session.scalar(
+            select(func.count(FeedbackReport.id)).where(FeedbackReport.is_read == False)  # noqa: E712
+        )
 
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(
@@ -80,25 +88,23 @@ async def render_admin_menu(callback: CallbackQuery, lang: str):
 
 
 @router.callback_query(F.data.startswith("admin:feedbacks:"))
-async def show_feedbacks(callback: CallbackQuery):
+async def show_feedbacks(callback: CallbackQuery, lang: str):
     if not is_admin(callback.from_user.id):
         return
 
-    lang = get_admin_lang()
     page = int(callback.data.split(":")[2])
     offset = page * PAGE_SIZE
 
-    with get_session() as session:
-        total = session.query(FeedbackReport).count()
-        reports = (
-            session.query(FeedbackReport)
+    async with get_async_session() as session:
+        total = await session.scalar(select(func.count(FeedbackReport.id)))
+        reports = (await session.scalars(
+            select(FeedbackReport)
             .order_by(FeedbackReport.created_at.desc())
             .offset(offset)
             .limit(PAGE_SIZE)
-            .all()
-        )
+        )).all()
         user_ids = [r.user_id for r in reports]
-        users = {u.id: u for u in session.query(User).filter(User.id.in_(user_ids)).all()}
+        users = {u.id: u for u in await session.scalars(select(User).where(User.id.in_(user_ids)))}
 
     if not reports:
         await callback.answer(t(lang, "admin.no_reports"))
@@ -130,113 +136,128 @@ async def show_feedbacks(callback: CallbackQuery):
 
 
 @router.message(F.text.regexp(r"^/fb_\d+$"))
-async def show_single_feedback(message: Message):
+async def show_single_feedback(message: Message, lang: str):
     if not is_admin(message.from_user.id):
         return
 
-    lang = get_admin_lang()
     report_id = int(message.text.split("_")[1])
 
-    with get_session() as session:
-        report = session.query(FeedbackReport).filter(FeedbackReport.id == report_id).first()
+    async with get_async_session() as session:
+        report = await session.get(FeedbackReport, report_id)
         if not report:
             await message.answer(t(lang, "admin.report_not_found"))
             return
 
-        user = session.query(User).filter(User.id == report.user_id).first()
+        user = await session.get(User, report.user_id)
         name = f"@{user.username}" if user and user.username else (user.first_name if user else str(report.user_id))
         report.is_read = True
-        session.commit()
+        await session.commit()
 
     date = report.created_at.strftime("%d.%m.%Y %H:%M")
     await message.answer(t(lang, "admin.report_title", id=report.id, name=name, date=date, text=report.text))
 
 
 @router.callback_query(F.data == "admin:read_all")
-async def mark_all_read(callback: CallbackQuery):
+async def mark_all_read(callback: CallbackQuery, lang: str):
     if not is_admin(callback.from_user.id):
         return
 
-    lang = get_admin_lang()
-
-    with get_session() as session:
-        session.query(FeedbackReport).filter(FeedbackReport.is_read == False).update({"is_read": True})
-        session.commit()
+    async with get_async_session() as session:
+        await session.execute(
+            update(FeedbackReport).where(FeedbackReport.is_read == False).values(is_read=True)  # noqa: E712
+        )
+        await session.commit()
 
     await callback.answer(t(lang, "admin.read_all_done"))
     await render_admin_menu(callback, lang)
 
 
 @router.callback_query(F.data == "admin:menu")
-async def back_to_menu(callback: CallbackQuery):
+async def back_to_menu(callback: CallbackQuery, lang: str):
     if not is_admin(callback.from_user.id):
         return
-    lang = get_admin_lang()
     await render_admin_menu(callback, lang)
 
 
-def _collect_stats():
-    """Single DB pass for the admin pulse panel. Mirrors the Dataclip query
-    so the in-Telegram view stays consistent with the dashboard one."""
+async def _collect_stats():
+    """The admin pulse panel in three queries: one pass over users with
+    conditional counts per language, one over the daily rollup for
+    activity and volume (never the raw expenses table), and the top five
+    users by expense count. Mirrors the Dataclip query so the in-Telegram
+    view stays consistent with the dashboard one."""
     now = datetime.now()
     day_ago = now - timedelta(days=1)
     week_ago = now - timedelta(days=7)
     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
     week_start = today_start - timedelta(days=7)
 
-    with get_session() as s:
-        # "Reachable" base — excludes users who blocked the bot. Stats below
-        # use this so activation/DAU percentages reflect the real audience.
-        reachable = s.query(User).filter(User.is_blocked == False)  # noqa: E712
-        total_users = reachable.with_entities(func.count(User.id)).scalar() or 0
-        new_7d = reachable.with_entities(func.count(User.id)).filter(User.created_at > week_ago).scalar() or 0
-        new_24h = reachable.with_entities(func.count(User.id)).filter(User.created_at > day_ago).scalar() or 0
-        with_mono = reachable.with_entities(func.count(User.id)).filter(User.mono_token.isnot(None)).scalar() or 0
-        blocked = s.query(func.count(User.id)).filter(User.is_blocked == True).scalar() or 0  # noqa: E712
-        total_expenses = s.query(func.count(Expense.id)).scalar() or 0
-        dau = s.query(func.count(func.distinct(Expense.user_id))).filter(
-            Expense.created_at >= today_start
-        ).scalar() or 0
-        wau = s.query(func.count(func.distinct(Expense.user_id))).filter(
-            Expense.created_at >= week_start
-        ).scalar() or 0
-
-        # Language breakdown — drives the broadcast audience selector and
-        # tells us where engagement actually lives. Reachable only.
-        lang_rows = (
-            s.query(User.language, func.count(User.id))
-            .filter(User.is_blocked == False)  # noqa: E712
-            .group_by(User.language)
-            .all()
-        )
-        by_lang = {(row[0] or "en"): int(row[1]) for row in lang_rows}
+    def count_if(cond):
+        return func.sum(case((cond, 1), else_=0))
+
+    # "Reachable" excludes users who blocked the bot, so activation/DAU
+    # percentages reflect the real audience.
+    reachable = User.is_blocked == False  # noqa: E712
+    async with get_async_session() as s:
+        # Per language: drives the broadcast audience selector and tells us
+        # where engagement actually lives; the totals are its sums.
+        user_rows = (await s.execute(
+            select(
+                User.language,
+                count_if(reachable),
+                count_if(reachable & (User.created_at > week_ago)),
+                count_if(reachable & (User.created_at > day_ago)),
+                count_if(reachable & User.mono_token.isnot(None)),
+                count_if(User.is_blocked == True),  # noqa: E712
+            ).group_by(User.language)
+        )).all()
+
+        # DAU/WAU, activation and volume from the daily rollup — a handful
+        # of rows per active user instead of every expense.
+        dau, wau, active_users, total_expenses = (await s.execute(
+            select(
+                func.count(func.distinct(case(
+                    (DailyExpenseRollup.day >= today_start.date(), DailyExpenseRollup.user_id)))),
+                func.count(func.distinct(case(
+                    (DailyExpenseRollup.day >= week_start.date(), DailyExpenseRollup.user_id)))),
+                func.count(func.distinct(DailyExpenseRollup.user_id)),
+                func.coalesce(func.sum(DailyExpenseRollup.count), 0),
+            )
+        )).one()
 
         # Top spenders by expense count — these are the people whose churn
         # would hurt the most.
-        top_rows = (
-            s.query(User, func.count(Expense.id).label("cnt"))
-            .outerjoin(Expense, Expense.user_id == User.id)
-            .group_by(User.id)
-            .order_by(func.count(Expense.id).desc())
+        per_user = (
+            select(DailyExpenseRollup.user_id, func.sum(DailyExpenseRollup.count).label("cnt"))
+            .group_by(DailyExpenseRollup.user_id)
+            .order_by(func.sum(DailyExpenseRollup.count).desc())
             .limit(5)
-            .all()
+            .subquery()
         )
-        top = []
-        for u, cnt in top_rows:
-            if not cnt:
-                continue
-            name = f"@{u.username}" if u.username else (u.first_name or str(u.id))
-            top.append((name, int(cnt), bool(u.mono_token)))
-
-        # Activation funnel: of all users, how many made at least one expense.
-        active_users = s.query(func.count(func.distinct(Expense.user_id))).scalar() or 0
+        top_rows = (await s.execute(
+            select(User.id, User.username, User.first_name, User.mono_token.isnot(None), per_user.c.cnt)
+            .join(per_user, per_user.c.user_id == User.id)
+            .order_by(per_user.c.cnt.desc())
+        )).all()
+
+    by_lang = {}
+    totals = [0] * 5
+    for language, *counts in user_rows:
+        key = language or "en"
+        by_lang[key] = by_lang.get(key, 0) + int(counts[0] or 0)
+        totals = [a + int(b or 0) for a, b in zip(totals, counts)]
+    total_users, new_7d, new_24h, with_mono, blocked = totals
+
+    top = [
+        (f"@{username}" if username else (first_name or str(user_id)), int(cnt), bool(has_mono))
+        for user_id, username, first_name, has_mono, cnt in top_rows if cnt
+    ]
 
     return {
         "total_users": total_users,
         "new_7d": new_7d,
         "new_24h": new_24h,
         "with_mono": with_mono,
-        "total_expenses": total_expenses,
+        "total_expenses": int(total_expenses),
         "dau": dau,
         "wau": wau,
         "by_lang": by_lang,
@@ -246,7 +267,47 @@ def _collect_stats():
     }
 
 
-def _format_stats(s: dict) -> str:
+# (stats, time.monotonic() when computed), and the recompute in progress.
+_stats_snapshot: tuple[dict, float] | None = None
+_stats_refresh: asyncio.Task | None = None
+
+
+async def _refresh_stats() -> None:
+    global _stats_snapshot
+    try:
+        _stats_snapshot = (await _collect_stats(), time.monotonic())
+    except Exception:
+        logger.exception("admin stats refresh failed")
+
+
+def _refresh_stats_in_background() -> asyncio.Task:
+    """Start a recompute unless one is already running."""
+    global _stats_refresh
+    if _stats_refresh is None or _stats_refresh.done():
+        _stats_refresh = asyncio.create_task(_refresh_stats())
+    return _stats_refresh
+
+
+def _stats_stale() -> bool:
+    return _stats_snapshot is None or time.monotonic() - _stats_snapshot[1] >= STATS_TTL
+
+
+async def get_stats(wait: float = STATS_WAIT) -> tuple[dict, float]:
+    """The stats snapshot and its age in seconds. A stale snapshot starts
+    a recompute and is served as is if that takes longer than `wait`; only
+    the very first call (nothing to serve yet) waits for it."""
+    if _stats_stale():
+        refresh = _refresh_stats_in_background()
+        await asyncio.wait({refresh}, timeout=None if _stats_snapshot is None else wait)
+    if _stats_snapshot is None:
+        # The first computation failed; try once more in the foreground.
+        stats = await _collect_stats()
+        return stats, 0.0
+    stats, computed_at = _stats_snapshot
+    return stats, time.monotonic() - computed_at
+
+
+def _format_stats(s: dict, age: float = 0.0) -> str:
     """Compact monospace-friendly stats card. Activation% surfaced explicitly
     because that's the metric most likely to move with onboarding tweaks."""
     activation = (s["active_users"] / s["total_users"] * 100) if s["total_users"] else 0
@@ -273,22 +334,30 @@ def _format_stats(s: dict) -> str:
             )
         ),
     ]
+    charts = chart_cache.stats()
+    lines.append("")
+    lines.append(
+        f"🖼 Кэш графиков: <b>{charts['hit_rate']:.0%}</b> "
+        f"(попаданий {charts['hits'] + charts['disk_hits']}, промахов {charts['misses']}, "
+        f"по file_id {charts['file_id_hits']})"
+    )
     if s["top"]:
         lines.append("")
         lines.append("🏆 <b>Топ-юзеры:</b>")
         for i, (name, cnt, has_mono) in enumerate(s["top"], 1):
             mono_mark = " 🏦" if has_mono else ""
             lines.append(f"   {i}. {name}{mono_mark} — {cnt}")
+    lines.append("")
+    lines.append(f"🕒 Обновлено {age:.0f} с назад")
     return "\n".join(lines)
 
 
 @router.callback_query(F.data == "admin:stats")
-async def show_stats(callback: CallbackQuery):
+async def show_stats(callback: CallbackQuery, lang: str):
     if not is_admin(callback.from_user.id):
         return
-    lang = get_admin_lang()
-    stats = _collect_stats()
-    text = _format_stats(stats)
+    stats, age = await get_stats()
+    text = _format_stats(stats, age)
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🔄 " + t(lang, "admin.refresh"), callback_data="admin:stats")],
         [InlineKeyboardButton(text=t(lang, "admin.back"), callback_data="admin:menu")],
@@ -303,22 +372,20 @@ async def show_stats(callback: CallbackQuery):
 
 
 @router.callback_query(F.data == "admin:broadcast")
-async def broadcast_start(callback: CallbackQuery, state: FSMContext):
+async def broadcast_start(callback: CallbackQuery, state: FSMContext, lang: str):
     if not is_admin(callback.from_user.id):
         return
 
-    lang = get_admin_lang()
     await state.set_state(BroadcastStates.waiting_for_text)
     await callback.message.answer(t(lang, "admin.broadcast_prompt"))
     await callback.answer()
 
 
 @router.message(BroadcastStates.waiting_for_text, F.text == "/cancel")
-async def broadcast_force_cancel(message: Message, state: FSMContext):
+async def broadcast_force_cancel(message: Message, state: FSMContext, lang: str):
     if not is_admin(message.from_user.id):
         return
 
-    lang = get_admin_lang()
     await state.clear()
     await message.answer(t(lang, "admin.broadcast_cancelled"))
 
@@ -335,44 +402,39 @@ _BROADCAST_AUDIENCES = {
 }
 
 
-def _audience_user_ids(audience: str) -> list[int]:
-    if audience == "self":
-        return [ADMIN_ID]
-    with get_session() as s:
-        # Skip users who blocked the bot — they raised TelegramForbiddenError
-        # on a previous send. Saves time and keeps the failed count honest.
-        q = s.query(User.id).filter(User.is_blocked == False)  # noqa: E712
-        target_lang = _BROADCAST_AUDIENCES.get(audience, {}).get("filter")
-        if target_lang and target_lang != "_self":
-            q = q.filter(User.language == target_lang)
-        return [row[0] for row in q.all()]
-
-
-def _mark_user_blocked(user_id: int) -> None:
-    """Flip the is_blocked flag for a user. Tolerant of missing rows so a
-    transient race (user deleted while we're sending) doesn't crash the
-    whole broadcast."""
-    try:
-        with get_session() as s:
-            user = s.query(User).filter(User.id == user_id).first()
-            if user and not user.is_blocked:
-                user.is_blocked = True
-                s.commit()
-    except Exception:
-        pass
+async def _audience_counts() -> dict[str, int]:
+    """Recipients per audience preset from one COUNT ... GROUP BY language.
+    Users who blocked the bot are left out — they raised
+    TelegramForbiddenError on a previous send."""
+    async with get_async_session() as s:
+        rows = (await s.execute(
+            select(User.language, func.count(User.id))
+            .where(User.is_blocked == False)  # noqa: E712
+            .group_by(User.language)
+        )).all()
+    by_lang = {language: int(n) for language, n in rows}
+    counts = {}
+    for key, audience in _BROADCAST_AUDIENCES.items():
+        target = audience["filter"]
+        if target is None:
+            counts[key] = sum(by_lang.values())
+        elif target == "_self":
+            counts[key] = 1
+        else:
+            counts[key] = by_lang.get(target, 0)
+    return counts
 
 
 @router.message(BroadcastStates.waiting_for_text)
-async def broadcast_preview(message: Message, state: FSMContext):
+async def broadcast_preview(message: Message, state: FSMContext, lang: str):
     if not is_admin(message.from_user.id):
         return
 
-    lang = get_admin_lang()
     await state.update_data(broadcast_text=message.text)
 
     # Show per-audience counts up-front so the admin can compare segment
     # sizes before picking a target. "Себе" always shows 1.
-    counts = {key: len(_audience_user_ids(key)) for key in _BROADCAST_AUDIENCES}
+    counts = await _audience_counts()
 
     # First row: bulk audiences. Second row: per-language. Third row: test+cancel.
     rows = [
@@ -415,11 +477,10 @@ async def broadcast_preview(message: Message, state: FSMContext):
 
 
 @router.callback_query(F.data.startswith("admin:broadcast_send:"))
-async def broadcast_confirm(callback: CallbackQuery, state: FSMContext):
+async def broadcast_confirm(callback: CallbackQuery, state: FSMContext, lang: str):
     if not is_admin(callback.from_user.id):
         return
 
-    lang = get_admin_lang()
     audience = callback.data.split(":")[2]
     data = await state.get_data()
     text = data.get("broadcast_text", "")
@@ -431,52 +492,44 @@ async def broadcast_confirm(callback: CallbackQuery, state: FSMContext):
     if audience != "self":
         await state.clear()
 
-    user_ids = _audience_user_ids(audience)
-    sent, failed, blocked = 0, 0, 0
-    for user_id in user_ids:
-        try:
-            await callback.bot.send_message(user_id, text, parse_mode="HTML")
-            sent += 1
-        except TelegramForbiddenError:
-            # User blocked the bot or deleted their account — flag them so
-            # we don't keep wasting time on them in future broadcasts.
-            _mark_user_blocked(user_id)
-            failed += 1
-            blocked += 1
-        except TelegramBadRequest as e:
-            # "chat not found" / "user is deactivated" — also a permanent
-            # delivery failure; treat the same as a hard block.
-            msg = str(e).lower()
-            if any(k in msg for k in ("chat not found", "deactivated", "user is blocked")):
-                _mark_user_blocked(user_id)
-                blocked += 1
-            failed += 1
-        except Exception:
-            failed += 1
-
     audience_label = _BROADCAST_AUDIENCES.get(audience, {}).get("label", audience)
     if audience == "self":
+        outcome = await deliver(callback.bot, ADMIN_ID, text)
         await callback.message.answer(
-            f"🧪 Тестовая отправка ({audience_label})\nОтправлено: <b>{sent}</b>",
-            parse_mode="HTML",
-        )
-    else:
-        extra = f"\nАудитория: {audience_label}"
-        if blocked:
-            extra += f"\n🚫 Заблокировали бота: <b>{blocked}</b> (помечены)"
-        await callback.message.answer(
-            t(lang, "admin.broadcast_done", sent=sent, failed=failed) + extra,
+            f"🧪 Тестовая отправка ({audience_label})\nОтправлено: <b>{int(outcome == 'sent')}</b>",
             parse_mode="HTML",
         )
+        await callback.answer()
+        return
+
+    # The engine edits this message with progress and the final tally.
+    progress = await callback.message.answer(f"📤 Рассылка: {audience_label}…")
+    job = await create_broadcast(
+        text,
+        _BROADCAST_AUDIENCES.get(audience, {}).get("filter"),
+        chat_id=progress.chat.id,
+        message_id=progress.message_id,
+        admin_lang=lang,
+    )
+    start_broadcast(callback.bot, job)
     await callback.answer()
 
 
+@router.callback_query(F.data.startswith("admin:broadcast_stop:"))
+async def broadcast_stop(callback: CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        return
+
+    # Whichever worker runs it sees the status after its current chunk.
+    stopped = await stop_broadcast(int(callback.data.split(":")[2]))
+    await callback.answer("⏹" if stopped else None)
+
+
 @router.callback_query(F.data == "admin:broadcast_cancel")
-async def broadcast_cancel(callback: CallbackQuery, state: FSMContext):
+async def broadcast_cancel(callback: CallbackQuery, state: FSMContext, lang: str):
     if not is_admin(callback.from_user.id):
         return
 
-    lang = get_admin_lang()
     await state.clear()
     await callback.message.answer(t(lang, "admin.broadcast_cancelled"))
     await callback.answer()
\ No newline at end of file
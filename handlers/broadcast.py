@@ -0,0 +1,285 @@
+"""The admin broadcast engine.
+
+A broadcast is a `broadcasts` row. The worker that owns it (a lease with a
+compare-and-set, renewed on every chunk) reads recipients in user id order,
+BROADCAST_CHUNK at a time, and sends each chunk with at most
+BROADCAST_CONCURRENCY messages in flight. Every send first takes a token
+from one process-wide bucket refilled at BROADCAST_RATE per second, under
+Telegram's ~30 messages/s; a TelegramRetryAfter empties the bucket for the
+time Telegram asked for and the message is retried.
+
+After each chunk one transaction flags the users who turned out to have
+blocked the bot and moves the broadcast's cursor and counters, so a
+restart resumes after the last finished chunk (a chunk cut off mid-way may
+be re-sent to some of its users). `broadcast_worker()` picks up broadcasts
+whose owner died. The admin's progress message is edited as chunks finish,
+with a button that stops the broadcast.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from os import getenv
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter,
+)
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from sqlalchemy import func, select, update
+
+from databases.db import async_engine
+from databases.models import Broadcast, User
+from handlers.middleware import invalidate_user
+from utils.ratelimit import TokenBucket
+from utils.translations import t
+
+logger = logging.getLogger(__name__)
+
+_broadcasts = Broadcast.__table__
+_users = User.__table__
+
+BROADCAST_RATE = float(getenv("BROADCAST_RATE", "25"))  # messages per second
+BROADCAST_CONCURRENCY = int(getenv("BROADCAST_CONCURRENCY", "10"))  # sends in flight
+BROADCAST_CHUNK = 100  # recipients per progress save
+MAX_RETRIES = 3  # per recipient, on TelegramRetryAfter
+PROGRESS_INTERVAL = 3.0  # seconds between edits of the progress message
+LEASE = 120  # seconds a claimed broadcast stays ours; renewed every chunk
+POLL_INTERVAL = 60  # seconds between looks for orphaned broadcasts
+
+# Shared by every broadcast in the process: the limit is per bot.
+_bucket = TokenBucket(BROADCAST_RATE, capacity=1)
+# "chat not found" / "user is deactivated": as permanent as a block.
+_GONE = ("chat not found", "deactivated", "user is blocked")
+
+
+def audience_filter(language: str | None):
+    """Reachable users, optionally of one language."""
+    cond = _users.c.is_blocked == False  # noqa: E712
+    if language:
+        cond = cond & (_users.c.language == language)
+    return cond
+
+
+async def create_broadcast(text: str, language: str | None, chat_id: int,
+                           message_id: int | None, admin_lang: str):
+    """Insert a broadcast already leased to the caller and return its row."""
+    async with async_engine.begin() as conn:
+        total = await conn.scalar(select(func.count()).select_from(_users).where(audience_filter(language)))
+        job_id = (await conn.execute(
+            _broadcasts.insert().values(
+                text=text, language=language, status="running", chat_id=chat_id,
+                message_id=message_id, admin_lang=admin_lang, total=total or 0,
+                sent=0, failed=0, blocked=0, cursor=0,
+                lease_until=int(time.time()) + LEASE, created_at=datetime.now(),
+            )
+        )).inserted_primary_key[0]
+        return (await conn.execute(select(_broadcasts).where(_broadcasts.c.id == job_id))).one()
+
+
+async def stop_broadcast(job_id: int) -> bool:
+    async with async_engine.begin() as conn:
+        return (await conn.execute(
+            update(_broadcasts)
+            .where(_broadcasts.c.id == job_id, _broadcasts.c.status == "running")
+            .values(status="stopped", finished_at=datetime.now())
+        )).rowcount > 0
+
+
+async def deliver(bot: Bot, user_id: int, text: str) -> str:
+    """Send one message: 'sent', 'blocked' or 'failed'."""
+    for _ in range(MAX_RETRIES):
+        await _bucket.acquire()
+        try:
+            await bot.send_message(user_id, text, parse_mode="HTML")
+            return "sent"
+        except TelegramRetryAfter as e:
+            _bucket.penalize(e.retry_after)
+        except TelegramForbiddenError:
+            return "blocked"
+        except TelegramBadRequest as e:
+            return "blocked" if any(k in str(e).lower() for k in _GONE) else "failed"
+        except Exception as e:
+            logger.warning("broadcast: send to %s failed: %r", user_id, e)
+            return "failed"
+    return "failed"
+
+
+def progress_text(job) -> str:
+    done = job.sent + job.failed
+    lines = [
+        f"📤 Рассылка #{job.id}: <b>{done}</b> / {job.total}",
+        f"✅ {job.sent}   ❌ {job.failed}   🚫 {job.blocked}",
+    ]
+    if job.status == "stopped":
+        lines.append("⏹ Остановлена")
+    return "\n".join(lines)
+
+
+def final_text(job) -> str:
+    text = t(job.admin_lang, "admin.broadcast_done", sent=job.sent, failed=job.failed)
+    if job.language:
+        text += f"\nАудитория: {job.language.upper()}"
+    if job.blocked:
+        text += f"\n🚫 Заблокировали бота: <b>{job.blocked}</b> (помечены)"
+    return text
+
+
+def _stop_keyboard(job_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="⏹ Остановить", callback_data=f"admin:broadcast_stop:{job_id}")
+    ]])
+
+
+async def _show(bot: Bot, job, text: str, keyboard=None) -> None:
+    if job.message_id is None:
+        return
+    try:
+        await _bucket.acquire()
+        await bot.edit_message_text(text, chat_id=job.chat_id, message_id=job.message_id,
+                                    reply_markup=keyboard, parse_mode="HTML")
+    except TelegramBadRequest:
+        pass  # "message is not modified", or the admin deleted it
+    except Exception as e:
+        logger.warning("broadcast #%s: progress edit failed: %r", job.id, e)
+
+
+async def _save_chunk(job_id: int, cursor: int, counts: dict, blocked_ids: list[int]):
+    """Flag blocked users and move the cursor in one transaction. Returns
+    the updated row; its status shows whether the admin stopped it."""
+    async with async_engine.begin() as conn:
+        if blocked_ids:
+            await conn.execute(update(_users).where(_users.c.id.in_(blocked_ids)).values(is_blocked=True))
+        await conn.execute(
+            update(_broadcasts)
+            .where(_broadcasts.c.id == job_id)
+            .values(
+                cursor=cursor,
+                sent=_broadcasts.c.sent + counts["sent"],
+                failed=_broadcasts.c.failed + counts["failed"],
+                blocked=_broadcasts.c.blocked + counts["blocked"],
+                lease_until=int(time.time()) + LEASE,
+            )
+        )
+        job = (await conn.execute(select(_broadcasts).where(_broadcasts.c.id == job_id))).one()
+    for user_id in blocked_ids:
+        invalidate_user(user_id)
+    return job
+
+
+async def _send_all(bot: Bot, job):
+    gate = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+
+    async def send(user_id: int) -> tuple[int, str]:
+        async with gate:
+            return user_id, await deliver(bot, user_id, job.text)
+
+    last_shown = 0.0
+    while job.status == "running":
+        async with async_engine.connect() as conn:
+            ids = list((await conn.execute(
+                select(_users.c.id)
+                .where(audience_filter(job.language), _users.c.id > job.cursor)
+                .order_by(_users.c.id)
+                .limit(BROADCAST_CHUNK)
+            )).scalars())
+        if not ids:
+            async with async_engine.begin() as conn:
+                await conn.execute(
+                    update(_broadcasts)
+                    .where(_broadcasts.c.id == job.id, _broadcasts.c.status == "running")
+                    .values(status="done", finished_at=datetime.now())
+                )
+                return (await conn.execute(select(_broadcasts).where(_broadcasts.c.id == job.id))).one()
+
+        counts = {"sent": 0, "failed": 0, "blocked": 0}
+        blocked_ids = []
+        for user_id, outcome in await asyncio.gather(*(send(user_id) for user_id in ids)):
+            if outcome == "sent":
+                counts["sent"] += 1
+            else:
+                counts["failed"] += 1
+                if outcome == "blocked":
+                    counts["blocked"] += 1
+                    blocked_ids.append(user_id)
+        job = await _save_chunk(job.id, ids[-1], counts, blocked_ids)
+
+        if job.status == "running" and time.monotonic() - last_shown >= PROGRESS_INTERVAL:
+            last_shown = time.monotonic()
+            await _show(bot, job, progress_text(job), _stop_keyboard(job.id))
+    return job
+
+
+async def run_broadcast(bot: Bot, job) -> None:
+    """Send a leased broadcast from its cursor to the end (or until it is
+    stopped) and leave the final tally in the admin's message."""
+    try:
+        job = await _send_all(bot, job)
+    except asyncio.CancelledError:
+        # Shutting down: give the lease back so the next process resumes
+        # right away instead of waiting it out.
+        async with async_engine.begin() as conn:
+            await conn.execute(update(_broadcasts).where(_broadcasts.c.id == job.id).values(lease_until=0))
+        raise
+    logger.info("broadcast #%s %s: sent=%s failed=%s blocked=%s",
+                job.id, job.status, job.sent, job.failed, job.blocked)
+    await _show(bot, job, progress_text(job) if job.status == "stopped" else final_text(job))
+
+
+_running: set[asyncio.Task] = set()
+
+
+def start_broadcast(bot: Bot, job) -> None:
+    """Run a leased broadcast in the background."""
+    task = asyncio.create_task(run_broadcast(bot, job))
+    _running.add(task)
+    task.add_done_callback(_finished)
+
+
+def _finished(task: asyncio.Task) -> None:
+    _running.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        # The lease runs out and broadcast_worker() picks it up again.
+        logger.error("broadcast failed", exc_info=task.exception())
+
+
+async def shutdown_broadcasts() -> None:
+    """Cancel the broadcasts this process is running; their leases are
+    handed back for whichever process starts next."""
+    for task in list(_running):
+        task.cancel()
+    await asyncio.gather(*_running, return_exceptions=True)
+
+
+def claim_broadcasts(conn) -> list:
+    """Lease running broadcasts whose owner's lease ran out."""
+    now = int(time.time())
+    claimed = []
+    for job in conn.execute(
+        select(_broadcasts)
+        .where(_broadcasts.c.status == "running", _broadcasts.c.lease_until < now)
+    ).all():
+        won = conn.execute(
+            update(_broadcasts)
+            .where(_broadcasts.c.id == job.id, _broadcasts.c.lease_until == job.lease_until)
+            .values(lease_until=now + LEASE)
+        ).rowcount
+        if won:
+            claimed.append(job)
+    return claimed
+
+
+async def broadcast_worker(bot: Bot, interval: float = POLL_INTERVAL) -> None:
+    """Run forever, resuming broadcasts left behind by a process that died
+    or restarted. Meant to be started as a task next to the polling loop."""
+    while True:
+        try:
+            async with async_engine.begin() as conn:
+                jobs = await conn.run_sync(claim_broadcasts)
+            for job in jobs:
+                logger.info("broadcast #%s: resuming after user %s", job.id, job.cursor)
+                start_broadcast(bot, job)
+        except Exception:
+            logger.exception("broadcast worker failed")
+        await asyncio.sleep(interval)
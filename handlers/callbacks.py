@@ -1,20 +1,23 @@
 from aiogram import Router, html, F
-from aiogram.types import CallbackQuery, Message, BufferedInputFile
+from aiogram.types import CallbackQuery, Message
 from datetime import datetime, time, timedelta
-from sqlalchemy import func
-import csv
-from io import StringIO, BytesIO
 
-from databases import get_session, User, Expense
+from sqlalchemy import select
+
+from databases import get_async_session, User, Expense
+from databases.db import async_engine
+from databases.rollups import rollup_total_query
 from utils.keyboards import (get_main_menu, get_currency_keyboard, get_expenses_list_keyboard,
                              get_expense_details_keyboard, get_edit_field_keyboard,
                              get_category_keyboard, get_delete_confirmation_keyboard,
                              get_description_edit_keyboard,
                              EXPENSE_CATEGORIES, get_language_keyboard)
 from utils.currency import CURRENCY_SYMBOLS
+from utils.export import EXPORT_BATCH, StreamedInputFile, astream_csv, astream_parquet
 from aiogram.fsm.context import FSMContext
 from handlers.budget import BudgetStates
 from handlers.expenses import ExpenseEditStates
+from handlers.middleware import invalidate_user
 from utils.translations import detect_language, get_user_language, t, t_category
 
 router = Router()
@@ -34,11 +37,8 @@ def get_budget_periods() -> tuple[datetime, datetime, datetime, datetime]:
 
 
 @router.callback_query(F.data.startswith("set:"))
-async def process_settings_selection(callback: CallbackQuery):
+async def process_settings_selection(callback: CallbackQuery, lang: str):
     settings = callback.data.split(":")[1]
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
     if settings == "cur":
         await callback.message.edit_text(
             t(lang, "settings.currency"),
@@ -56,15 +56,16 @@ async def process_settings_selection(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("currency_"))
 async def process_currency_selection(callback: CallbackQuery):
     currency = callback.data.split("_")[1]
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
+    async with get_async_session() as session:
+        user = await session.get(User, callback.from_user.id)
         if user is None:
             await callback.message.answer(t(detect_language(callback.from_user.language_code), "common.profile_missing"))
             await callback.answer()
             return
 
         user.currency = currency
-        session.commit()
+        await session.commit()
+        invalidate_user(user.id)
         lang = get_user_language(user, detect_language(callback.from_user.language_code))
 
         await callback.message.answer(
@@ -75,10 +76,7 @@ async def process_currency_selection(callback: CallbackQuery):
     await callback.answer()
 
 
-async def set_budget(message: Message, state: FSMContext, field: str, label: str):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
+async def set_budget(message: Message, state: FSMContext, field: str, label: str, lang: str):
     raw_text = message.text
     try:
         amount = float(raw_text.replace(",", "."))
@@ -90,8 +88,8 @@ async def set_budget(message: Message, state: FSMContext, field: str, label: str
         await message.answer(t(lang, "budget.amount_positive"))
         return
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
+    async with get_async_session() as session:
+        user = await session.get(User, message.from_user.id)
         if user is None:
             language = detect_language(message.from_user.language_code)
             user = User(
@@ -114,9 +112,9 @@ async def set_budget(message: Message, state: FSMContext, field: str, label: str
                 return
 
         setattr(user, field, amount)
-        session.commit()
+        await session.commit()
+        invalidate_user(user.id)
         currency = user.currency or "EUR"
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
 
     await state.clear()
 
@@ -125,47 +123,37 @@ async def set_budget(message: Message, state: FSMContext, field: str, label: str
     ))
 
 async def clear_budget(callback: CallbackQuery, field: str, label: str):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
+    async with get_async_session() as session:
+        user = await session.get(User, callback.from_user.id)
         if user is None:
             await callback.message.answer(t(detect_language(callback.from_user.language_code), "common.profile_missing"))
             await callback.answer()
             return
         setattr(user, field, None)
-        session.commit()
+        await session.commit()
+        invalidate_user(user.id)
         lang = get_user_language(user, detect_language(callback.from_user.language_code))
 
     await callback.message.answer(t(lang, "budget.cleared", label=label))
     await callback.answer()
 
 @router.callback_query(F.data == "budget_view")
-async def process_budget_view(callback: CallbackQuery):
+async def process_budget_view(callback: CallbackQuery, user: User | None, lang: str):
     today_start, today_end, week_start, week_end = get_budget_periods()
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        if user is None:
-            await callback.message.answer(t(detect_language(callback.from_user.language_code), "common.profile_missing"))
-            await callback.answer()
-            return
+    if user is None:
+        await callback.message.answer(t(lang, "common.profile_missing"))
+        await callback.answer()
+        return
 
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
-        currency = user.currency or "EUR"
-        currency_symbol = CURRENCY_SYMBOLS.get(currency, currency)
-
-        daily_total = session.query(func.coalesce(func.sum(Expense.amount), 0.0)).filter(
-            Expense.user_id == callback.from_user.id,
-            Expense.currency == currency,
-            Expense.created_at >= today_start,
-            Expense.created_at <= today_end
-        ).scalar() or 0.0
-
-        weekly_total = session.query(func.coalesce(func.sum(Expense.amount), 0.0)).filter(
-            Expense.user_id == callback.from_user.id,
-            Expense.currency == currency,
-            Expense.created_at >= week_start,
-            Expense.created_at <= week_end
-        ).scalar() or 0.0
+    currency = user.currency or "EUR"
+    currency_symbol = CURRENCY_SYMBOLS.get(currency, currency)
+
+    async with get_async_session() as session:
+        daily_total = await session.scalar(rollup_total_query(
+            callback.from_user.id, currency, today_start.date(), today_end.date()))
+        weekly_total = await session.scalar(rollup_total_query(
+            callback.from_user.id, currency, week_start.date(), week_end.date()))
 
     daily_limit = f"{user.daily_budget:.2f} {currency_symbol}" if user.daily_budget else t(lang, "budget.not_set")
     weekly_limit = f"{user.weekly_budget:.2f} {currency_symbol}" if user.weekly_budget else t(lang, "budget.not_set")
@@ -182,65 +170,48 @@ async def process_budget_view(callback: CallbackQuery):
     await callback.answer()
 
 @router.callback_query(F.data == "budget_reset_daily")
-async def process_budget_reset_daily(callback: CallbackQuery):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
+async def process_budget_reset_daily(callback: CallbackQuery, lang: str):
     await clear_budget(callback, "daily_budget", t(lang, "budget.daily"))
 
 @router.callback_query(F.data == "budget_reset_weekly")
-async def process_budget_reset_weekly(callback: CallbackQuery):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
+async def process_budget_reset_weekly(callback: CallbackQuery, lang: str):
     await clear_budget(callback, "weekly_budget", t(lang, "budget.weekly"))
 
 @router.callback_query(F.data.startswith("budget_daily"))
-async def process_budget_daily(callback: CallbackQuery, state: FSMContext):
+async def process_budget_daily(callback: CallbackQuery, state: FSMContext, lang: str):
     await state.set_state(BudgetStates.waiting_for_daily_budget)
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
     await callback.message.answer(t(lang, "budget.enter_daily"))
     await callback.answer()
 
 @router.message(BudgetStates.waiting_for_daily_budget)
-async def process_daily_budget(message: Message, state: FSMContext):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
-    await set_budget(message, state, "daily_budget", t(lang, "budget.daily"))
+async def process_daily_budget(message: Message, state: FSMContext, lang: str):
+    await set_budget(message, state, "daily_budget", t(lang, "budget.daily"), lang)
 
 @router.callback_query(F.data.startswith("budget_weekly"))
-async def process_budget_weekly(callback: CallbackQuery, state: FSMContext):
+async def process_budget_weekly(callback: CallbackQuery, state: FSMContext, lang: str):
     await state.set_state(BudgetStates.waiting_for_weekly_budget)
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
     await callback.message.answer(t(lang, "budget.enter_weekly"))
     await callback.answer()
 
 @router.message(BudgetStates.waiting_for_weekly_budget)
-async def process_weekly_budget(message: Message, state: FSMContext):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
-    await set_budget(message, state, "weekly_budget", t(lang, "budget.weekly"))
+async def process_weekly_budget(message: Message, state: FSMContext, lang: str):
+    await set_budget(message, state, "weekly_budget", t(lang, "budget.weekly"), lang)
 
 
 @router.callback_query(F.data.in_(["lang_en", "lang_ru", "lang_uk"]))
 async def process_language_selection(callback: CallbackQuery):
     new_lang = callback.data.split("_")[1]
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
+    async with get_async_session() as session:
+        user = await session.get(User, callback.from_user.id)
         if user is None:
             await callback.message.answer(t(detect_language(callback.from_user.language_code), "common.profile_missing"))
             await callback.answer()
             return
 
         user.language = new_lang
-        session.commit()
+        await session.commit()
+        invalidate_user(user.id)
 
     await callback.message.edit_text(t(new_lang, "language.updated"))
     await callback.message.answer(
@@ -253,27 +224,22 @@ async def process_language_selection(callback: CallbackQuery):
 # Expense Management Callbacks
 
 @router.callback_query(F.data == "expense_cancel")
-async def cancel_expense_flow(callback: CallbackQuery, state: FSMContext):
+async def cancel_expense_flow(callback: CallbackQuery, state: FSMContext, lang: str):
     await state.clear()
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
     await callback.message.edit_text(t(lang, "expense.cancelled"))
     await callback.answer()
 
 @router.callback_query(F.data == "expense_back")
-async def back_to_expense_list(callback: CallbackQuery):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        if user is None:
-            await callback.message.edit_text(t(detect_language(callback.from_user.language_code), "common.profile_missing"))
-            await callback.answer()
-            return
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
+async def back_to_expense_list(callback: CallbackQuery, user: User | None, lang: str):
+    if user is None:
+        await callback.message.edit_text(t(lang, "common.profile_missing"))
+        await callback.answer()
+        return
 
-        expenses = session.query(Expense).filter(
+    async with get_async_session() as session:
+        expenses = (await session.scalars(select(Expense).where(
             Expense.user_id == callback.from_user.id
-        ).order_by(Expense.created_at.desc()).limit(10).all()
+        ).order_by(Expense.created_at.desc()).limit(10))).all()
 
         if not expenses:
             await callback.message.edit_text(t(lang, "expenses.empty"))
@@ -295,16 +261,14 @@ async def back_to_expense_list(callback: CallbackQuery):
     await callback.answer()
 
 @router.callback_query(F.data.startswith("expense_select:"))
-async def select_expense(callback: CallbackQuery):
+async def select_expense(callback: CallbackQuery, lang: str):
     expense_id = int(callback.data.split(":")[1])
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
-        expense = session.query(Expense).filter(
+    async with get_async_session() as session:
+        expense = await session.scalar(select(Expense).where(
             Expense.id == expense_id,
             Expense.user_id == callback.from_user.id
-        ).first()
+        ))
 
         if expense is None:
             await callback.message.edit_text(t(lang, "expense.not_found_permission"))
@@ -330,16 +294,14 @@ async def select_expense(callback: CallbackQuery):
     await callback.answer()
 
 @router.callback_query(F.data.startswith("expense_edit:"))
-async def edit_expense(callback: CallbackQuery):
+async def edit_expense(callback: CallbackQuery, lang: str):
     expense_id = int(callback.data.split(":")[1])
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
-        expense = session.query(Expense).filter(
+    async with get_async_session() as session:
+        expense = await session.scalar(select(Expense).where(
             Expense.id == expense_id,
             Expense.user_id == callback.from_user.id
-        ).first()
+        ))
 
         if expense is None:
             await callback.message.edit_text(t(lang, "expense.not_found_permission"))
@@ -351,16 +313,14 @@ async def edit_expense(callback: CallbackQuery):
     await callback.answer()
 
 @router.callback_query(F.data.startswith("expense_edit_amount:"))
-async def edit_amount_start(callback: CallbackQuery, state: FSMContext):
+async def edit_amount_start(callback: CallbackQuery, state: FSMContext, lang: str):
     expense_id = int(callback.data.split(":")[1])
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
-        expense = session.query(Expense).filter(
+    async with get_async_session() as session:
+        expense = await session.scalar(select(Expense).where(
             Expense.id == expense_id,
             Expense.user_id == callback.from_user.id
-        ).first()
+        ))
 
         if expense is None:
             await callback.message.edit_text(t(lang, "expense.not_found"))
@@ -376,14 +336,10 @@ async def edit_amount_start(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.message(ExpenseEditStates.edit_amount)
-async def process_edit_amount(message: Message, state: FSMContext):
+async def process_edit_amount(message: Message, state: FSMContext, lang: str):
     data = await state.get_data()
     expense_id = data.get("expense_id")
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
-
     raw_text = message.text or ""
     try:
         new_amount = float(raw_text.replace(",", "."))
@@ -399,11 +355,11 @@ async def process_edit_amount(message: Message, state: FSMContext):
         await message.answer(t(lang, "expense.amount_too_large"))
         return
 
-    with get_session() as session:
-        expense = session.query(Expense).filter(
+    async with get_async_session() as session:
+        expense = await session.scalar(select(Expense).where(
             Expense.id == expense_id,
             Expense.user_id == message.from_user.id
-        ).first()
+        ))
 
         if expense is None:
             await message.answer(t(lang, "expense.not_found"))
@@ -411,17 +367,17 @@ async def process_edit_amount(message: Message, state: FSMContext):
             return
 
         expense.amount = new_amount
-        session.commit()
+        await session.commit()
 
         currency_symbol = get_currency_symbol(expense.currency)
 
     await state.clear()
     await message.answer(t(lang, "expense.amount_updated", amount=f"{new_amount:.2f}", currency=currency_symbol))
-    with get_session() as session:
-        updated = session.query(Expense).filter(
+    async with get_async_session() as session:
+        updated = await session.scalar(select(Expense).where(
             Expense.id == expense_id,
             Expense.user_id == message.from_user.id
-        ).first()
+        ))
         if updated:
             if updated.description:
                 norm_desc = updated.description.strip().replace("\n", " ")
@@ -438,16 +394,14 @@ async def process_edit_amount(message: Message, state: FSMContext):
             await message.answer(details, reply_markup=get_expense_details_keyboard(expense_id, lang))
 
 @router.callback_query(F.data.startswith("expense_edit_category:"))
-async def edit_category_start(callback: CallbackQuery, state: FSMContext):
+async def edit_category_start(callback: CallbackQuery, state: FSMContext, lang: str):
     expense_id = int(callback.data.split(":")[1])
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
-        expense = session.query(Expense).filter(
+    async with get_async_session() as session:
+        expense = await session.scalar(select(Expense).where(
             Expense.id == expense_id,
             Expense.user_id == callback.from_user.id
-        ).first()
+        ))
 
         if expense is None:
             await callback.message.edit_text(t(lang, "expense.not_found"))
@@ -461,25 +415,21 @@ async def edit_category_start(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.callback_query(F.data.startswith("expense_category_select:"))
-async def process_category_select(callback: CallbackQuery, state: FSMContext):
+async def process_category_select(callback: CallbackQuery, state: FSMContext, lang: str):
     new_category = callback.data.split(":")[1]
     data = await state.get_data()
     expense_id = data.get("expense_id")
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
-
     if new_category not in EXPENSE_CATEGORIES:
         await callback.message.edit_text(t(lang, "expense.invalid_category"))
         await callback.answer()
         return
 
-    with get_session() as session:
-        expense = session.query(Expense).filter(
+    async with get_async_session() as session:
+        expense = await session.scalar(select(Expense).where(
             Expense.id == expense_id,
             Expense.user_id == callback.from_user.id
-        ).first()
+        ))
 
         if expense is None:
             await callback.message.edit_text(t(lang, "expense.not_found"))
@@ -488,15 +438,15 @@ async def process_category_select(callback: CallbackQuery, state: FSMContext):
             return
 
         expense.category = new_category
-        session.commit()
+        await session.commit()
 
     await state.clear()
     await callback.message.answer(t(lang, "expense.category_updated", category=t_category(lang, new_category)))
-    with get_session() as session:
-        updated = session.query(Expense).filter(
+    async with get_async_session() as session:
+        updated = await session.scalar(select(Expense).where(
             Expense.id == expense_id,
             Expense.user_id == callback.from_user.id
-        ).first()
+        ))
         if updated:
             if updated.description:
                 norm_desc = updated.description.strip().replace("\n", " ")
@@ -514,16 +464,14 @@ async def process_category_select(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.callback_query(F.data.startswith("expense_edit_description:"))
-async def edit_description_start(callback: CallbackQuery, state: FSMContext):
+async def edit_description_start(callback: CallbackQuery, state: FSMContext, lang: str):
     expense_id = int(callback.data.split(":")[1])
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
-        expense = session.query(Expense).filter(
+    async with get_async_session() as session:
+        expense = await session.scalar(select(Expense).where(
             Expense.id == expense_id,
             Expense.user_id == callback.from_user.id
-        ).first()
+        ))
 
         if expense is None:
             await callback.message.edit_text(t(lang, "expense.not_found"))
@@ -543,16 +491,14 @@ async def edit_description_start(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data.startswith("expense_clear_description:"))
-async def clear_description_callback(callback: CallbackQuery, state: FSMContext):
+async def clear_description_callback(callback: CallbackQuery, state: FSMContext, lang: str):
     expense_id = int(callback.data.split(":")[1])
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
-        expense = session.query(Expense).filter(
+    async with get_async_session() as session:
+        expense = await session.scalar(select(Expense).where(
             Expense.id == expense_id,
             Expense.user_id == callback.from_user.id
-        ).first()
+        ))
 
         if expense is None:
             await callback.message.edit_text(t(lang, "expense.not_found"))
@@ -560,7 +506,7 @@ async def clear_description_callback(callback: CallbackQuery, state: FSMContext)
             return
 
         expense.description = None
-        session.commit()
+        await session.commit()
 
         await state.clear()
 
@@ -577,23 +523,19 @@ async def clear_description_callback(callback: CallbackQuery, state: FSMContext)
     await callback.answer()
 
 @router.message(ExpenseEditStates.edit_description)
-async def process_edit_description(message: Message, state: FSMContext):
+async def process_edit_description(message: Message, state: FSMContext, lang: str):
     data = await state.get_data()
     expense_id = data.get("expense_id")
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
-
     raw_text = message.text or ""
     stripped_text = raw_text.strip()
     new_description = stripped_text if stripped_text else None
 
-    with get_session() as session:
-        expense = session.query(Expense).filter(
+    async with get_async_session() as session:
+        expense = await session.scalar(select(Expense).where(
             Expense.id == expense_id,
             Expense.user_id == message.from_user.id
-        ).first()
+        ))
 
         if expense is None:
             await message.answer(t(lang, "expense.not_found"))
@@ -601,7 +543,7 @@ async def process_edit_description(message: Message, state: FSMContext):
             return
 
         expense.description = new_description
-        session.commit()
+        await session.commit()
 
     await state.clear()
     if new_description:
@@ -609,11 +551,11 @@ async def process_edit_description(message: Message, state: FSMContext):
     else:
         await message.answer(t(lang, "expense.description_cleared"))
 
-    with get_session() as session:
-        updated = session.query(Expense).filter(
+    async with get_async_session() as session:
+        updated = await session.scalar(select(Expense).where(
             Expense.id == expense_id,
             Expense.user_id == message.from_user.id
-        ).first()
+        ))
         if updated:
             if updated.description:
                 norm_desc = updated.description.strip().replace("\n", " ")
@@ -630,16 +572,14 @@ async def process_edit_description(message: Message, state: FSMContext):
             await message.answer(details, reply_markup=get_expense_details_keyboard(expense_id, lang))
 
 @router.callback_query(F.data.startswith("expense_delete:"))
-async def delete_expense(callback: CallbackQuery):
+async def delete_expense(callback: CallbackQuery, lang: str):
     expense_id = int(callback.data.split(":")[1])
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
-        expense = session.query(Expense).filter(
+    async with get_async_session() as session:
+        expense = await session.scalar(select(Expense).where(
             Expense.id == expense_id,
             Expense.user_id == callback.from_user.id
-        ).first()
+        ))
 
         if expense is None:
             await callback.message.edit_text(t(lang, "expense.not_found_permission"))
@@ -663,16 +603,14 @@ async def delete_expense(callback: CallbackQuery):
     await callback.answer()
 
 @router.callback_query(F.data.startswith("expense_confirm_delete:"))
-async def confirm_delete_expense(callback: CallbackQuery):
+async def confirm_delete_expense(callback: CallbackQuery, lang: str):
     expense_id = int(callback.data.split(":")[1])
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
-        expense = session.query(Expense).filter(
+    async with get_async_session() as session:
+        expense = await session.scalar(select(Expense).where(
             Expense.id == expense_id,
             Expense.user_id == callback.from_user.id
-        ).first()
+        ))
 
         if expense is None:
             await callback.message.edit_text(t(lang, "expense.not_found"))
@@ -682,8 +620,8 @@ async def confirm_delete_expense(callback: CallbackQuery):
         amount = expense.amount
         category = expense.category
 
-        session.delete(expense)
-        session.commit()
+        await session.delete(expense)
+        await session.commit()
 
     await callback.message.edit_text(t(lang, "expense.deleted", amount=f"{amount:.2f}", category=t_category(lang, category)))
     await callback.answer()
@@ -691,82 +629,95 @@ async def confirm_delete_expense(callback: CallbackQuery):
 
 # Export callbacks
 @router.callback_query(F.data == 'export_cancel')
-async def export_cancel(callback: CallbackQuery):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
-
+async def export_cancel(callback: CallbackQuery, lang: str):
     await callback.message.edit_text(t(lang, 'export.cancelled'))
     await callback.answer()
 
 
-def build_csv_bytes(expenses: list) -> bytes:
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['id', 'amount', 'category', 'description', 'created_at', 'currency'])
-    for e in expenses:
-        desc = e.description.strip().replace('\n', ' ') if e.description else ''
-        row_currency = e.currency if e.currency else 'EUR'
-        writer.writerow([e.id, f"{e.amount:.2f}", e.category, desc, e.created_at.strftime('%Y-%m-%d %H:%M:%S'), row_currency])
-    return output.getvalue().encode('utf-8-sig')
+CSV_HEADER = ['id', 'amount', 'category', 'description', 'created_at', 'currency']
 
 
-@router.callback_query(F.data == 'export_all')
-async def export_all(callback: CallbackQuery):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        if user is None:
-            await callback.message.answer(t(detect_language(callback.from_user.language_code), "common.profile_missing"))
-            await callback.answer()
-            return
+def _csv_row(e) -> list:
+    desc = e.description.strip().replace('\n', ' ') if e.description else ''
+    row_currency = e.currency if e.currency else 'EUR'
+    return [e.id, f"{e.amount:.2f}", e.category, desc, e.created_at.strftime('%Y-%m-%d %H:%M:%S'), row_currency]
 
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
-        expenses = session.query(Expense).filter(Expense.user_id == callback.from_user.id).order_by(Expense.created_at.desc()).all()
 
-        if not expenses:
-            await callback.message.answer(t(lang, "export.no_all"))
-            await callback.answer()
-            return
+def _export_query(user_id: int, start: datetime | None = None, end: datetime | None = None):
+    stmt = select(Expense.id, Expense.amount, Expense.category, Expense.description,
+                  Expense.created_at, Expense.currency).where(Expense.user_id == user_id)
+    if start is not None:
+        stmt = stmt.where(Expense.created_at >= start, Expense.created_at <= end)
+    return stmt
+
+
+async def _has_rows(stmt) -> bool:
+    async with get_async_session() as session:
+        return (await session.execute(stmt.limit(1))).first() is not None
+
+
+def csv_export_file(stmt, filename: str) -> StreamedInputFile:
+    """The rows of `stmt` as a CSV upload, read from the database in
+    batches while Telegram receives it."""
+    async def chunks():
+        async with async_engine.connect() as conn:
+            result = await conn.stream(stmt.order_by(Expense.created_at.desc())
+                                       .execution_options(yield_per=EXPORT_BATCH))
+            async for chunk in astream_csv(result, CSV_HEADER, _csv_row, bom=True):
+                yield chunk
+    return StreamedInputFile(chunks, filename=filename)
+
+
+def parquet_export_file(stmt, filename: str) -> StreamedInputFile:
+    """Same rows as csv_export_file(), as Parquet row groups."""
+    async def chunks():
+        async with async_engine.connect() as conn:
+            result = await conn.stream(stmt.order_by(Expense.created_at.desc())
+                                       .execution_options(yield_per=EXPORT_BATCH))
+            async for chunk in astream_parquet(result.partitions()):
+                yield chunk
+    return StreamedInputFile(chunks, filename=filename)
+
+
+@router.callback_query(F.data.in_({'export_all', 'export_all_parquet'}))
+async def export_all(callback: CallbackQuery, user: User | None, lang: str):
+    if user is None:
+        await callback.message.answer(t(lang, "common.profile_missing"))
+        await callback.answer()
+        return
 
-        csv_bytes = build_csv_bytes(expenses)
-        bio = BytesIO(csv_bytes)
-        bio.seek(0)
-        filename = f"expenses_all_{callback.from_user.id}.csv"
-        file = BufferedInputFile(bio.read(), filename=filename)
-        await callback.message.answer_document(file)
+    stmt = _export_query(callback.from_user.id)
+    if not await _has_rows(stmt):
+        await callback.message.answer(t(lang, "export.no_all"))
+        await callback.answer()
+        return
+
+    if callback.data == 'export_all_parquet':
+        file = parquet_export_file(stmt, f"expenses_all_{callback.from_user.id}.parquet")
+    else:
+        file = csv_export_file(stmt, f"expenses_all_{callback.from_user.id}.csv")
+    await callback.message.answer_document(file)
     await callback.answer(t(lang, "export.ready"))
 
 
 @router.callback_query(F.data == 'export_current_month')
-async def export_current_month(callback: CallbackQuery):
+async def export_current_month(callback: CallbackQuery, user: User | None, lang: str):
     now = datetime.now()
     month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     month_end = now
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        if user is None:
-            await callback.message.answer(t(detect_language(callback.from_user.language_code), "common.profile_missing"))
-            await callback.answer()
-            return
-
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
-        expenses = session.query(Expense).filter(
-            Expense.user_id == callback.from_user.id,
-            Expense.created_at >= month_start,
-            Expense.created_at <= month_end
-        ).order_by(Expense.created_at.desc()).all()
+    if user is None:
+        await callback.message.answer(t(lang, "common.profile_missing"))
+        await callback.answer()
+        return
 
-        if not expenses:
-            await callback.message.answer(t(lang, "export.no_month"))
-            await callback.answer()
-            return
+    stmt = _export_query(callback.from_user.id, month_start, month_end)
+    if not await _has_rows(stmt):
+        await callback.message.answer(t(lang, "export.no_month"))
+        await callback.answer()
+        return
 
-        csv_bytes = build_csv_bytes(expenses)
-        bio = BytesIO(csv_bytes)
-        bio.seek(0)
-        filename = f"expenses_{now.strftime('%Y_%m')}_{callback.from_user.id}.csv"
-        file = BufferedInputFile(bio.read(), filename=filename)
-        await callback.message.answer_document(file)
+    filename = f"expenses_{now.strftime('%Y_%m')}_{callback.from_user.id}.csv"
+    await callback.message.answer_document(csv_export_file(stmt, filename))
 
     await callback.answer(t(lang, "export.ready"))
\ No newline at end of file
@@ -1,13 +1,23 @@
+import asyncio
+
 from aiogram import Router, html, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-from datetime import datetime, time, timedelta
-from sqlalchemy import func
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
 
-from databases import get_session, Expense, User
+from databases import get_async_session, Expense, User
+from databases.db import async_engine
+from databases.imports import MAX_IMPORT_BYTES, ExpenseImport
+from databases.rollups import rollup_total_query
+from handlers.middleware import load_user_for_write
+from utils.categories import STRICT_CATEGORY_MAP
+from utils.categorizer import suggest as suggest_category
 from utils.currency import CURRENCY_SYMBOLS
+from utils.export import PARQUET_MAGIC, read_csv, read_parquet
 from utils.keyboards import (
     get_expenses_list_keyboard,
     get_export_keyboard,
@@ -16,8 +26,6 @@ from utils.keyboards import (
     get_pending_expense_currency_keyboard,
 )
 from utils.translations import (
-    detect_language,
-    get_user_language,
     text_options,
     t,
     t_category,
@@ -26,6 +34,7 @@ from utils.translations import (
 router = Router()
 
 BUDGET_THRESHOLDS = [0.6, 0.8, 0.95]
+IMPORT_ERRORS_SHOWN = 10
 
 class ExpenseEditStates(StatesGroup):
     edit_amount = State()
@@ -46,40 +55,6 @@ CURRENCY_SYMBOL_TO_CODE = {
     "£": "GBP",
 }
 
-STRICT_CATEGORY_MAP = {
-    "food": "food",
-    "transport": "transport",
-    "housing": "housing",
-    "entertainment": "entertainment",
-    "beauty": "beauty",
-    "salon": "beauty",
-    "spa": "beauty",
-    "manicure": "beauty",
-    "haircut": "beauty",
-    "краса": "beauty",
-    "салон": "beauty",
-    "манікюр": "beauty",
-    "стрижка": "beauty",
-    "косметика": "beauty",
-    "маникюр": "beauty",
-    "other": "other",
-    "transfer": "transfer",
-    "p2p": "transfer",
-    "перевод": "transfer",
-    "переказ": "transfer",
-    "еда": "food",
-    "пища": "food",
-    "транспорт": "transport",
-    "жилье": "housing",
-    "жильё": "housing",
-    "развлечения": "entertainment",
-    "другое": "other",
-    "їжа": "food",
-    "житло": "housing",
-    "розваги": "entertainment",
-    "інше": "other",
-}
-
 
 def get_currency_symbol(currency: str | None) -> str:
     code = currency or "EUR"
@@ -159,36 +134,35 @@ def parse_strict_category(token: str | None) -> str | None:
 
 
 async def save_expense_from_data(
+    session,
+    user: User | None,
     user_id: int,
     amount: float,
     category: str,
     description: str | None,
     fallback_currency: str | None = None,
 ) -> Expense:
-    with get_session() as session:
-        user = session.query(User).filter(User.id == user_id).first()
-        currency = fallback_currency or (user.currency if user and user.currency else None) or "EUR"
+    currency = fallback_currency or (user.currency if user and user.currency else None) or "EUR"
 
-        new_expense = Expense(
-            user_id=user_id,
-            amount=amount,
-            category=category,
-            currency=currency,
-            description=description,
-        )
-        session.add(new_expense)
-        session.commit()
-        session.refresh(new_expense)
-        return new_expense
+    new_expense = Expense(
+        user_id=user_id,
+        amount=amount,
+        category=category,
+        currency=currency,
+        description=description,
+    )
+    session.add(new_expense)
+    await session.commit()
+    return new_expense
 
 MAX_OVER_LIMIT_WARNINGS = 3
 
-async def get_budget_warnings(user_id: int, session, lang: str) -> list[str]:
+async def get_budget_warnings(user: User | None, session, lang: str) -> list[str]:
     """
     Checks if the user has reached any budget thresholds (60%, 80%, 95%) or exceeded them.
-    Returns a list of localized warning messages.
+    Returns a list of localized warning messages. `user` must belong to `session`:
+    the over-limit counters are written back with it.
     """
-    user = session.query(User).filter(User.id == user_id).first()
     if not user or (not user.daily_budget and not user.weekly_budget):
         return []
 
@@ -196,23 +170,13 @@ async def get_budget_warnings(user_id: int, session, lang: str) -> list[str]:
     today = now.date()
     week_start_date = (now - timedelta(days=now.weekday())).date()
 
-    today_start = datetime.combine(now, time.min)
-    today_end = datetime.combine(now, time.max)
-    week_start = datetime.combine(today_start - timedelta(days=now.weekday()), time.min)
-    week_end = today_end
-
     user_currency = user.currency or "EUR"
     budget_symbol = get_currency_symbol(user_currency)
     warnings = []
 
     # --- Daily budget ---
     if user.daily_budget:
-        daily_total = session.query(func.coalesce(func.sum(Expense.amount), 0.0)).filter(
-            Expense.user_id == user_id,
-            Expense.currency == user_currency,
-            Expense.created_at >= today_start,
-            Expense.created_at <= today_end,
-        ).scalar() or 0.0
+        daily_total = await session.scalar(rollup_total_query(user.id, user_currency, today, today))
 
         if daily_total > user.daily_budget:
             if user.daily_over_limit_date != today:
@@ -236,12 +200,7 @@ async def get_budget_warnings(user_id: int, session, lang: str) -> list[str]:
 
     # --- Weekly budget ---
     if user.weekly_budget:
-        weekly_total = session.query(func.coalesce(func.sum(Expense.amount), 0.0)).filter(
-            Expense.user_id == user_id,
-            Expense.currency == user_currency,
-            Expense.created_at >= week_start,
-            Expense.created_at <= week_end,
-        ).scalar() or 0.0
+        weekly_total = await session.scalar(rollup_total_query(user.id, user_currency, week_start_date, today))
 
         if weekly_total > user.weekly_budget:
             if user.weekly_over_limit_date is None or user.weekly_over_limit_date < week_start_date:
@@ -263,26 +222,22 @@ async def get_budget_warnings(user_id: int, session, lang: str) -> list[str]:
                                       limit=f"{user.weekly_budget:.2f}"))
                     break
 
-    session.commit()
+    await session.commit()
 
     return warnings
 
 
 @router.message(Command("myexpenses"))
 @router.message(F.text.in_(text_options("menu.my_expenses")))
-async def list_expenses(message: Message):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        if user is None:
-            lang = detect_language(message.from_user.language_code)
-            await message.answer(t(lang, "common.profile_missing"))
-            return
-
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
+async def list_expenses(message: Message, user: User | None, lang: str):
+    if user is None:
+        await message.answer(t(lang, "common.profile_missing"))
+        return
 
-        expenses = session.query(Expense).filter(
+    async with get_async_session() as session:
+        expenses = (await session.scalars(select(Expense).where(
             Expense.user_id == message.from_user.id
-        ).order_by(Expense.created_at.desc()).limit(10).all()
+        ).order_by(Expense.created_at.desc()).limit(10))).all()
 
         if not expenses:
             await message.answer(t(lang, "expenses.empty"))
@@ -306,20 +261,54 @@ async def list_expenses(message: Message):
 
 @router.message(Command("export"))
 @router.message(F.text.in_(text_options("menu.export")))
-async def export_menu(message: Message):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
-
+async def export_menu(message: Message, lang: str):
     await message.answer(t(lang, "export.menu_title"), reply_markup=get_export_keyboard(lang))
 
 
-@router.message()
-async def add_expenses(message: Message, state: FSMContext):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
+@router.message(F.document)
+async def import_document(message: Message, user: User | None, lang: str):
+    """A CSV or Parquet file sent to the bot is imported like
+    POST /api/expenses/import."""
+    document = message.document
+    if user is None:
+        await message.answer(t(lang, "common.profile_missing"))
+        return
+    if not (document.file_name or "").lower().endswith((".csv", ".parquet")):
+        await message.answer(t(lang, "import.unsupported"))
+        return
+    if (document.file_size or 0) > MAX_IMPORT_BYTES:
+        await message.answer(t(lang, "import.too_large", mb=MAX_IMPORT_BYTES // 2**20))
+        return
+
+    data = (await message.bot.download(document)).getvalue()
+    job = ExpenseImport(message.from_user.id, user.currency or "EUR")
 
+    def prepare_next(batches):
+        batch = next(batches, None)
+        return None if batch is None else job.prepare(batch)
+
+    # Parsing and validating up to MAX_IMPORT_BYTES is seconds of CPU:
+    # each batch is read and prepared in a thread, so other updates keep
+    # being handled meanwhile.
+    try:
+        batches = await asyncio.to_thread(read_parquet if data[:4] == PARQUET_MAGIC else read_csv, data)
+        async with async_engine.begin() as conn:
+            while (prepared := await asyncio.to_thread(prepare_next, batches)) is not None:
+                await conn.run_sync(job.write, prepared)
+    except ValueError as e:
+        await message.answer(t(lang, "import.invalid", error=html.quote(str(e))))
+        return
+    result = job.result
+
+    text = t(lang, "import.done", imported=result["imported"], skipped=result["skipped"],
+             errors=result["error_count"])
+    lines = [t(lang, "import.error_line", row=e["row"], error=html.quote(e["error"]))
+             for e in result["errors"][:IMPORT_ERRORS_SHOWN]]
+    await message.answer("\n".join([text, *lines]))
+
+
+@router.message()
+async def add_expenses(message: Message, state: FSMContext, lang: str):
     raw_text = message.text or ""
     parts = raw_text.split()
 
@@ -354,6 +343,16 @@ async def add_expenses(message: Message, state: FSMContext):
 
     description = " ".join(parts[2:]) if len(parts) > 2 else None
 
+    guess = None
+    if not category and category_token:
+        # No category typed ("50 uber to airport"): the rest is the
+        # description. A sure guess is saved; an unsure one is only
+        # marked on the keyboard below.
+        guess, sure = suggest_category(" ".join(parts[1:]))
+        description = " ".join(parts[1:])
+        if sure:
+            category = guess
+
     if not category:
         await state.set_state(AddExpenseStates.waiting_for_category)
 
@@ -365,30 +364,33 @@ async def add_expenses(message: Message, state: FSMContext):
 
         await message.answer(
             t(lang, "expenses.invalid_or_missing_category") + "\n" + t(lang, "expenses.choose_category_to_save"),
-            reply_markup=get_pending_expense_category_keyboard(lang),
+            reply_markup=get_pending_expense_category_keyboard(lang, suggested=guess if guess != "other" else None),
         )
         return
 
-    saved_expense = await save_expense_from_data(
-        user_id=message.from_user.id,
-        amount=amount,
-        category=category,
-        description=description,
-        fallback_currency=explicit_currency,
-    )
+    async with get_async_session() as session:
+        db_user = await load_user_for_write(session, message.from_user.id)
+        saved_expense = await save_expense_from_data(
+            session,
+            db_user,
+            user_id=message.from_user.id,
+            amount=amount,
+            category=category,
+            description=description,
+            fallback_currency=explicit_currency,
+        )
 
-    with get_session() as session:
         await message.answer(
             build_saved_text(lang, saved_expense, category, description, use_code=bool(explicit_currency))
         )
 
-        warnings = await get_budget_warnings(message.from_user.id, session, lang)
+        warnings = await get_budget_warnings(db_user, session, lang)
         if warnings:
             await message.answer("\n".join(warnings))
 
 
 @router.callback_query(F.data.startswith("pending_expense_category:"))
-async def pending_expense_category_selected(callback: CallbackQuery, state: FSMContext):
+async def pending_expense_category_selected(callback: CallbackQuery, state: FSMContext, lang: str):
     new_category = callback.data.split(":", 1)[1]
     if new_category not in EXPENSE_CATEGORIES:
         await callback.answer()
@@ -400,9 +402,6 @@ async def pending_expense_category_selected(callback: CallbackQuery, state: FSMC
     explicit_currency = data.get("pending_explicit_currency")
 
     if amount is None:
-        with get_session() as session:
-            user = session.query(User).filter(User.id == callback.from_user.id).first()
-            lang = get_user_language(user, detect_language(callback.from_user.language_code))
         await callback.message.edit_text(t(lang, "expense.cancelled"))
         await state.clear()
         await callback.answer()
@@ -411,13 +410,12 @@ async def pending_expense_category_selected(callback: CallbackQuery, state: FSMC
     if explicit_currency:
         should_ask_currency = False
     else:
-        with get_session() as session:
-            rows = (
-                session.query(Expense.currency)
-                .filter(Expense.user_id == callback.from_user.id)
+        async with get_async_session() as session:
+            rows = (await session.execute(
+                select(Expense.currency)
+                .where(Expense.user_id == callback.from_user.id)
                 .distinct()
-                .all()
-            )
+            )).all()
             known_currencies = [r[0] for r in rows if r[0]]
         should_ask_currency = len(known_currencies) >= 2
 
@@ -425,10 +423,6 @@ async def pending_expense_category_selected(callback: CallbackQuery, state: FSMC
         await state.update_data(pending_category=new_category)
         await state.set_state(AddExpenseStates.waiting_for_currency)
 
-        with get_session() as session:
-            user = session.query(User).filter(User.id == callback.from_user.id).first()
-            lang = get_user_language(user, detect_language(callback.from_user.language_code))
-
         keyboard = get_pending_expense_currency_keyboard(lang)
         await callback.message.edit_text(
             t(lang, "expenses.choose_currency"),
@@ -437,24 +431,23 @@ async def pending_expense_category_selected(callback: CallbackQuery, state: FSMC
         await callback.answer()
         return
 
-    saved_expense = await save_expense_from_data(
-        user_id=callback.from_user.id,
-        amount=float(amount),
-        category=new_category,
-        description=description,
-        fallback_currency=explicit_currency,
-    )
-
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
+    async with get_async_session() as session:
+        db_user = await load_user_for_write(session, callback.from_user.id)
+        saved_expense = await save_expense_from_data(
+            session,
+            db_user,
+            user_id=callback.from_user.id,
+            amount=float(amount),
+            category=new_category,
+            description=description,
+            fallback_currency=explicit_currency,
+        )
 
-    await callback.message.edit_text(
-        build_saved_text(lang, saved_expense, new_category, description, use_code=bool(explicit_currency))
-    )
+        await callback.message.edit_text(
+            build_saved_text(lang, saved_expense, new_category, description, use_code=bool(explicit_currency))
+        )
 
-    with get_session() as session:
-        warnings = await get_budget_warnings(callback.from_user.id, session, lang)
+        warnings = await get_budget_warnings(db_user, session, lang)
         if warnings:
             await callback.message.answer("\n".join(warnings))
 
@@ -463,7 +456,7 @@ async def pending_expense_category_selected(callback: CallbackQuery, state: FSMC
 
 
 @router.callback_query(AddExpenseStates.waiting_for_currency, F.data.startswith("pending_expense_currency:"))
-async def pending_expense_currency_selected(callback: CallbackQuery, state: FSMContext):
+async def pending_expense_currency_selected(callback: CallbackQuery, state: FSMContext, lang: str):
     chosen_currency = callback.data.split(":", 1)[1]
     if chosen_currency not in CURRENCY_CODES:
         await callback.answer()
@@ -475,32 +468,28 @@ async def pending_expense_currency_selected(callback: CallbackQuery, state: FSMC
     category = data.get("pending_category")
 
     if amount is None or category is None:
-        with get_session() as session:
-            user = session.query(User).filter(User.id == callback.from_user.id).first()
-            lang = get_user_language(user, detect_language(callback.from_user.language_code))
         await callback.message.edit_text(t(lang, "expense.cancelled"))
         await state.clear()
         await callback.answer()
         return
 
-    saved_expense = await save_expense_from_data(
-        user_id=callback.from_user.id,
-        amount=float(amount),
-        category=category,
-        description=description,
-        fallback_currency=chosen_currency,
-    )
-
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
+    async with get_async_session() as session:
+        db_user = await load_user_for_write(session, callback.from_user.id)
+        saved_expense = await save_expense_from_data(
+            session,
+            db_user,
+            user_id=callback.from_user.id,
+            amount=float(amount),
+            category=category,
+            description=description,
+            fallback_currency=chosen_currency,
+        )
 
-    await callback.message.edit_text(
-        build_saved_text(lang, saved_expense, category, description, use_code=True)
-    )
+        await callback.message.edit_text(
+            build_saved_text(lang, saved_expense, category, description, use_code=True)
+        )
 
-    with get_session() as session:
-        warnings = await get_budget_warnings(callback.from_user.id, session, lang)
+        warnings = await get_budget_warnings(db_user, session, lang)
         if warnings:
             await callback.message.answer("\n".join(warnings))
 
@@ -509,11 +498,7 @@ async def pending_expense_currency_selected(callback: CallbackQuery, state: FSMC
 
 
 @router.callback_query(F.data == "pending_expense_cancel")
-async def pending_expense_cancel(callback: CallbackQuery, state: FSMContext):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
-        lang = get_user_language(user, detect_language(callback.from_user.language_code))
-
+async def pending_expense_cancel(callback: CallbackQuery, state: FSMContext, lang: str):
     await state.clear()
     await callback.message.edit_text(t(lang, "expenses.add_cancelled"))
     await callback.answer()
\ No newline at end of file
@@ -4,8 +4,10 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from os import getenv
 
-from databases import get_session, User, FeedbackReport
-from utils.translations import t, get_user_language, detect_language
+from sqlalchemy import func, select
+
+from databases import get_async_session, User, FeedbackReport
+from utils.translations import t, get_user_language
 
 router = Router()
 ADMIN_ID = int(getenv("ADMIN_ID", "0"))
@@ -16,28 +18,23 @@ class FeedbackStates(StatesGroup):
 
 
 @router.message(F.text.in_({"🐛 Feedback", "🐛 Обратная связь", "🐛 Зворотній зв'язок"}))
-async def feedback_start(message: Message, state: FSMContext):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
-
+async def feedback_start(message: Message, state: FSMContext, lang: str):
     await state.set_state(FeedbackStates.waiting_for_feedback)
     await message.answer(t(lang, "feedback.prompt"))
 
 
 @router.message(FeedbackStates.waiting_for_feedback)
-async def feedback_received(message: Message, state: FSMContext):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
-
+async def feedback_received(message: Message, state: FSMContext, lang: str):
+    async with get_async_session() as session:
         report = FeedbackReport(user_id=message.from_user.id, text=message.text)
         session.add(report)
-        session.commit()
+        await session.commit()
 
-        unread_count = session.query(FeedbackReport).filter(FeedbackReport.is_read == False).count()
+        unread_count = await session.scalar(
+            select(func.count(FeedbackReport.id)).where(FeedbackReport.is_read == False)  # noqa: E712
+        )
 
-        admin = session.query(User).filter(User.id == ADMIN_ID).first()
+        admin = await session.get(User, ADMIN_ID)
         admin_lang = get_user_language(admin, "en")
 
     await state.clear()
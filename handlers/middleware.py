@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import time
+from os import getenv
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from databases import get_async_session, User
+from utils.translations import detect_language, get_user_language
+
+logger = logging.getLogger(__name__)
+
+# user id → (User row, fetched-at monotonic ts). Handlers only read from the
+# cached row; anything that writes the user loads a fresh one in its own
+# session and calls invalidate_user() after committing. The Mini App edits
+# users from another process, so the TTL bounds how stale a row can get.
+_user_cache: dict[int, tuple[User, float]] = {}
+USER_CACHE_TTL = float(getenv("USER_CACHE_TTL", "30"))  # seconds
+_USER_CACHE_MAX = 10_000
+# user id → in-flight load, so a burst of updates from one user shares a query.
+_user_loads: dict[int, asyncio.Task] = {}
+# user id → bumped by every invalidate_user(). A load that started before
+# the bump may have read the row from before the write, so it isn't cached.
+_user_generations: dict[int, int] = {}
+
+
+def invalidate_user(user_id: int) -> None:
+    _user_generations[user_id] = _user_generations.get(user_id, 0) + 1
+    _user_cache.pop(user_id, None)
+    _user_loads.pop(user_id, None)
+
+
+async def _fetch_user(user_id: int) -> User | None:
+    async with get_async_session() as session:
+        return await session.get(User, user_id)
+
+
+def _forget_load(user_id: int, task: asyncio.Task) -> None:
+    # An invalidation may already have replaced it with a newer load.
+    if _user_loads.get(user_id) is task:
+        del _user_loads[user_id]
+
+
+async def load_user(user_id: int) -> User | None:
+    now = time.monotonic()
+    cached = _user_cache.get(user_id)
+    if cached is not None and now - cached[1] < USER_CACHE_TTL:
+        return cached[0]
+
+    generation = _user_generations.get(user_id, 0)
+    task = _user_loads.get(user_id)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_user(user_id))
+        _user_loads[user_id] = task
+        task.add_done_callback(lambda done: _forget_load(user_id, done))
+    user = await asyncio.shield(task)
+    if _user_generations.get(user_id, 0) != generation:
+        # Invalidated while we waited: fine for this update, not for the cache.
+        return user
+    if user is None:
+        # Not cached: onboarding is about to create the row.
+        _user_cache.pop(user_id, None)
+        return None
+
+    if len(_user_cache) >= _USER_CACHE_MAX:
+        for uid, (_, fetched_at) in list(_user_cache.items()):
+            if now - fetched_at >= USER_CACHE_TTL:
+                del _user_cache[uid]
+        if len(_user_cache) >= _USER_CACHE_MAX:
+            _user_cache.clear()
+    _user_cache[user_id] = (user, now)
+    return user
+
+
+async def load_user_for_write(session, user_id: int) -> User | None:
+    """The user's row read in `session`, for a handler that decides from
+    it or writes to it (the expense currency, the budget counters): the
+    cached row may be up to USER_CACHE_TTL old and belongs to no session.
+    One query per call; invalidate_user() after committing a user change."""
+    return await session.get(User, user_id)
+
+
+class UserContextMiddleware(BaseMiddleware):
+    """Loads the sender's User row once per update and hands handlers
+    `user` (None before onboarding) and `lang` as keyword arguments."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        if from_user is not None:
+            user = await load_user(from_user.id)
+            data["user"] = user
+            data["lang"] = get_user_language(user, detect_language(from_user.language_code))
+        return await handler(event, data)
+
+
+class FSMFlushMiddleware(BaseMiddleware):
+    """Writes the FSM changes an update made once it has been handled, so
+    the next update finds them whichever worker takes it. Storages without
+    a write buffer are left alone."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            flush = getattr(data.get("fsm_storage"), "flush", None)
+            if flush is not None:
+                try:
+                    await flush()
+                except Exception:
+                    # Still buffered; the next update's flush retries it.
+                    logger.exception("fsm flush failed")
@@ -5,7 +5,8 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.enums import ChatAction
 
-from databases import get_session, User
+from databases import get_async_session, User
+from handlers.middleware import invalidate_user
 from utils.keyboards import get_currency_keyboard, get_language_keyboard, get_main_menu
 from utils.translations import t
 from utils.currency import CURRENCY_SYMBOLS
@@ -36,8 +37,8 @@ async def onboarding_language_selected(callback: CallbackQuery, state: FSMContex
 
     await state.update_data(language=selected_lang)
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
+    async with get_async_session() as session:
+        user = await session.get(User, callback.from_user.id)
         if user is None:
             user = User(
                 id=callback.from_user.id,
@@ -49,7 +50,8 @@ async def onboarding_language_selected(callback: CallbackQuery, state: FSMContex
             session.add(user)
         else:
             user.language = selected_lang
-        session.commit()
+        await session.commit()
+    invalidate_user(callback.from_user.id)
 
     await callback.answer()
     await callback.message.delete()
@@ -99,11 +101,12 @@ async def onboarding_currency_selected(callback: CallbackQuery, state: FSMContex
     data = await state.get_data()
     lang = data.get("language", "en")
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == callback.from_user.id).first()
+    async with get_async_session() as session:
+        user = await session.get(User, callback.from_user.id)
         if user:
             user.currency = currency
-            session.commit()
+            await session.commit()
+    invalidate_user(callback.from_user.id)
 
     await state.clear()
 
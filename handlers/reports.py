@@ -3,30 +3,35 @@ from aiogram.filters import Command
 from aiogram.types import Message
 from collections import defaultdict
 
-from databases import get_session, Expense, User
+from sqlalchemy import select
+
+from databases import get_async_session, Expense
 from datetime import datetime, time, timedelta
-import pandas as pd
-import matplotlib.pyplot as plt
 
-from io import BytesIO
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import BufferedInputFile
 
+from utils.charts import ChartBusy, ChartCache, ChartTimeout, render_category_pie, render_chart
 from utils.currency import CURRENCY_SYMBOLS
-from utils.translations import detect_language, get_user_language, text_options, t, t_category, TRANSLATIONS, DEFAULT_LANGUAGE
+from utils.translations import text_options, t, t_category, TRANSLATIONS, DEFAULT_LANGUAGE
 
 router = Router()
 
+# Category pies by (user, currency, totals, language, dates): a repeat tap
+# with unchanged expenses re-sends the uploaded file instead of re-rendering.
+chart_cache = ChartCache()
+
 def get_currency_symbol(currency: str | None) -> str:
     code = currency or "EUR"
     return CURRENCY_SYMBOLS.get(code, code)
 
-def get_expenses_by_period(user_id: int, start_date: datetime, end_date: datetime) -> list:
-    with get_session() as session:
-        expenses = session.query(Expense).filter(
+async def get_expenses_by_period(user_id: int, start_date: datetime, end_date: datetime) -> list:
+    async with get_async_session() as session:
+        expenses = (await session.scalars(select(Expense).where(
             Expense.user_id == user_id,
             Expense.created_at >= start_date,
             Expense.created_at <= end_date
-        ).all()
+        ))).all()
         return expenses
 
 def build_expense_report(expenses: list, title: str, largest_expense_title: str, lang: str) -> str:
@@ -85,14 +90,11 @@ def build_expense_report(expenses: list, title: str, largest_expense_title: str,
 
 @router.message(Command("today"))
 @router.message(F.text.in_(text_options("menu.today")))
-async def daily_report(message: Message):
+async def daily_report(message: Message, lang: str):
     today_start = datetime.combine(datetime.now(), time.min)
     today_end = datetime.combine(datetime.now(), time.max)
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
-    expenses = get_expenses_by_period(message.from_user.id, today_start, today_end)
+    expenses = await get_expenses_by_period(message.from_user.id, today_start, today_end)
 
     if not expenses:
         await message.answer(t(lang, "reports.no_today"))
@@ -112,15 +114,12 @@ async def daily_report(message: Message):
 
 @router.message(Command("week"))
 @router.message(F.text.in_(text_options("menu.week")))
-async def weekly_report(message: Message):
+async def weekly_report(message: Message, lang: str):
     today_start = datetime.combine(datetime.now(), time.min)
     week_start = today_start - timedelta(days=datetime.now().weekday())
     week_end = datetime.combine(datetime.now(), time.max)
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
-    expenses = get_expenses_by_period(message.from_user.id, week_start, week_end)
+    expenses = await get_expenses_by_period(message.from_user.id, week_start, week_end)
 
     if not expenses:
         await message.answer(t(lang, "reports.no_week"))
@@ -138,59 +137,65 @@ async def weekly_report(message: Message):
 
 @router.message(Command("categories"))
 @router.message(F.text.in_(text_options("menu.categories")))
-async def button_categories(message: Message):
+async def button_categories(message: Message, lang: str):
     month_start = datetime.combine(datetime.now().replace(day=1), time.min)
     month_end = datetime.now()
     start_str = month_start.strftime("%d.%m")
     end_str = month_end.strftime("%d.%m")
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
-        expenses = session.query(Expense).filter(
+    async with get_async_session() as session:
+        expenses = (await session.scalars(select(Expense).where(
             Expense.user_id == message.from_user.id,
             Expense.created_at >= month_start,
             Expense.created_at <= month_end
-        ).all()
-
-        if not expenses:
-            await message.answer(t(lang, "reports.no_month"))
-            return
+        ))).all()
 
-        expenses_by_currency = defaultdict(list)
-        for expense in expenses:
-            expenses_by_currency[expense.currency or "EUR"].append(expense)
-
-        await message.answer(t(lang, "reports.chart_caption", start=start_str, end=end_str))
+    if not expenses:
+        await message.answer(t(lang, "reports.no_month"))
+        return
 
-        for currency in sorted(expenses_by_currency):
-            currency_symbol = get_currency_symbol(currency)
-            currency_expenses = expenses_by_currency[currency]
-            data = [(e.category, e.amount) for e in currency_expenses]
+    expenses_by_currency = defaultdict(list)
+    for expense in expenses:
+        expenses_by_currency[expense.currency or "EUR"].append(expense)
 
-            df_expenses = pd.DataFrame(data, columns=["category", "amount"])
-            category_totals = df_expenses.groupby("category")["amount"].sum()
+    await message.answer(t(lang, "reports.chart_caption", start=start_str, end=end_str))
 
-            plt.figure(figsize=(8, 8), dpi=300)
+    for currency in sorted(expenses_by_currency):
+        currency_symbol = get_currency_symbol(currency)
+        currency_expenses = expenses_by_currency[currency]
+        sums = defaultdict(float)
+        for e in currency_expenses:
+            sums[e.category or "other"] += e.amount
+        # Sorted by category, the order the pie has always been drawn in.
+        category_totals = dict(sorted(sums.items()))
+
+        key = chart_cache.key(message.from_user.id, currency,
+                              [(cat, round(amount, 2)) for cat, amount in category_totals.items()],
+                              lang, start_str, end_str)
+        png, file_id = chart_cache.get(key)
+        if file_id:
+            try:
+                await message.answer_photo(file_id)
+                continue
+            except TelegramBadRequest:
+                chart_cache.forget_file_id(key)
+
+        if png is None:
             labels = [
                 f"{t_category(lang, cat)}: {amount:.0f}{currency_symbol}"
                 for cat, amount in category_totals.items()
             ]
-
-            category_totals.plot(
-                kind="pie",
-                autopct="%1.0f%%",
-                colors=["#FF6B6B", "#4ECDC4", "#45B7D1", "#FFA07A", "#98D8C8"],
-                labels=labels
-            )
-
-            plt.title(t(lang, "reports.chart_title_currency", start=start_str, end=end_str, currency=currency))
-            plt.ylabel("")
-
-            buffer = BytesIO()
-            plt.savefig(buffer, format="png")
-            buffer.seek(0)
-            plt.close()
-
-            photo = BufferedInputFile(buffer.read(), filename=f"categories_{currency}.png")
-            await message.answer_photo(photo)
+            title = t(lang, "reports.chart_title_currency", start=start_str, end=end_str, currency=currency)
+            try:
+                png = await render_chart(
+                    render_category_pie, list(category_totals.values()), labels, title
+                )
+            except (ChartBusy, ChartTimeout):
+                await message.answer(t(lang, "reports.chart_busy"))
+                return
+            chart_cache.put(key, png)
+
+        photo = BufferedInputFile(png, filename=f"categories_{currency}.png")
+        sent = await message.answer_photo(photo)
+        if sent is not None and sent.photo:
+            chart_cache.remember_file_id(key, sent.photo[-1].file_id)
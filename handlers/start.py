@@ -3,41 +3,40 @@ from aiogram.filters import CommandStart, Command
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
 from aiogram.fsm.context import FSMContext
 
-from databases import get_session, User
+from databases import get_async_session, User
 from utils.keyboards import get_main_menu, get_settings_keyboard, get_currency_keyboard
+from handlers.middleware import invalidate_user
 from handlers.onboarding import start_onboarding
 from utils.currency import CURRENCY_MAP
-from utils.translations import detect_language, get_user_language, text_options, t
+from utils.translations import text_options, t
 
 router = Router()
 
 
 @router.message(CommandStart())
-async def command_start_handler(message: Message, state: FSMContext) -> None:
+async def command_start_handler(message: Message, state: FSMContext, user: User | None, lang: str) -> None:
     await state.clear()
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        if user:
-            # Receiving any message means Telegram delivered ours — so if we
-            # previously marked them blocked, that flag is stale. Clear it.
-            if user.is_blocked:
-                user.is_blocked = False
-                session.commit()
-            lang = get_user_language(user, detect_language(message.from_user.language_code))
-            await message.answer(
-                t(lang, "start.welcome_back", name=html.bold(message.from_user.full_name)),
-                reply_markup=get_main_menu(lang)
-            )
-        else:
-            await start_onboarding(message, state)
+    if user:
+        # Receiving any message means Telegram delivered ours — so if we
+        # previously marked them blocked, that flag is stale. Clear it.
+        if user.is_blocked:
+            async with get_async_session() as session:
+                fresh = await session.get(User, user.id)
+                if fresh:
+                    fresh.is_blocked = False
+                    await session.commit()
+            invalidate_user(user.id)
+        await message.answer(
+            t(lang, "start.welcome_back", name=html.bold(message.from_user.full_name)),
+            reply_markup=get_main_menu(lang)
+        )
+    else:
+        await start_onboarding(message, state)
 
 
 @router.message(Command("setcurrency"))
-async def command_set_currency_handler(message: Message):
+async def command_set_currency_handler(message: Message, lang: str):
     parts = message.text.split()
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
 
     if len(parts) < 2:
         await message.answer(
@@ -53,11 +52,12 @@ async def command_set_currency_handler(message: Message):
         await message.answer(t(lang, "currency.unknown", supported="EUR, USD, UAH, GBP"))
         return
 
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
+    async with get_async_session() as session:
+        user = await session.get(User, message.from_user.id)
         if user:
             user.currency = user_currency
-            session.commit()
+            await session.commit()
+            invalidate_user(user.id)
             await message.answer(t(lang, "currency.updated", currency=user_currency))
         else:
             await message.answer(t(lang, "common.profile_missing"))
@@ -65,20 +65,12 @@ async def command_set_currency_handler(message: Message):
 
 @router.message(Command("help"))
 @router.message(F.text.in_(text_options("menu.help")))
-async def command_help_handler(message: Message):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
-
+async def command_help_handler(message: Message, lang: str):
     await message.answer(t(lang, "help.text"))
 
 
 @router.message(Command("app"))
-async def command_app_handler(message: Message):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
-    
+async def command_app_handler(message: Message, lang: str):
     kb = InlineKeyboardMarkup(inline_keyboard=[[
         InlineKeyboardButton(
             text="📊 Open Moneylytics",
@@ -90,9 +82,5 @@ async def command_app_handler(message: Message):
 
 @router.message(Command("settings"))
 @router.message(F.text.in_(text_options("menu.settings")))
-async def button_settings(message: Message):
-    with get_session() as session:
-        user = session.query(User).filter(User.id == message.from_user.id).first()
-        lang = get_user_language(user, detect_language(message.from_user.language_code))
-
+async def button_settings(message: Message, lang: str):
     await message.answer(t(lang, "settings.choose"), reply_markup=get_settings_keyboard(lang))
\ No newline at end of file
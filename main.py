@@ -15,21 +15,40 @@ from handlers.budget import router as budget_router
 from handlers.callbacks import router as callbacks_router
 from handlers.feedback import router as feedback_router
 from handlers.admin import router as admin_router
+from handlers.broadcast import broadcast_worker, shutdown_broadcasts
+from handlers.middleware import FSMFlushMiddleware, UserContextMiddleware
 
 from databases import init_db
+from databases.fsm_storage import SQLAlchemyStorage, fsm_state_sweeper, make_fsm_storage
+from databases.mono_accounts import mono_account_refresher
+from databases.mono_backfill import mono_backfill_worker
+from databases.mono_events import mono_event_worker
+from utils.bot_webhook import run_webhook
+from utils.categorizer import load_model
+from utils.charts import shutdown_chart_pool
+from utils.mono import close_mono_client
+from databases.subscriptions import subscription_sweeper
 
 load_dotenv()
 
 TOKEN = getenv("BOT_TOKEN")
+BOT_MODE = getenv("BOT_MODE", "polling")  # or "webhook", see utils/bot_webhook.py
 
 if not TOKEN:
     raise ValueError("BOT_TOKEN not found in .env file")
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError(f"BOT_MODE must be 'polling' or 'webhook', not {BOT_MODE!r}")
 
-dp = Dispatcher()
+# Conversation state lives in the database (or Redis), so any worker can
+# take a user's next update and a restart doesn't drop it.
+dp = Dispatcher(storage=make_fsm_storage())
 
 async def main() -> None:
     init_db()
+    load_model()
     bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    dp.update.outer_middleware(UserContextMiddleware())
+    dp.update.outer_middleware(FSMFlushMiddleware())
     dp.include_router(router)
     dp.include_router(onboarding_router)
     dp.include_router(callbacks_router)
@@ -38,7 +57,40 @@ async def main() -> None:
     dp.include_router(feedback_router)
     dp.include_router(admin_router)
     dp.include_router(expenses_router)
-    await dp.start_polling(bot)
+    # Charges due subscriptions in the background; safe to run on several
+    # worker dynos at once.
+    sweeper = asyncio.create_task(subscription_sweeper())
+    # Keeps the Monobank account → user mapping used by the webhook current.
+    mono_refresher = asyncio.create_task(mono_account_refresher())
+    # Applies queued Monobank webhook deliveries; safe on several dynos.
+    mono_events = asyncio.create_task(mono_event_worker())
+    # Imports statement history for newly connected Monobank accounts.
+    mono_backfill = asyncio.create_task(mono_backfill_worker())
+    # Picks up admin broadcasts a stopped or crashed process left unfinished.
+    broadcasts = asyncio.create_task(broadcast_worker(bot))
+    # Deletes conversation states abandoned for longer than FSM_STATE_TTL.
+    fsm_sweeper = (asyncio.create_task(fsm_state_sweeper())
+                   if isinstance(dp.storage, SQLAlchemyStorage) else None)
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            # A webhook left registered by an earlier BOT_MODE=webhook run
+            # makes getUpdates fail with 409 Conflict. Updates Telegram
+            # queued for it are kept and delivered to polling instead.
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        sweeper.cancel()
+        mono_refresher.cancel()
+        mono_events.cancel()
+        mono_backfill.cancel()
+        if fsm_sweeper is not None:
+            fsm_sweeper.cancel()
+        broadcasts.cancel()
+        await shutdown_broadcasts()
+        await close_mono_client()
+        shutdown_chart_pool()
 
 
 if __name__ == "__main__":
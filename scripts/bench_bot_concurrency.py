@@ -0,0 +1,189 @@
+"""Load test for the bot worker: concurrent "add expense" message throughput.
+
+Feeds fake Telegram updates ("12.5 food pizza") from many users through the
+real Dispatcher and routers, with the Bot API stubbed out, against a
+throwaway SQLite database whose every statement is slowed down by --latency
+to stand in for a remote Postgres round trip. Reports updates/second and
+the worst event-loop stall seen while the load runs, plus SQL statements
+and `users` reads per update. Run from the repo root:
+
+    python scripts/bench_bot_concurrency.py [--users 50] [--messages 4] [--latency 0.005]
+"""
+
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}"
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+
+from aiogram import Bot, Dispatcher  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.methods import SendMessage  # noqa: E402
+from aiogram.types import Chat, Message, Update  # noqa: E402
+from sqlalchemy import create_engine, event  # noqa: E402
+
+import databases.db as db  # noqa: E402
+from databases.models import Expense, User  # noqa: E402
+
+LATENCY = 0.005
+STATEMENTS = {"total": 0, "users": 0}
+
+
+class _SlowCursor(sqlite3.Cursor):
+    def execute(self, *args, **kwargs):
+        time.sleep(LATENCY)
+        return super().execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        time.sleep(LATENCY)
+        return super().executemany(*args, **kwargs)
+
+
+class _SlowConnection(sqlite3.Connection):
+    def cursor(self, factory=_SlowCursor):
+        return super().cursor(factory)
+
+
+class _StubSession(BaseSession):
+    """Answers every Bot API call locally instead of hitting Telegram."""
+
+    async def make_request(self, bot, method, timeout=None):
+        if isinstance(method, SendMessage):
+            return Message(
+                message_id=1, date=datetime.now(),
+                chat=Chat(id=method.chat_id, type="private"), text=method.text,
+            )
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def _count_statements(conn, cursor, statement, parameters, context, executemany):
+    STATEMENTS["total"] += 1
+    if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+        STATEMENTS["users"] += 1
+
+
+def _slow_engines() -> None:
+    """Point the sync (and, when present, async) session factories at
+    engines whose connections sleep before every statement."""
+    url = os.environ["DATABASE_URL"]
+    sync_engine = create_engine(url, connect_args={"factory": _SlowConnection})
+    db.SessionLocal.configure(bind=sync_engine)
+    if hasattr(db, "AsyncSessionLocal"):
+        from sqlalchemy.ext.asyncio import create_async_engine
+        async_url = url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+        async_engine = create_async_engine(async_url, connect_args={"factory": _SlowConnection})
+        db.AsyncSessionLocal.configure(bind=async_engine)
+        sync_engine = async_engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _count_statements)
+
+
+def _dispatcher() -> Dispatcher:
+    # Same routers, same order as main.py.
+    from handlers.start import router
+    from handlers.onboarding import router as onboarding_router
+    from handlers.reports import router as reports_router
+    from handlers.expenses import router as expenses_router
+    from handlers.budget import router as budget_router
+    from handlers.callbacks import router as callbacks_router
+    from handlers.feedback import router as feedback_router
+    from handlers.admin import router as admin_router
+
+    dp = Dispatcher()
+    try:
+        from handlers.middleware import UserContextMiddleware
+        dp.update.outer_middleware(UserContextMiddleware())
+    except ImportError:
+        pass
+    for r in (router, onboarding_router, callbacks_router, budget_router,
+              reports_router, feedback_router, admin_router, expenses_router):
+        dp.include_router(r)
+    return dp
+
+
+def _update(update_id: int, user_id: int) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "U", "language_code": "en"},
+            "text": "12.5 food pizza",
+        },
+    })
+
+
+async def _run(users: int, messages: int) -> None:
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=_StubSession())
+    dp = _dispatcher()
+    updates = [_update(i, 1000 + i % users) for i in range(users * messages)]
+
+    max_lag = 0.0
+    stop = asyncio.Event()
+
+    async def watch_loop():
+        nonlocal max_lag
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.01)
+            max_lag = max(max_lag, time.perf_counter() - t0 - 0.01)
+
+    watcher = asyncio.create_task(watch_loop())
+    t0 = time.perf_counter()
+    # dp.start_polling hands each fetched update to its own task; mirror that.
+    await asyncio.gather(*(dp.feed_update(bot, u) for u in updates))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await watcher
+
+    total = len(updates)
+    print(f"updates={total} users={users} latency={LATENCY * 1000:.1f}ms/statement")
+    print(f"elapsed={elapsed:.2f}s throughput={total / elapsed:.1f} updates/s "
+          f"max_loop_stall={max_lag * 1000:.0f}ms")
+    print(f"statements/update={STATEMENTS['total'] / total:.1f} "
+          f"user_reads/update={STATEMENTS['users'] / total:.1f}")
+
+
+def main() -> None:
+    global LATENCY
+    parser = argparse.ArgumentParser(description="Concurrent message throughput of the bot")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=4, help="messages per user")
+    parser.add_argument("--latency", type=float, default=0.005,
+                        help="seconds added to every SQL statement")
+    args = parser.parse_args()
+    LATENCY = args.latency
+
+    db.init_db()
+    with db.get_session() as s:
+        s.add_all(User(id=1000 + i, first_name="U", currency="EUR", language="en")
+                  for i in range(args.users))
+        s.commit()
+    _slow_engines()
+
+    try:
+        asyncio.run(_run(args.users, args.messages))
+        with db.get_session() as s:
+            print(f"expenses saved={s.query(Expense).count()}")
+    finally:
+        os.unlink(_tmp.name)
+
+
+if __name__ == "__main__":
+    main()
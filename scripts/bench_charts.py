@@ -0,0 +1,103 @@
+"""Benchmark for the /categories pie chart: event-loop blocking and latency.
+
+Renders --charts pie charts concurrently, first the old way (global
+pyplot, inline on the event loop) and then through the chart
+process pool, while a heartbeat task measures how late the loop wakes it
+up. Reports per-chart latency and the worst loop stall for each. Run from
+the repo root:
+
+    python scripts/bench_charts.py [--charts 8] [--workers 2]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils import charts  # noqa: E402
+
+TOTALS = {"entertainment": 61.0, "food": 412.5, "housing": 900.0, "other": 35.2, "transport": 88.0}
+TITLE = "Expenses by Category (01.06 - 17.06) - EUR"
+
+
+def render_inline_pyplot() -> bytes:
+    """The previous implementation, kept here as the baseline."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(8, 8), dpi=300)
+    labels = [f"{cat}: {amount:.0f}€" for cat, amount in TOTALS.items()]
+    plt.pie(list(TOTALS.values()), autopct="%1.0f%%", colors=charts.PIE_COLORS, labels=labels)
+    plt.title(TITLE)
+    plt.ylabel("")
+    buffer = BytesIO()
+    plt.savefig(buffer, format="png")
+    plt.close()
+    return buffer.getvalue()
+
+
+async def _heartbeat(stalls: list, stop: asyncio.Event, tick: float = 0.005) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(tick)
+        stalls.append(time.perf_counter() - started - tick)
+
+
+async def run(label: str, render, n: int) -> None:
+    stalls: list[float] = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(_heartbeat(stalls, stop))
+    latencies: list[float] = []
+
+    async def one():
+        started = time.perf_counter()
+        png = await render()
+        assert png.startswith(b"\x89PNG")
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    wall = time.perf_counter() - started
+    stop.set()
+    await beat
+    latencies.sort()
+    print(f"{label:>22}: wall {wall:5.2f}s  chart p50 {statistics.median(latencies) * 1000:6.0f} ms"
+          f"  p95 {latencies[int(0.95 * (len(latencies) - 1))] * 1000:6.0f} ms"
+          f"  max loop stall {max(stalls, default=0) * 1000:6.0f} ms")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark pie chart rendering")
+    parser.add_argument("--charts", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=charts.CHART_WORKERS)
+    args = parser.parse_args()
+    charts.CHART_WORKERS = args.workers
+    charts.CHART_QUEUE_SIZE = max(charts.CHART_QUEUE_SIZE, args.charts)
+
+    async def inline():
+        return render_inline_pyplot()
+
+    values, labels = list(TOTALS.values()), [f"{c}: {a:.0f}€" for c, a in TOTALS.items()]
+
+    async def pooled():
+        return await charts.render_chart(charts.render_category_pie, values, labels, TITLE)
+
+    render_inline_pyplot()  # import + font cache, so neither run pays it
+    charts.start_chart_pool()
+    await pooled()
+    try:
+        await run("inline pyplot (before)", inline, args.charts)
+        await run(f"process pool x{args.workers}", pooled, args.charts)
+    finally:
+        charts.shutdown_chart_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,156 @@
+"""Export → import round trip for every export format, with timings.
+
+Seeds a throwaway SQLite database with one user's history, exports it as
+the Mini App's CSV, the bot's CSV and (when pyarrow is installed) Parquet,
+and loads each file through POST /api/expenses/import into a fresh user.
+Every row must come back unchanged (to the minute for the Mini App CSV,
+which has no seconds). Importing each file a second time, and the bot's
+CSV into its own user, must skip every row. Run from the repo root:
+
+    python scripts/bench_export.py [--rows 20000]
+
+Exits non-zero when a round trip loses or changes anything.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+_tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}"
+os.environ.setdefault("BOT_TOKEN", "bench:token")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+from databases.db import engine, get_session  # noqa: E402
+from databases.models import User, Expense  # noqa: E402
+from handlers.callbacks import csv_export_file, _export_query  # noqa: E402
+import webapp  # noqa: E402
+
+SOURCE = 1
+CURRENCIES = ("EUR", "USD", "UAH")
+CATEGORIES = ("food", "transport", "housing", "entertainment", "beauty", "other")
+DESCRIPTIONS = ("coffee", "uber, airport", 'the "good" pizza', "оренда", "", "ikea; shelves")
+
+
+def seed(rows: int) -> None:
+    rnd = random.Random(42)
+    now = datetime.now().replace(microsecond=0)
+    with get_session() as s:
+        s.add_all(User(id=uid, first_name="Bench", currency="EUR", language="en") for uid in range(1, 5))
+        s.commit()
+        s.add_all(
+            Expense(
+                user_id=SOURCE,
+                amount=round(rnd.uniform(1, 200), 2),
+                category=rnd.choice(CATEGORIES),
+                currency=rnd.choice(CURRENCIES),
+                description=rnd.choice(DESCRIPTIONS) or None,
+                created_at=now - timedelta(seconds=rnd.randint(0, 90 * 24 * 3600)),
+            )
+            for _ in range(rows)
+        )
+        s.commit()
+
+
+def expenses(user_id: int, minutes: bool = False) -> Counter:
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(Expense.amount, Expense.currency, Expense.category, Expense.description, Expense.created_at)
+            .where(Expense.user_id == user_id)
+        ).all()
+    return Counter(
+        (amount, currency, category, description or None,
+         created_at.replace(second=0) if minutes else created_at)
+        for amount, currency, category, description, created_at in rows
+    )
+
+
+def as_user(user_id: int) -> None:
+    webapp.app.dependency_overrides[webapp.get_current_user_id] = lambda: user_id
+
+
+def bot_csv() -> bytes:
+    async def read():
+        upload = csv_export_file(_export_query(SOURCE), "export.csv")
+        return b"".join([chunk async for chunk in upload.read(None)])
+    return asyncio.run(read())
+
+
+def import_file(client: TestClient, user_id: int, data: bytes, name: str) -> tuple[dict, float]:
+    as_user(user_id)
+    t0 = time.perf_counter()
+    res = client.post("/api/expenses/import", files={"file": (name, data)})
+    elapsed = time.perf_counter() - t0
+    if res.status_code != 200:
+        # The whole file was refused: report it as the round trip failing.
+        return {"imported": 0, "skipped": 0, "error_count": 1,
+                "errors": [{"status": res.status_code, **res.json()}]}, elapsed
+    return res.json(), elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    failures = 0
+
+    def check(label: str, ok: bool, detail: str = "") -> None:
+        nonlocal failures
+        failures += not ok
+        print(f"  {'ok' if ok else 'FAIL':<4} {label}{': ' + detail if detail and not ok else ''}")
+
+    with TestClient(webapp.app) as client:
+        seed(args.rows)
+        print(f"rows={args.rows}")
+
+        exports = []
+        as_user(SOURCE)
+        t0 = time.perf_counter()
+        exports.append(("mini app csv", 2, client.get("/api/expenses/export").content,
+                        time.perf_counter() - t0, True))
+        t0 = time.perf_counter()
+        exports.append(("bot csv", 3, bot_csv(), time.perf_counter() - t0, False))
+        if importlib.util.find_spec("pyarrow") is None:
+            print("parquet: skipped, pyarrow is not installed")
+        else:
+            t0 = time.perf_counter()
+            exports.append(("parquet", 4, client.get("/api/expenses/export?format=parquet").content,
+                            time.perf_counter() - t0, False))
+
+        for label, target, data, export_s, minutes in exports:
+            result, import_s = import_file(client, target, data, label.replace(" ", "_"))
+            print(f"{label:<13} {len(data) / 1024:8.0f} KiB  export={export_s * 1000:.0f}ms  "
+                  f"import={import_s * 1000:.0f}ms")
+            check("every row imported", result["imported"] == args.rows and not result["error_count"],
+                  str({k: result[k] for k in ("imported", "skipped", "error_count")}
+                      | {"first_errors": result["errors"][:3]}))
+            check("rows unchanged", expenses(target, minutes) == expenses(SOURCE, minutes))
+            # The restored rows have new ids: only their contents match.
+            result, _ = import_file(client, target, data, label.replace(" ", "_"))
+            check("every row skipped on a second import",
+                  result["skipped"] == args.rows and not result["imported"], str(result)[:300])
+
+        result, _ = import_file(client, SOURCE, exports[1][2], "bot_csv")
+        print("bot csv into its own user")
+        check("every row skipped", result["skipped"] == args.rows and not result["imported"], str(result))
+
+    os.unlink(_tmp.name)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
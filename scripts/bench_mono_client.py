@@ -0,0 +1,106 @@
+"""Check and benchmark the pooled Monobank client against scripts/fake_mono.py.
+
+Starts the fake API in-process and verifies that concurrent client-info
+calls for one token coalesce into a single request, that the per-token
+limiter refuses (or waits out) a second call inside the rate period without
+Monobank ever answering 429, and then compares webhook-call throughput of
+the keep-alive client with a fresh connection per call. Run from the repo
+root:
+
+    python scripts/bench_mono_client.py [--calls 300] [--concurrency 20] [--latency 0.01]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+from fake_mono import start_fake_mono  # noqa: E402
+from utils.mono import MonoClient, MonoRateLimited  # noqa: E402
+
+RATE_PERIOD = 1.0  # seconds; Monobank's is 60, shortened so the run is quick
+
+
+async def check_coalescing(client: MonoClient, calls: dict) -> None:
+    results = await asyncio.gather(*[client.request("/personal/client-info", "tok-1")
+                                     for _ in range(50)])
+    assert all(r == results[0] for r in results), "coalesced callers got different answers"
+    assert calls["client-info"] == 1, f"expected 1 upstream call, got {calls['client-info']}"
+    print(f"coalescing: 50 concurrent callers -> {calls['client-info']} upstream call")
+
+
+async def check_limiter(client: MonoClient, calls: dict) -> None:
+    try:
+        await client.request("/personal/client-info", "tok-1")
+    except MonoRateLimited as exc:
+        print(f"limiter: second call refused locally, retry in {exc.retry_after:.2f}s")
+    else:
+        raise AssertionError("second call inside the rate period was not refused")
+    assert calls["client-info"] == 1, "refused call still reached the server"
+
+    started = time.perf_counter()
+    await client.request("/personal/client-info", "tok-1", max_wait=None)
+    waited = time.perf_counter() - started
+    assert client.metrics.server_throttled == 0, "server answered 429"
+    print(f"limiter: waiting call went through after {waited:.2f}s, no 429 from the server")
+
+    # Other tokens are not held back by tok-1's bucket.
+    await client.request("/personal/client-info", "tok-2")
+    assert calls["client-info"] == 3
+
+
+async def bench_webhook(base_url: str, n: int, concurrency: int) -> None:
+    sem = asyncio.Semaphore(concurrency)
+    payload = {"webHookUrl": "https://example.invalid/hook"}
+
+    pooled = MonoClient(base_url=base_url)
+
+    async def pooled_call():
+        async with sem:
+            await pooled.request("/personal/webhook", "tok-bench", payload)
+
+    async def fresh_call():
+        async with sem:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(f"{base_url}/personal/webhook", json=payload,
+                                        headers={"X-Token": "tok-bench"}) as resp:
+                    await resp.text()
+
+    for name, call in (("fresh connection per call", fresh_call), ("pooled keep-alive", pooled_call)):
+        started = time.perf_counter()
+        await asyncio.gather(*[call() for _ in range(n)])
+        elapsed = time.perf_counter() - started
+        print(f"{name:>26}: {n / elapsed:7.0f} calls/s")
+    print(f"pooled client metrics: {pooled.metrics.snapshot()}")
+    await pooled.close()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.01, help="fake server latency (s)")
+    args = parser.parse_args()
+
+    runner, base_url = await start_fake_mono(rate_period=RATE_PERIOD, latency=args.latency)
+    calls = runner.app["calls"]
+    client = MonoClient(base_url=base_url, rate_period=RATE_PERIOD)
+    try:
+        await check_coalescing(client, calls)
+        await check_limiter(client, calls)
+        print(f"client metrics: {client.metrics.snapshot()}")
+        await bench_webhook(base_url, args.calls, args.concurrency)
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
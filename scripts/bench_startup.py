@@ -0,0 +1,71 @@
+"""Benchmark for process startup: import time and baseline memory.
+
+Imports main.py (the bot worker) and webapp.py (the web process) in fresh
+interpreters against a throwaway SQLite database, --runs times each, and
+reports the median import time, peak RSS after the import, and which of
+the heavy analytics libraries got loaded on the way. --preload imports
+extra modules first, which reproduces the old top-level imports for a
+before/after comparison. Run from the repo root:
+
+    python scripts/bench_startup.py [--runs 5]
+    python scripts/bench_startup.py --preload pandas,matplotlib.pyplot
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = ("main", "webapp")
+HEAVY = ("pandas", "matplotlib", "numpy")
+
+# Runs in the child. ru_maxrss is KiB on Linux, bytes on macOS.
+CHILD = """
+import importlib, json, resource, sys, time
+started = time.perf_counter()
+for name in sys.argv[2:] + sys.argv[1:2]:
+    importlib.import_module(name)
+seconds = time.perf_counter() - started
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform != "darwin":
+    rss *= 1024
+print(json.dumps({"seconds": seconds, "rss": rss,
+                  "heavy": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY,)
+
+
+def measure(target: str, preload: list[str], db_path: str) -> dict:
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_path}",
+           "BOT_TOKEN": os.environ.get("BOT_TOKEN", "bench:token")}
+    # cwd=ROOT: webapp mounts frontend/dist relative to it.
+    out = subprocess.run([sys.executable, "-c", CHILD, target, *preload],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark bot/webapp startup")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--preload", default="", help="comma-separated modules to import first")
+    args = parser.parse_args()
+    preload = [m for m in args.preload.split(",") if m]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        for target in TARGETS:
+            measure(target, preload, db_path)  # creates the schema, warms the disk cache
+            runs = [measure(target, preload, db_path) for _ in range(args.runs)]
+            seconds = statistics.median(r["seconds"] for r in runs)
+            rss = statistics.median(r["rss"] for r in runs) / 2**20
+            heavy = ", ".join(runs[-1]["heavy"]) or "none"
+            print(f"{target + '.py':>10}: import {seconds * 1000:6.0f} ms  "
+                  f"RSS {rss:6.1f} MiB  heavy modules: {heavy}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Benchmark for GET /api/stats — per-request query count and latency.
+
+Seeds a throwaway SQLite database with one user's history, then calls the
+endpoint function directly (no HTTP) for the period/currency combinations
+the Dashboard and Analytics screens use. Run from the repo root:
+
+    python scripts/bench_stats.py [--rows 5000] [--iterations 200]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+_tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp.name}"
+os.environ.setdefault("BOT_TOKEN", "bench:token")
+
+from sqlalchemy import event  # noqa: E402
+
+from databases.db import engine, get_session, init_db  # noqa: E402
+from databases.models import User, Expense  # noqa: E402
+import webapp  # noqa: E402
+
+USER_ID = 1
+CURRENCIES = ("EUR", "USD", "UAH")
+CATEGORIES = ("food", "transport", "housing", "entertainment", "beauty", "other")
+
+CASES = [
+    ("dashboard week", dict(period="week", currency=None, from_=None, to=None)),
+    ("analytics month EUR", dict(period="month", currency="EUR", from_=None, to=None)),
+    ("analytics custom 60d", dict(period="custom", currency=None, from_="__60d", to="__today")),
+]
+
+
+def seed(rows: int) -> None:
+    init_db()
+    rnd = random.Random(42)
+    now = datetime.now()
+    with get_session() as s:
+        s.add(User(id=USER_ID, first_name="Bench", currency="EUR", language="en"))
+        s.commit()
+        s.add_all(
+            Expense(
+                user_id=USER_ID,
+                amount=round(rnd.uniform(1, 200), 2),
+                category=rnd.choice(CATEGORIES),
+                currency=rnd.choice(CURRENCIES),
+                description="bench",
+                created_at=now - timedelta(minutes=rnd.randint(0, 90 * 24 * 60)),
+            )
+            for _ in range(rows)
+        )
+        s.commit()
+
+
+def resolve(kwargs: dict) -> dict:
+    today = datetime.now().date()
+    out = dict(kwargs)
+    if out["from_"] == "__60d":
+        out["from_"] = (today - timedelta(days=60)).isoformat()
+    if out["to"] == "__today":
+        out["to"] = today.isoformat()
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    seed(args.rows)
+
+    queries = 0
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(*_):
+        nonlocal queries
+        queries += 1
+
+    print(f"rows={args.rows} iterations={args.iterations}")
+    for label, kwargs in CASES:
+        kwargs = resolve(kwargs)
+        timings = []
+        per_call = 0
+        for _ in range(args.iterations):
+            with get_session() as db:
+                queries = 0
+                t0 = time.perf_counter()
+                webapp.get_stats(user_id=USER_ID, db=db, **kwargs)
+                timings.append((time.perf_counter() - t0) * 1000)
+                per_call = queries
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(
+            f"{label:<22} queries={per_call:<3} "
+            f"p50={statistics.median(timings):.2f}ms p95={p95:.2f}ms"
+        )
+
+    os.unlink(_tmp.name)
+
+
+if __name__ == "__main__":
+    main()
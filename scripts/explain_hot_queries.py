@@ -0,0 +1,151 @@
+"""Print the query plan of every hot read path against DATABASE_URL.
+
+Runs EXPLAIN QUERY PLAN on SQLite / EXPLAIN on Postgres for the queries the
+Mini App, the bot reports and the budget checks issue on every request, and
+flags any plan that falls back to a full table scan. Run from the repo root:
+
+    DATABASE_URL=postgresql://... python scripts/explain_hot_queries.py
+
+On a small Postgres database the planner legitimately prefers a Seq Scan;
+pass --no-seqscan to disable it for the session and check the index is
+usable at all.
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import func, select, text  # noqa: E402
+
+from databases.db import engine, init_db  # noqa: E402
+from databases.models import Expense, MonoAccount, MonoWebhookEvent, Subscription, User  # noqa: E402
+
+USER_ID = 1
+
+
+def hot_queries() -> dict:
+    now = datetime.now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    week = today - timedelta(days=today.weekday())
+    month = today.replace(day=1)
+    day_col = func.date(Expense.created_at)
+    return {
+        # webapp.get_stats — single grouped pass
+        "stats buckets": (
+            select(day_col, Expense.currency, Expense.category,
+                   func.sum(Expense.amount), func.count(Expense.id))
+            .where(Expense.user_id == USER_ID, Expense.created_at >= month)
+            .group_by(day_col, Expense.currency, Expense.category)
+        ),
+        # webapp.list_expenses
+        "list expenses": (
+            select(Expense)
+            .where(Expense.user_id == USER_ID, Expense.created_at >= week)
+            .order_by(Expense.created_at.desc())
+        ),
+        # handlers.expenses.get_budget_warnings / callbacks.process_budget_view
+        "budget total": (
+            select(func.coalesce(func.sum(Expense.amount), 0.0))
+            .where(Expense.user_id == USER_ID, Expense.currency == "EUR",
+                   Expense.created_at >= today, Expense.created_at <= now)
+        ),
+        # handlers.reports.get_expenses_by_period / button_categories
+        "period report": (
+            select(Expense)
+            .where(Expense.user_id == USER_ID,
+                   Expense.created_at >= week, Expense.created_at <= now)
+        ),
+        # handlers.expenses.list_expenses / callbacks.back_to_expense_list
+        "recent expenses": (
+            select(Expense)
+            .where(Expense.user_id == USER_ID)
+            .order_by(Expense.created_at.desc())
+            .limit(10)
+        ),
+        # handlers.expenses.pending_expense_category_selected
+        "known currencies": (
+            select(Expense.currency).where(Expense.user_id == USER_ID).distinct()
+        ),
+        # databases.subscriptions.charge_due_batch — all users, by id
+        "due subscriptions": (
+            select(Subscription)
+            .where(Subscription.active == True,  # noqa: E712
+                   Subscription.next_due_date <= now.date(),
+                   Subscription.id > 0)
+            .order_by(Subscription.id)
+            .limit(500)
+        ),
+        # webapp.list_subscriptions
+        "user subscriptions": (
+            select(Subscription)
+            .where(Subscription.user_id == USER_ID)
+            .order_by(Subscription.next_due_date)
+        ),
+        # mono_events.resolve_mono_user, once per webhook delivery
+        "mono account owner": (
+            select(User)
+            .join(MonoAccount, MonoAccount.user_id == User.id)
+            .where(MonoAccount.account_id == "acc", User.mono_token.isnot(None))
+        ),
+        # mono_events.user_own_ibans
+        "mono own ibans": (
+            select(MonoAccount.iban)
+            .where(MonoAccount.user_id == USER_ID, MonoAccount.iban.isnot(None))
+        ),
+        # mono_events.drain_batch
+        "due mono events": (
+            select(MonoWebhookEvent)
+            .where(MonoWebhookEvent.status == "pending",
+                   MonoWebhookEvent.next_attempt_at <= now)
+            .order_by(MonoWebhookEvent.id)
+            .limit(100)
+        ),
+    }
+
+
+def is_full_scan(plan: list[str]) -> bool:
+    for line in plan:
+        # SQLite: "SCAN expenses" without an index; "SCAN ... USING INDEX" is fine.
+        if line.lstrip().startswith("SCAN") and "INDEX" not in line:
+            return True
+        if "Seq Scan" in line:
+            return True
+    return False
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="EXPLAIN the hot read queries")
+    parser.add_argument("--no-seqscan", action="store_true",
+                        help="Postgres only: SET enable_seqscan = off first")
+    args = parser.parse_args()
+
+    init_db()
+    is_postgres = engine.dialect.name == "postgresql"
+    prefix = "EXPLAIN " if is_postgres else "EXPLAIN QUERY PLAN "
+    failures = 0
+
+    with engine.connect() as conn:
+        if is_postgres and args.no_seqscan:
+            conn.execute(text("SET enable_seqscan = off"))
+        for name, stmt in hot_queries().items():
+            sql = str(stmt.compile(dialect=engine.dialect,
+                                   compile_kwargs={"literal_binds": True}))
+            rows = conn.execute(text(prefix + sql)).fetchall()
+            # SQLite returns (id, parent, notused, detail); Postgres one column.
+            plan = [str(row[-1]) for row in rows]
+            full_scan = is_full_scan(plan)
+            failures += full_scan
+            print(f"== {name} {'!! FULL SCAN' if full_scan else 'ok'}")
+            for line in plan:
+                print(f"   {line}")
+
+    print(f"\n{failures} quer{'y' if failures == 1 else 'ies'} with a full table scan")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""A local stand-in for the Monobank personal API.
+
+    python scripts/fake_mono.py [--port 8099] [--rate-period 60] [--latency 0.05]
+    MONO_API_URL=http://127.0.0.1:8099 python main.py
+
+Serves client-info, webhook registration and statements for any token,
+deterministically generated from the token itself, and enforces the same
+one-call-per-`rate_period` limit per token and endpoint as Monobank (429).
+Statements follow Monobank's paging: at most 31 days + 1 hour per call,
+newest first, at most 500 items — callers page by moving `to` back.
+Importable too: `await start_fake_mono()` returns (runner, base_url).
+"""
+
+import argparse
+import asyncio
+import hashlib
+import random
+import time
+
+from aiohttp import web
+
+STATEMENT_PAGE = 500
+MAX_STATEMENT_RANGE = 31 * 86400 + 3600
+# How often the generated history has a transaction, per account.
+TX_EVERY = 3 * 3600  # seconds
+HISTORY = 400 * 86400  # seconds of history before "now"
+
+_MCCS = (5411, 5812, 4121, 5912, 5732, 7832, 5999, 4829)
+
+
+def _accounts(token: str) -> list[dict]:
+    seed = hashlib.sha256(token.encode()).hexdigest()[:8]
+    return [
+        {"id": f"{seed}-uah", "iban": f"UA{seed}0000000000000000001", "currencyCode": 980},
+        {"id": f"{seed}-eur", "iban": f"UA{seed}0000000000000000002", "currencyCode": 978},
+    ]
+
+
+def _jars(token: str) -> list[dict]:
+    seed = hashlib.sha256(token.encode()).hexdigest()[:8]
+    return [{"id": f"{seed}-jar", "iban": f"UA{seed}0000000000000000009", "currencyCode": 980}]
+
+
+def _statement(token: str, account: str, start: int, end: int, now: int) -> list[dict]:
+    """Every generated transaction in [start, end], newest first."""
+    own_ibans = [a["iban"] for a in _accounts(token) + _jars(token)]
+    # On a fixed grid, so the same transaction keeps its id across calls.
+    first = max(start, now - HISTORY)
+    first += -first % TX_EVERY
+    items = []
+    for t in range(first, min(end, now) + 1, TX_EVERY):
+        rnd = random.Random(f"{account}:{t}")
+        mcc = rnd.choice(_MCCS)
+        item = {
+            "id": f"{account}-{t}",
+            "time": t,
+            "description": "Silpo",
+            "mcc": mcc,
+            "amount": -rnd.randint(100, 50000),
+            "currencyCode": 980,
+            "operationAmount": 0,
+            "counterName": "",
+        }
+        item["operationAmount"] = item["amount"]
+        roll = rnd.random()
+        if mcc == 4829:
+            if roll < 0.5:
+                item["description"] = "Переказ на картку"
+                item["counterIban"] = rnd.choice(own_ibans)
+            else:
+                item["description"] = "Olena K."
+        elif roll < 0.05:
+            item["amount"] = -item["amount"]
+            item["description"] = "Зарплата"
+        items.append(item)
+    items.reverse()
+    return items
+
+
+def make_app(rate_period: float = 60, latency: float = 0.0) -> web.Application:
+    last_call: dict[tuple[str, str], float] = {}
+    calls: dict[str, int] = {}
+
+    def throttle(token: str, endpoint: str) -> None:
+        calls[endpoint] = calls.get(endpoint, 0) + 1
+        now = time.monotonic()
+        prev = last_call.get((token, endpoint))
+        if prev is not None and now - prev < rate_period:
+            raise web.HTTPTooManyRequests(text='{"errorDescription": "Too many requests"}')
+        last_call[(token, endpoint)] = now
+
+    def token_of(request: web.Request) -> str:
+        token = request.headers.get("X-Token", "")
+        if not token or token.startswith("bad"):
+            raise web.HTTPForbidden(text='{"errorDescription": "Unknown \'X-Token\'"}')
+        return token
+
+    async def client_info(request: web.Request) -> web.Response:
+        token = token_of(request)
+        throttle(token, "client-info")
+        await asyncio.sleep(latency)
+        return web.json_response({"clientId": token[:8], "name": "Fake User",
+                                  "accounts": _accounts(token), "jars": _jars(token)})
+
+    async def webhook(request: web.Request) -> web.Response:
+        token_of(request)
+        calls["webhook"] = calls.get("webhook", 0) + 1
+        await request.json()
+        await asyncio.sleep(latency)
+        return web.json_response({})
+
+    async def statement(request: web.Request) -> web.Response:
+        token = token_of(request)
+        start = int(request.match_info["start"])
+        end = int(request.match_info.get("end") or time.time())
+        if end - start > MAX_STATEMENT_RANGE:
+            raise web.HTTPBadRequest(text='{"errorDescription": "Period must be no more than 31 days"}')
+        throttle(token, "statement")
+        await asyncio.sleep(latency)
+        items = _statement(token, request.match_info["account"], start, end, int(time.time()))
+        return web.json_response(items[:STATEMENT_PAGE])
+
+    app = web.Application()
+    app["calls"] = calls
+    app.router.add_get("/personal/client-info", client_info)
+    app.router.add_post("/personal/webhook", webhook)
+    app.router.add_get("/personal/statement/{account}/{start}/{end}", statement)
+    app.router.add_get("/personal/statement/{account}/{start}", statement)
+    return app
+
+
+async def start_fake_mono(port: int = 0, **kwargs) -> tuple[web.AppRunner, str]:
+    runner = web.AppRunner(make_app(**kwargs))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake Monobank personal API")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--rate-period", type=float, default=60)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every call")
+    args = parser.parse_args()
+    web.run_app(make_app(args.rate_period, args.latency), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Post fake Telegram updates at a bot running in webhook mode.
+
+    python scripts/fake_updates.py --url http://127.0.0.1:8080/telegram/webhook
+    python scripts/fake_updates.py [--updates 200] [--concurrency 50]
+
+With --url the updates go to a running `BOT_MODE=webhook python main.py`
+(its replies to Telegram fail with a dummy BOT_TOKEN, which is logged and
+harmless). Without it the script serves utils/bot_webhook.py itself in
+front of a dispatcher whose only handler sleeps --handler-ms, so it needs
+no database or Telegram, and checks the secret-token check, the
+WEBHOOK_CONCURRENCY limit and that shutdown waits for updates in flight.
+The secret defaults to the one main.py derives from BOT_TOKEN.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import aiohttp  # noqa: E402
+from aiogram import Bot, Dispatcher  # noqa: E402
+from aiogram.types import Message  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+from utils.bot_webhook import (  # noqa: E402
+    SECRET_HEADER, WEBHOOK_CONCURRENCY, WEBHOOK_PATH, UpdateRunner, make_webhook_app,
+    webhook_secret,
+)
+
+DUMMY_TOKEN = "123456:fake-updates"
+
+
+def fake_update(update_id: int, user_id: int, text: str) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "language_code": "en"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+async def post_all(url: str, secret: str, n: int, concurrency: int, users: int, text: str):
+    statuses: Counter = Counter()
+    latencies: list[float] = []
+    gate = asyncio.Semaphore(concurrency)
+
+    async with aiohttp.ClientSession() as http:
+        async def one(i: int) -> None:
+            async with gate:
+                started = time.perf_counter()
+                async with http.post(url, json=fake_update(i, 1_000_000 + i % users, text),
+                                     headers={SECRET_HEADER: secret}) as resp:
+                    statuses[resp.status] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(1, n + 1)))
+        wall = time.perf_counter() - started
+
+        async with http.post(url, json=fake_update(0, 1, text),
+                             headers={SECRET_HEADER: "wrong"}) as resp:
+            bad_secret = resp.status
+
+    latencies.sort()
+    print(f"{n} updates in {wall:.2f}s: {dict(statuses)}  ack p50 "
+          f"{statistics.median(latencies) * 1000:.0f} ms  max {latencies[-1] * 1000:.0f} ms")
+    print(f"wrong secret -> {bad_secret}")
+    return statuses, bad_secret
+
+
+async def self_test(args) -> None:
+    dp = Dispatcher()
+    running = peak = 0
+
+    @dp.message()
+    async def slow(message: Message) -> None:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            await asyncio.sleep(args.handler_ms / 1000)
+        finally:
+            running -= 1
+
+    bot = Bot(DUMMY_TOKEN)
+    runner = UpdateRunner(dp, bot, concurrency=args.limit)
+    secret = webhook_secret(bot.token)
+    web_runner = web.AppRunner(make_webhook_app(runner, secret))
+    await web_runner.setup()
+    site = web.TCPSite(web_runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}{WEBHOOK_PATH}"
+
+    try:
+        statuses, bad_secret = await post_all(url, secret, args.updates, args.concurrency,
+                                              args.users, args.text)
+        in_flight = runner.in_flight
+        started = time.perf_counter()
+        runner.closing = True
+        await runner.drain(timeout=30)
+        drained = time.perf_counter() - started
+    finally:
+        await web_runner.cleanup()
+        await bot.session.close()
+
+    print(f"handled {runner.handled}, failed {runner.failed}, peak concurrency {peak} "
+          f"(limit {args.limit}); shutdown waited {drained * 1000:.0f} ms for {in_flight}")
+    ok = (statuses == Counter({200: args.updates}) and bad_secret == 401
+          and runner.handled == args.updates and peak <= args.limit)
+    print("OK" if ok else "FAILED")
+    if not ok:
+        sys.exit(1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Post fake Telegram updates to the bot webhook")
+    parser.add_argument("--url", default=None, help="webhook URL; omit to serve one in-process")
+    parser.add_argument("--secret", default=None)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50, help="requests posted at once")
+    parser.add_argument("--users", type=int, default=20, help="distinct fake senders")
+    parser.add_argument("--text", default="/today")
+    parser.add_argument("--limit", type=int, default=WEBHOOK_CONCURRENCY,
+                        help="in-process only: updates handled at once")
+    parser.add_argument("--handler-ms", type=float, default=100,
+                        help="in-process only: how long each update takes")
+    args = parser.parse_args()
+
+    if args.url:
+        secret = args.secret or webhook_secret(os.getenv("BOT_TOKEN", DUMMY_TOKEN))
+        asyncio.run(post_all(args.url, secret, args.updates, args.concurrency, args.users, args.text))
+    else:
+        asyncio.run(self_test(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Build the model indexes an existing database is missing.
+
+    python scripts/indexes.py [--check]
+
+init_db() builds them itself on SQLite. On Postgres it only logs which are
+missing: a plain CREATE INDEX there blocks writes for the whole build, so
+this script builds each one with CREATE INDEX CONCURRENTLY, outside any
+transaction, while the app keeps writing. Run it once after deploying a
+model with a new index (e.g. `heroku run python scripts/indexes.py`). An
+index left INVALID by an interrupted concurrent build is dropped and built
+again. `--check` only lists what is missing and exits non-zero if anything
+is.
+"""
+
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.schema import CreateIndex  # noqa: E402
+
+from databases.db import engine, init_db, missing_indexes  # noqa: E402
+from databases.models import Base  # noqa: E402
+
+
+def _drop_invalid(conn) -> None:
+    names = [index.name for table in Base.metadata.sorted_tables for index in table.indexes]
+    invalid = conn.execute(text(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE NOT i.indisvalid AND c.relname = ANY(:names)"
+    ), {"names": names}).scalars().all()
+    for name in invalid:
+        print(f"dropping invalid {name}")
+        conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build missing indexes")
+    parser.add_argument("--check", action="store_true", help="only list missing indexes")
+    args = parser.parse_args()
+
+    init_db()
+    postgres = engine.dialect.name == "postgresql"
+    if postgres and not args.check:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            _drop_invalid(conn)
+    missing = missing_indexes()
+    for index in missing:
+        print(f"missing {index.name} on {index.table.name}")
+    if args.check:
+        sys.exit(1 if missing else 0)
+
+    # CONCURRENTLY can't run inside a transaction block.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for index in missing:
+            if postgres:
+                index.dialect_options["postgresql"]["concurrently"] = True
+            conn.execute(CreateIndex(index, if_not_exists=True))
+            print(f"built {index.name}")
+    print(f"{len(missing)} index(es) built")
+
+
+if __name__ == "__main__":
+    main()
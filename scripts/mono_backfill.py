@@ -0,0 +1,73 @@
+"""Inspect, (re)start and run Monobank statement backfills.
+
+    python scripts/mono_backfill.py status [--user ID]
+    python scripts/mono_backfill.py start --user ID [--days N]
+    python scripts/mono_backfill.py run
+
+`start` restarts the user's card accounts from now back N days (default
+MONO_BACKFILL_DAYS); `run` imports every waiting job in the foreground
+instead of leaving it to the worker. Against scripts/fake_mono.py:
+
+    MONO_API_URL=http://127.0.0.1:8099 python scripts/mono_backfill.py run
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import select  # noqa: E402
+
+from databases.db import engine, init_db  # noqa: E402
+from databases.models import MonoAccount  # noqa: E402
+from databases.mono_backfill import (  # noqa: E402
+    BACKFILL_DAYS, backfill_progress, run_pending_backfills, schedule_backfills,
+)
+from utils.mono import close_mono_client  # noqa: E402
+
+
+async def _run() -> int:
+    try:
+        return await run_pending_backfills()
+    finally:
+        await close_mono_client()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain mono_backfills")
+    parser.add_argument("command", choices=("status", "start", "run"))
+    parser.add_argument("--user", type=int, default=None)
+    parser.add_argument("--days", type=int, default=BACKFILL_DAYS)
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == "status":
+        with engine.connect() as conn:
+            jobs = backfill_progress(conn, args.user)
+        for job in jobs:
+            print(f"user={job['user_id']} account={job['account_id']} {job['status']} "
+                  f"{job['done']:.0%} imported={job['imported']}"
+                  + (f" error={job['last_error']}" if job['last_error'] else ""))
+        print(f"{len(jobs)} job(s)")
+        return
+
+    if args.command == "start":
+        if args.user is None:
+            parser.error("start needs --user")
+        with engine.begin() as conn:
+            accounts = list(conn.execute(
+                select(MonoAccount.account_id)
+                .where(MonoAccount.user_id == args.user, MonoAccount.is_jar == False)  # noqa: E712
+            ).scalars())
+            schedule_backfills(conn, args.user, accounts, days=args.days, reset=True)
+        print(f"{len(accounts)} account(s) scheduled")
+        return
+
+    print(f"{asyncio.run(_run())} expense(s) imported")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Inspect and replay the Monobank webhook queue.
+
+    python scripts/mono_events.py stats
+    python scripts/mono_events.py dead
+    python scripts/mono_events.py replay [--id ID ...]
+    python scripts/mono_events.py purge [--days N] [--dead-days N]
+
+`dead` lists events that failed every retry; `replay` puts them (all, or
+only the given ids) back in the queue for the worker to apply again.
+Replaying is safe: an expense that already exists comes back 'duplicate'.
+"""
+
+import argparse
+import os
+import sys
+from datetime import timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import select  # noqa: E402
+
+from databases.db import engine, init_db  # noqa: E402
+from databases.mono_events import (  # noqa: E402
+    DEAD_RETENTION, RETENTION, prune_events, queue_counts, replay_events,
+)
+from databases.models import MonoWebhookEvent  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain mono_webhook_events")
+    parser.add_argument("command", choices=("stats", "dead", "replay", "purge"))
+    parser.add_argument("--id", type=int, action="append", dest="ids",
+                        help="replay only this event id (repeatable)")
+    parser.add_argument("--days", type=int, default=RETENTION.days,
+                        help="purge applied events older than this many days")
+    parser.add_argument("--dead-days", type=int, default=DEAD_RETENTION.days,
+                        help="purge dead events older than this many days")
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == "stats":
+        with engine.connect() as conn:
+            for status, n in sorted(queue_counts(conn).items()):
+                print(f"{status}: {n}")
+        return
+
+    if args.command == "dead":
+        events = MonoWebhookEvent.__table__
+        with engine.connect() as conn:
+            rows = conn.execute(
+                select(events.c.id, events.c.tx_id, events.c.attempts,
+                       events.c.received_at, events.c.last_error)
+                .where(events.c.status == "dead")
+                .order_by(events.c.id)
+            ).all()
+        for row in rows:
+            print(f"#{row.id} tx={row.tx_id} attempts={row.attempts} "
+                  f"received={row.received_at:%Y-%m-%d %H:%M:%S} error={row.last_error}")
+        print(f"{len(rows)} dead event(s)")
+        return
+
+    with engine.begin() as conn:
+        if args.command == "replay":
+            print(f"{replay_events(conn, args.ids)} event(s) requeued")
+        else:
+            print(f"{prune_events(conn, timedelta(days=args.days), timedelta(days=args.dead_days))} event(s) purged")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Rebuild or verify the daily_expense_rollups table against raw expenses.
+
+    python scripts/rollups.py rebuild [--user ID]
+    python scripts/rollups.py check [--user ID]
+
+`check` prints every (user, day, currency, category) bucket whose sum or
+count disagrees with the expenses table and exits non-zero if any do.
+"""
+
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from databases.db import engine, init_db  # noqa: E402
+from databases.rollups import check_rollups, rebuild_rollups  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain daily_expense_rollups")
+    parser.add_argument("command", choices=("rebuild", "check"))
+    parser.add_argument("--user", type=int, default=None, help="limit to one user id")
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == "rebuild":
+        with engine.begin() as conn:
+            rebuild_rollups(conn, args.user)
+        print("rollups rebuilt")
+        return
+
+    with engine.connect() as conn:
+        mismatches = check_rollups(conn, args.user)
+    for key, exp, act in mismatches:
+        print(f"{key}: expected total={exp[0]:.2f} count={exp[1]}, "
+              f"rollup total={act[0]:.2f} count={act[1]}")
+    print(f"{len(mismatches)} mismatched bucket(s)")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
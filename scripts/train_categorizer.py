@@ -0,0 +1,173 @@
+"""Train the expense categorizer and write the model utils/categorizer.py loads.
+
+    python scripts/train_categorizer.py [--db] [--out PATH] [--min-confidence P]
+
+The pipeline of moneylytics_baseline_experiment.ipynb as a repeatable run:
+the labelled descriptions of expenses_ml_dataset.csv (plus, with --db, the
+expenses stored at DATABASE_URL), stripped, lower-cased and de-duplicated;
+the Rule-Based v2 keywords; TF-IDF + Logistic Regression. It prints the
+accuracy of the rules, the model and rules-then-model on the notebook's
+seeded 70/30 split, and the model's 5-fold CV score, then refits on all of
+the data and exports it as JSON. The export is checked against
+scikit-learn's own probabilities before it is written.
+
+Needs scikit-learn and pandas, which the bot itself doesn't.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import StratifiedKFold, cross_val_score, train_test_split
+from sklearn.pipeline import Pipeline
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.categories import normalize_category  # noqa: E402
+from utils.categorizer import MODEL_PATH, Categorizer  # noqa: E402
+
+DATASET = os.path.join(ROOT, "expenses_ml_dataset.csv")
+SEED = 67  # the notebook's random_state
+MIN_CONFIDENCE = 0.5
+
+# Rule-Based v2 from the notebook. Order matters: the first category with
+# a keyword in the description wins.
+RULES = {
+    "transport": {
+        "uber", "bolt", "metro", "bus", "train", "taxi",
+        "parking", "fuel", "gas", "shuttle", "tram", "cab",
+        "ride", "toll", "cp", "airport", "transfer", "garage",
+        "meter", "pass", "recharge",
+    },
+    "food": {
+        "mcdonalds", "starbucks", "grocery", "pizza", "restaurant", "sushi",
+        "groceries", "supermarket", "food delivery", "fast food", "coffee shop", "coffee",
+        "glovo", "wolt", "burger", "kfc", "bakery", "croissant", "subway",
+        "dominos", "ramen", "cafe", "pingo", "continente", "snack",
+        "breakfast", "lidl", "dinner", "lunch", "meal", "sandwich",
+    },
+    "entertainment": {
+        "netflix", "spotify", "cinema", "steam", "xbox", "playstation",
+        "gaming", "concert", "theater", "movie", "bowling",
+        "museum", "arcade", "disney", "youtube", "premium",
+        "dlc", "board game", "amusement", "football", "nintendo",
+        "hbo", "karaoke", "match", "eshop", "ps store",
+    },
+    "housing": {
+        "rent", "electricity", "water", "internet", "ikea",
+        "wifi", "utility", "home depot", "cleaning", "laundry",
+        "light bulb", "bedsheets", "kitchen", "furniture",
+        "apartment", "vacuum", "household", "toilet paper",
+        "dish soap", "home decor", "detergent", "supplies",
+        "repair", "decor", "utensils",
+    },
+}
+
+
+def load_data(use_db: bool) -> pd.DataFrame:
+    frames = [pd.read_csv(DATASET)[["description", "category"]]]
+    if use_db:
+        from databases.db import engine
+
+        with engine.connect() as conn:
+            frames.append(pd.read_sql_query("SELECT description, category FROM expenses", conn))
+    df = pd.concat(frames, ignore_index=True).drop_duplicates(subset=["description", "category"])
+    df["category"] = df["category"].map(normalize_category)
+    df["description"] = df["description"].fillna("").str.strip().str.lower()
+    df = df[df["description"] != ""]
+    # Monobank sets transfer from the MCC; no description predicts it.
+    df = df[df["category"] != "transfer"]
+    return df.sort_values(["category", "description"]).reset_index(drop=True)
+
+
+def make_pipeline() -> Pipeline:
+    return Pipeline([("tfidf", TfidfVectorizer()), ("lr", LogisticRegression())])
+
+
+def export(pipe: Pipeline, min_confidence: float) -> dict:
+    """The fitted pipeline plus RULES in the layout utils.categorizer loads."""
+    tfidf, lr = pipe.named_steps["tfidf"], pipe.named_steps["lr"]
+    coef, intercept = lr.coef_, lr.intercept_
+    if len(lr.classes_) == 2:
+        # A binary model is one sigmoid; softmax over (-z/2, z/2) is the same.
+        coef, intercept = np.vstack([-coef / 2, coef / 2]), np.array([-intercept[0] / 2, intercept[0] / 2])
+    return {
+        "classes": [str(c) for c in lr.classes_],
+        "min_confidence": min_confidence,
+        "rules": [[category, sorted(words)] for category, words in RULES.items()],
+        "token_pattern": tfidf.token_pattern,
+        "intercept": [float(b) for b in intercept],
+        "terms": {
+            term: [float(tfidf.idf_[j]), [float(c) for c in coef[:, j]]]
+            for term, j in sorted(tfidf.vocabulary_.items())
+        },
+    }
+
+
+def check_export(model: dict, pipe: Pipeline, texts: list[str]) -> None:
+    ours = np.array([Categorizer(model).probabilities(text) for text in texts])
+    worst = float(np.abs(ours - pipe.predict_proba(texts)).max())
+    if worst > 1e-9:
+        sys.exit(f"exported model disagrees with scikit-learn (max diff {worst:.2e})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train the expense categorizer")
+    parser.add_argument("--db", action="store_true", help="also train on the expenses at DATABASE_URL")
+    parser.add_argument("--out", default=MODEL_PATH, help="model file (default utils/categorizer_model.json)")
+    parser.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE,
+                        help=f"model probability below which a guess is 'other' (default {MIN_CONFIDENCE})")
+    args = parser.parse_args()
+
+    df = load_data(args.db)
+    X, y = df["description"], df["category"]
+    print(f"{len(df)} descriptions: " + ", ".join(f"{c} {n}" for c, n in y.value_counts().sort_index().items()))
+
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=SEED, stratify=y)
+    pipe = make_pipeline().fit(X_train, y_train)
+    held_out = export(pipe, args.min_confidence)
+    check_export(held_out, pipe, list(X_test))
+    # Never trusts the model: the rules, else 'other'.
+    rules_only = Categorizer({**held_out, "min_confidence": math.inf})
+    cv = cross_val_score(make_pipeline(), X, y, scoring="accuracy",
+                         cv=StratifiedKFold(n_splits=5, shuffle=True, random_state=SEED))
+    metrics = {
+        "rules": accuracy_score(y_test, rules_only.predict_many(X_test)),
+        "model": accuracy_score(y_test, pipe.predict(X_test)),
+        "model_cv": cv.mean(),
+        "model_cv_std": cv.std(),
+        "rules_then_model": accuracy_score(y_test, Categorizer(held_out).predict_many(X_test)),
+    }
+    print(f"rules:            {metrics['rules']:.2f}")
+    print(f"model:            {metrics['model']:.2f} "
+          f"(5-fold CV {metrics['model_cv']:.2f} ± {metrics['model_cv_std']:.2f})")
+    print(f"rules then model: {metrics['rules_then_model']:.2f} (min confidence {args.min_confidence})")
+
+    # What ships is fitted on everything; the metrics above are its estimate.
+    pipe = make_pipeline().fit(X, y)
+    model = export(pipe, args.min_confidence)
+    check_export(model, pipe, list(X))
+    model["trained_on"] = {
+        "rows": len(df),
+        "sha256": hashlib.sha256(df.to_csv(index=False).encode()).hexdigest(),
+        "scikit_learn": sklearn.__version__,
+    }
+    model["metrics"] = {name: round(float(value), 4) for name, value in metrics.items()}
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(model, f, ensure_ascii=False, indent=1)
+        f.write("\n")
+    print(f"wrote {args.out} ({len(model['terms'])} terms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Serving the bot over a Telegram webhook instead of long polling.
+
+`main.py` picks this when BOT_MODE=webhook. Telegram POSTs every update to
+WEBHOOK_PATH on a small aiohttp server; a request is accepted only with the
+X-Telegram-Bot-Api-Secret-Token header we registered, then acknowledged
+straight away and handled in a background task. At most
+WEBHOOK_CONCURRENCY updates are handled at once: past that the request
+waits for a free slot before it is acknowledged, which holds Telegram's
+connection open (it opens at most WEBHOOK_MAX_CONNECTIONS of them) instead
+of piling up tasks. Because any dyno can take any update, several of them
+can sit behind one URL.
+
+On SIGTERM the server stops taking updates, waits up to
+WEBHOOK_SHUTDOWN_TIMEOUT seconds for the ones in flight and returns. The
+webhook stays registered, so Telegram keeps the updates that arrive during
+a restart and delivers them to the next process.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import signal
+from os import getenv
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+from pydantic import ValidationError
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_URL = getenv("WEBHOOK_URL")  # public base URL, e.g. https://bot.example.com
+WEBHOOK_PATH = getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_HOST = getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(getenv("PORT", "8080"))
+WEBHOOK_CONCURRENCY = int(getenv("WEBHOOK_CONCURRENCY", "32"))  # updates handled at once
+WEBHOOK_MAX_CONNECTIONS = int(getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # Telegram: 1..100
+WEBHOOK_SHUTDOWN_TIMEOUT = float(getenv("WEBHOOK_SHUTDOWN_TIMEOUT", "25"))  # Heroku allows 30
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def webhook_secret(token: str) -> str:
+    """WEBHOOK_SECRET, or one derived from the bot token. Telegram allows
+    1-256 characters of A-Z, a-z, 0-9, _ and -, which a hex digest is."""
+    return getenv("WEBHOOK_SECRET") or hashlib.sha256(f"{token}_webhook".encode()).hexdigest()
+
+
+class UpdateRunner:
+    """Handles accepted updates in background tasks, at most `concurrency`
+    at a time, and lets shutdown wait for the ones still running."""
+
+    def __init__(self, dp: Dispatcher, bot: Bot, concurrency: int = WEBHOOK_CONCURRENCY):
+        self.dp = dp
+        self.bot = bot
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self.closing = False
+        self.handled = 0
+        self.failed = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    async def submit(self, update: Update) -> None:
+        """Returns once the update has a slot and is running."""
+        await self._slots.acquire()
+        task = asyncio.create_task(self._run(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, update: Update) -> None:
+        try:
+            await self.dp.feed_update(self.bot, update)
+            self.handled += 1
+        except Exception:
+            self.failed += 1
+            logger.exception("update %s failed", update.update_id)
+        finally:
+            self._slots.release()
+
+    async def drain(self, timeout: float) -> None:
+        if self._tasks:
+            logger.info("waiting for %d update(s) in flight", len(self._tasks))
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        # Loop: requests that were waiting for a slot may still start some.
+        while self._tasks:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                logger.warning("shutdown: cancelling %d update(s) still running", len(self._tasks))
+                for task in self._tasks:
+                    task.cancel()
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+                return
+            await asyncio.wait(set(self._tasks), timeout=remaining)
+
+
+def make_webhook_app(runner: UpdateRunner, secret: str, path: str = WEBHOOK_PATH) -> web.Application:
+    async def receive(request: web.Request) -> web.Response:
+        if runner.closing:
+            # Telegram retries later; by then another process is up.
+            return web.Response(status=503)
+        given = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(given.encode(), secret.encode()):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": runner.bot})
+        except (ValueError, ValidationError):
+            return web.Response(status=400)
+        await runner.submit(update)
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({
+            "status": "closing" if runner.closing else "ok",
+            "in_flight": runner.in_flight,
+            "handled": runner.handled,
+            "failed": runner.failed,
+        })
+
+    app = web.Application()
+    app.router.add_post(path, receive)
+    app.router.add_get("/healthz", health)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot) -> None:
+    """Serve updates until SIGTERM/SIGINT, then drain and return."""
+    secret = webhook_secret(bot.token)
+    runner = UpdateRunner(dp, bot)
+    app = make_webhook_app(runner, secret)
+    web_runner = web.AppRunner(app, handle_signals=False)
+    await web_runner.setup()
+    await web.TCPSite(web_runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    logger.info("webhook: listening on %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=secret,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info("webhook: registered %s", WEBHOOK_URL)
+    else:
+        logger.warning("webhook: WEBHOOK_URL not set, not registering with Telegram")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await dp.emit_startup(bot=bot)
+    try:
+        await stop.wait()
+    finally:
+        logger.info("webhook: shutting down")
+        runner.closing = True
+        await runner.drain(WEBHOOK_SHUTDOWN_TIMEOUT)
+        await web_runner.cleanup()
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.remove_signal_handler(sig)
@@ -0,0 +1,92 @@
+"""Category names: the aliases people type and the legacy values old rows
+hold, mapped onto the categories we store."""
+
+from utils.translations import CANONICAL_CATEGORIES
+
+# What a stored expense's category may be: the ones users pick, plus
+# transfer, which only the Monobank import sets.
+STORED_CATEGORIES = (*CANONICAL_CATEGORIES, "transfer")
+
+# Tokens accepted as the category of a typed expense ("50 еда pizza").
+STRICT_CATEGORY_MAP = {
+    "food": "food",
+    "transport": "transport",
+    "housing": "housing",
+    "entertainment": "entertainment",
+    "beauty": "beauty",
+    "salon": "beauty",
+    "spa": "beauty",
+    "manicure": "beauty",
+    "haircut": "beauty",
+    "краса": "beauty",
+    "салон": "beauty",
+    "манікюр": "beauty",
+    "стрижка": "beauty",
+    "косметика": "beauty",
+    "маникюр": "beauty",
+    "other": "other",
+    "transfer": "transfer",
+    "p2p": "transfer",
+    "перевод": "transfer",
+    "переказ": "transfer",
+    "еда": "food",
+    "пища": "food",
+    "транспорт": "transport",
+    "жилье": "housing",
+    "жильё": "housing",
+    "развлечения": "entertainment",
+    "другое": "other",
+    "їжа": "food",
+    "житло": "housing",
+    "розваги": "entertainment",
+    "інше": "other",
+}
+
+# Old free-form/localized categories that init_db() collapses into the
+# stored ones on every startup.
+LEGACY_CATEGORY_MAP = {
+    'еда': 'food',
+    'пища': 'food',
+    'пицца': 'food',
+    'pizza': 'food',
+
+    'транспорт': 'transport',
+    'uber': 'transport',
+    'bolt': 'transport',
+    'taxi': 'transport',
+    'bus': 'transport',
+    'metro': 'transport',
+    'train': 'transport',
+
+    'жилье': 'housing',
+    'жильё': 'housing',
+    'rent': 'housing',
+    'water': 'housing',
+    'electricity': 'housing',
+    'internet': 'housing',
+    'ikea': 'housing',
+
+    'развлечения': 'entertainment',
+    'netflix': 'entertainment',
+    'spotify': 'entertainment',
+    'cinema': 'entertainment',
+    'steam': 'entertainment',
+    'bowling': 'entertainment',
+
+    'salon': 'beauty',
+    'beauty': 'beauty',
+    'краса': 'beauty',
+    'салон': 'beauty',
+    'косметика': 'beauty',
+
+    'другое': 'other',
+}
+
+
+def normalize_category(value: str | None) -> str:
+    """A category as typed or imported, as we'd store it: an alias or
+    legacy name is mapped, a stored category kept, anything else is
+    'other' (what init_db() would turn it into)."""
+    key = (value or "").strip().lower()
+    return (STRICT_CATEGORY_MAP.get(key) or LEGACY_CATEGORY_MAP.get(key)
+            or (key if key in STORED_CATEGORIES else "other"))
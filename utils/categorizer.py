@@ -0,0 +1,129 @@
+"""Guessing an expense's category from its description.
+
+The model is the notebook's winner with its ML fallback: the Rule-Based v2
+keywords first, matched against whole words, then TF-IDF + Logistic
+Regression for descriptions no keyword matches, trusted only when it is at
+least `min_confidence` sure. `predict()` makes anything less 'other';
+`suggest()` returns the guess with whether it was sure, for callers that
+can ask the user instead. scripts/train_categorizer.py fits it and exports
+the rules, vocabulary, idf weights and coefficients as JSON, which both
+processes load once at startup (`load_model()`). Scoring is plain Python
+over the few terms a description has (no scikit-learn or NumPy at
+runtime), a few microseconds per call; `predict_many()` scores each
+distinct description of a batch once.
+"""
+
+import json
+import math
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from os import getenv
+from typing import Iterable
+
+MODEL_PATH = getenv(
+    "CATEGORIZER_MODEL", os.path.join(os.path.dirname(os.path.abspath(__file__)), "categorizer_model.json"),
+)
+
+
+class Categorizer:
+    """A model exported by scripts/train_categorizer.py."""
+
+    def __init__(self, model: dict):
+        self.classes = model["classes"]
+        self.min_confidence = model["min_confidence"]
+        self._token = re.compile(model["token_pattern"])
+        # Keywords match whole tokens ("bus" is not in "business"); a
+        # several-word keyword matches those tokens in a row.
+        self._rules = []
+        for category, words in model["rules"]:
+            keywords = [" ".join(self._token.findall(word)) for word in words]
+            self._rules.append((category, frozenset(k for k in keywords if " " not in k),
+                                tuple(f" {k} " for k in keywords if " " in k)))
+        self._intercept = model["intercept"]
+        # term -> (idf, per-class coefficients)
+        self._terms = {term: (idf, coef) for term, (idf, coef) in model["terms"].items()}
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> "Categorizer":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def probabilities(self, text: str) -> list[float]:
+        """The model's class probabilities (in `classes` order) for a
+        lower-cased description, as scikit-learn's predict_proba gives them."""
+        return self._probabilities(self._token.findall(text))
+
+    def _probabilities(self, tokens: list[str]) -> list[float]:
+        counts = Counter(tok for tok in tokens if tok in self._terms)
+        scores = list(self._intercept)
+        if counts:
+            weights = [(n * self._terms[tok][0], self._terms[tok][1]) for tok, n in counts.items()]
+            norm = math.sqrt(sum(w * w for w, _ in weights))
+            for w, coef in weights:
+                w /= norm
+                for i, c in enumerate(coef):
+                    scores[i] += w * c
+        top = max(scores)
+        exps = [math.exp(s - top) for s in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def _suggest(self, text: str) -> tuple[str, bool]:
+        tokens = self._token.findall(text)
+        words, joined = set(tokens), f" {' '.join(tokens)} "
+        hits = [category for category, singles, phrases in self._rules
+                if not singles.isdisjoint(words) or any(p in joined for p in phrases)]
+        if hits:
+            # Keywords of two categories ("uber eats dinner") make the first
+            # one a guess, not an answer.
+            return hits[0], len(hits) == 1
+        if not any(tok in self._terms for tok in tokens):
+            return "other", False  # no word the model knows
+        probs = self._probabilities(tokens)
+        best = max(range(len(probs)), key=probs.__getitem__)
+        return self.classes[best], probs[best] >= self.min_confidence
+
+    def _classify(self, text: str) -> str:
+        category, sure = self._suggest(text)
+        return category if sure else "other"
+
+    def suggest(self, description: str | None) -> tuple[str, bool]:
+        """The best guess for `description` and whether it is sure: one
+        category's keywords matched, or the model cleared min_confidence."""
+        text = (description or "").strip().lower()
+        return self._suggest(text) if text else ("other", False)
+
+    def predict(self, description: str | None) -> str:
+        """A stored category for `description`; 'other' when unsure."""
+        text = (description or "").strip().lower()
+        return self._classify(text) if text else "other"
+
+    def predict_many(self, descriptions: Iterable[str | None]) -> list[str]:
+        seen: dict[str, str] = {}
+        out = []
+        for description in descriptions:
+            text = (description or "").strip().lower()
+            if text not in seen:
+                seen[text] = self._classify(text) if text else "other"
+            out.append(seen[text])
+        return out
+
+
+@lru_cache(maxsize=1)
+def load_model() -> Categorizer:
+    """The model at MODEL_PATH, read on the first call."""
+    return Categorizer.load(MODEL_PATH)
+
+
+def suggest(description: str | None) -> tuple[str, bool]:
+    return load_model().suggest(description)
+
+
+def predict(description: str | None) -> str:
+    return load_model().predict(description)
+
+
+def predict_many(descriptions: Iterable[str | None]) -> list[str]:
+    return load_model().predict_many(descriptions)
@@ -0,0 +1,231 @@
+"""Chart rendering off the bot's event loop.
+
+`render_category_pie` draws on an object-oriented Figure with the Agg
+canvas — no pyplot global state — so it is safe to run anywhere and is
+executed in a small process pool by `render_chart()`. A PNG encode at
+2400×2400 takes hundreds of milliseconds of pure CPU; in the pool it no
+longer stalls every other user's updates. The pool is bounded: when more
+than CHART_QUEUE_SIZE renders are already waiting, callers get ChartBusy
+instead of queueing indefinitely, and a render that exceeds CHART_TIMEOUT
+raises ChartTimeout. `ChartCache` keeps finished charts so unchanged data
+is never rendered (or uploaded to Telegram) twice.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+CHART_QUEUE_SIZE = int(os.getenv("CHART_QUEUE_SIZE", "16"))  # renders running or waiting
+CHART_TIMEOUT = float(os.getenv("CHART_TIMEOUT", "20"))  # seconds
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "256"))  # charts kept in memory
+CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR") or None  # unset: memory only
+
+PIE_COLORS = ["#FF6B6B", "#4ECDC4", "#45B7D1", "#FFA07A", "#98D8C8"]
+
+
+class ChartBusy(Exception):
+    """Too many renders are already waiting."""
+
+
+class ChartTimeout(Exception):
+    """A render took longer than CHART_TIMEOUT."""
+
+
+def render_category_pie(values: list[float], labels: list[str], title: str) -> bytes:
+    """PNG bytes of an 8×8in, 300dpi pie chart with percentage labels."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(8, 8), dpi=300)
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    ax.pie(values, labels=labels, autopct="%1.0f%%", colors=PIE_COLORS)
+    ax.set_title(title)
+    ax.set_ylabel("")
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+def _warm_up() -> None:
+    # Pay matplotlib's import and font-cache cost when the worker starts,
+    # not on the first user's chart.
+    import matplotlib.backends.backend_agg  # noqa: F401
+    import matplotlib.figure  # noqa: F401
+
+
+_pool: ProcessPoolExecutor | None = None
+_slots: asyncio.Semaphore | None = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the bot process runs threads (DB drivers,
+        # to_thread) that a forked child could inherit mid-lock.
+        _pool = ProcessPoolExecutor(
+            max_workers=CHART_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_up,
+        )
+    return _pool
+
+
+def _reset_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def render_chart(func, *args) -> bytes:
+    """Run a module-level render function in the pool and return its PNG."""
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(CHART_QUEUE_SIZE)
+    if _slots.locked():
+        raise ChartBusy()
+    async with _slots:
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(_get_pool(), func, *args), CHART_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            # The worker finishes it in the background; only the caller
+            # stops waiting and frees its queue slot.
+            logger.warning("chart render timed out after %ss", CHART_TIMEOUT)
+            raise ChartTimeout() from None
+        except BrokenProcessPool:
+            logger.warning("chart pool broke (worker died); restarting it")
+            _reset_pool()
+            raise
+
+
+def start_chart_pool() -> None:
+    """Spin the workers up ahead of the first request. The bot leaves the
+    pool (and matplotlib) to the first chart, so startup doesn't pay for it."""
+    pool = _get_pool()
+    for _ in range(CHART_WORKERS):
+        pool.submit(_warm_up)
+
+
+def shutdown_chart_pool() -> None:
+    _reset_pool()
+
+
+class ChartCache:
+    """Rendered charts by content key: a bounded in-memory LRU, an optional
+    on-disk tier (CHART_CACHE_DIR) that survives restarts, and the Telegram
+    file_id of each chart once it has been uploaded, so a repeat send is a
+    file_id reference instead of a fresh upload. The key must cover every
+    input to the picture; see `key()`."""
+
+    def __init__(self, max_entries: int = CHART_CACHE_SIZE, directory: str | None = CHART_CACHE_DIR):
+        self.max_entries = max_entries
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # key → [png bytes | None, file_id | None]
+        self._entries: OrderedDict[str, list] = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.file_id_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(*parts) -> str:
+        return hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def _store(self, key: str, entry: list) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _write(self, key: str, suffix: str, data: bytes) -> None:
+        # Write-then-rename, so a concurrent reader never sees half a file.
+        tmp = self._path(key, suffix + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._path(key, suffix))
+
+    def get(self, key: str) -> tuple[bytes | None, str | None]:
+        """(png, file_id) for a cached chart; (None, None) on a miss."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        elif self.directory and os.path.exists(self._path(key, ".png")):
+            try:
+                with open(self._path(key, ".png"), "rb") as f:
+                    png = f.read()
+                file_id = None
+                if os.path.exists(self._path(key, ".file_id")):
+                    with open(self._path(key, ".file_id")) as f:
+                        file_id = f.read().strip() or None
+            except OSError:
+                self.misses += 1
+                return None, None
+            entry = [png, file_id]
+            self._store(key, entry)
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            return None, None
+        if entry[1]:
+            self.file_id_hits += 1
+        return entry[0], entry[1]
+
+    def put(self, key: str, png: bytes) -> None:
+        self._store(key, [png, None])
+        if self.directory:
+            try:
+                self._write(key, ".png", png)
+            except OSError as exc:
+                logger.warning("chart cache: could not write %s: %r", key, exc)
+
+    def remember_file_id(self, key: str, file_id: str) -> None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry[1] = file_id
+        if self.directory:
+            try:
+                self._write(key, ".file_id", file_id.encode())
+            except OSError as exc:
+                logger.warning("chart cache: could not write %s: %r", key, exc)
+
+    def forget_file_id(self, key: str) -> None:
+        """Telegram refused the stored file_id; upload again next time."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry[1] = None
+        if self.directory:
+            try:
+                os.remove(self._path(key, ".file_id"))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "file_id_hits": self.file_id_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
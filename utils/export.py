@@ -0,0 +1,278 @@
+"""Streaming CSV and Parquet export, and reading both back for import.
+
+Rows come from the database EXPORT_BATCH at a time (`yield_per`, which is
+a server-side cursor on Postgres) and are encoded into chunks of about
+CHUNK_SIZE bytes as they arrive, optionally gzipped on the way, so an
+export holds one batch and one chunk in memory however long the history.
+`stream_csv()` drives a sync iterable (the webapp's StreamingResponse),
+`astream_csv()` an async one (the bot), and `StreamedInputFile` hands such
+a stream to aiogram, which uploads it to Telegram chunk by chunk.
+
+Parquet (`stream_parquet()` / `astream_parquet()`) takes the same rows in
+batches and writes each as a zstd-compressed row group. It needs pyarrow,
+imported only when a Parquet export or import actually runs.
+
+For import, `read_csv()` and `read_parquet()` hand a file back READ_BATCH
+rows at a time as lists of column values, never as one dict per row.
+"""
+
+import csv
+import io
+import itertools
+import zlib
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, Iterator, Sequence
+
+from aiogram.types import InputFile
+
+EXPORT_BATCH = 1000  # rows per fetch from the database
+CHUNK_SIZE = 64 * 1024  # bytes per yielded chunk, before compression
+
+
+class CsvChunker:
+    """Encodes CSV rows into byte chunks of about `chunk_size`. `write()`
+    returns b"" until a chunk is full; `close()` returns the rest."""
+
+    def __init__(self, header: Sequence, bom: bool = False, gzip: bool = False,
+                 chunk_size: int = CHUNK_SIZE):
+        self._buf = io.StringIO()
+        self._writer = csv.writer(self._buf)
+        self._chunk_size = chunk_size
+        # wbits=31: a gzip container rather than a bare zlib stream.
+        self._gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+        if bom:
+            # Excel needs the BOM to read the file as UTF-8.
+            self._buf.write("﻿")
+        self._writer.writerow(header)
+
+    def _take(self) -> bytes:
+        data = self._buf.getvalue().encode("utf-8")
+        self._buf.seek(0)
+        self._buf.truncate()
+        return self._gzip.compress(data) if self._gzip else data
+
+    def write(self, row: Sequence) -> bytes:
+        self._writer.writerow(row)
+        return self._take() if self._buf.tell() >= self._chunk_size else b""
+
+    def close(self) -> bytes:
+        data = self._take()
+        return data + self._gzip.flush() if self._gzip else data
+
+
+def stream_csv(rows: Iterable, header: Sequence, format_row: Callable[..., Sequence],
+               **options) -> Iterator[bytes]:
+    chunker = CsvChunker(header, **options)
+    for row in rows:
+        if chunk := chunker.write(format_row(row)):
+            yield chunk
+    yield chunker.close()
+
+
+async def astream_csv(rows: AsyncIterable, header: Sequence, format_row: Callable[..., Sequence],
+                      **options) -> AsyncIterator[bytes]:
+    chunker = CsvChunker(header, **options)
+    async for row in rows:
+        if chunk := chunker.write(format_row(row)):
+            yield chunk
+    yield chunker.close()
+
+
+# The bot's CSV layout, typed.
+PARQUET_COLUMNS = (
+    ("id", "int64"), ("amount", "float64"), ("category", "string"),
+    ("description", "string"), ("created_at", "timestamp"), ("currency", "string"),
+)
+
+
+def _pyarrow():
+    # Imported on first use: it's heavy and only Parquet needs it.
+    import pyarrow
+    import pyarrow.parquet
+
+    return pyarrow
+
+
+def parquet_schema():
+    pa = _pyarrow()
+    types = {"int64": pa.int64(), "float64": pa.float64(), "string": pa.string(),
+             "timestamp": pa.timestamp("us")}
+    return pa.schema([(name, types[kind]) for name, kind in PARQUET_COLUMNS])
+
+
+class _Sink(io.RawIOBase):
+    """A write-only file that hands what was written back on `take()`."""
+
+    def __init__(self):
+        self._parts: list[bytes] = []
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def take(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+class ParquetChunker:
+    """Writes batches of rows (tuples in PARQUET_COLUMNS order) as row
+    groups and returns the bytes each produced."""
+
+    def __init__(self):
+        self._pa = _pyarrow()
+        self._schema = parquet_schema()
+        self._sink = _Sink()
+        self._writer = self._pa.parquet.ParquetWriter(self._sink, self._schema, compression="zstd")
+
+    def write(self, rows: Sequence[Sequence]) -> bytes:
+        if rows:
+            columns = list(zip(*rows))
+            self._writer.write_batch(self._pa.RecordBatch.from_arrays(
+                [self._pa.array(col, type=field.type) for col, field in zip(columns, self._schema)],
+                schema=self._schema,
+            ))
+        return self._sink.take()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._sink.take()
+
+
+def stream_parquet(batches: Iterable[Sequence[Sequence]]) -> Iterator[bytes]:
+    chunker = ParquetChunker()
+    for rows in batches:
+        if chunk := chunker.write(rows):
+            yield chunk
+    yield chunker.close()
+
+
+async def astream_parquet(batches: AsyncIterable[Sequence[Sequence]]) -> AsyncIterator[bytes]:
+    chunker = ParquetChunker()
+    async for rows in batches:
+        if chunk := chunker.write(rows):
+            yield chunk
+    yield chunker.close()
+
+
+PARQUET_MAGIC = b"PAR1"  # first four bytes of every Parquet file
+READ_BATCH = 5000  # rows per batch the readers below hand to an import
+
+
+def read_parquet(data) -> Iterator[dict[str, list]]:
+    """The rows of a Parquet file in batches of READ_BATCH, each a dict of
+    column lists, read one row group slice at a time. Raises ValueError when
+    it isn't Parquet or lacks one of PARQUET_COLUMNS (`id` and
+    `description` may be missing)."""
+    pa = _pyarrow()
+    try:
+        file = pa.parquet.ParquetFile(pa.BufferReader(data))
+    except pa.ArrowException as e:
+        raise ValueError(f"not a Parquet file: {e}") from e
+    names = set(file.schema_arrow.names)
+    missing = {name for name, _ in PARQUET_COLUMNS} - {"id", "description"} - names
+    if missing:
+        raise ValueError(f"missing columns: {', '.join(sorted(missing))}")
+    columns = [name for name, _ in PARQUET_COLUMNS if name in names]
+    return _parquet_batches(pa, file, columns)
+
+
+def _parquet_batches(pa, file, columns: list[str]) -> Iterator[dict[str, list]]:
+    try:
+        for batch in file.iter_batches(batch_size=READ_BATCH, columns=columns):
+            yield batch.to_pydict()
+    except pa.ArrowException as e:
+        raise ValueError(f"unreadable Parquet file: {e}") from e
+
+
+# The bot's export layout. `amount` and `created_at` are required; a file
+# without this header row is read positionally in this order.
+CSV_COLUMNS = ("id", "amount", "category", "description", "created_at", "currency")
+# The Mini App's export has no id and splits created_at into these two.
+CSV_DATE_COLUMNS = ("date", "time")
+
+
+def read_csv(data: bytes) -> Iterator[dict[str, list]]:
+    """The rows of a CSV file in CSV_COLUMNS' layout (or the Mini App's,
+    with `date` and `time` for `created_at`) in batches of READ_BATCH, each
+    a dict of column lists: strings, with `id` parsed when it's a number
+    and `line` the row's line in the file. Raises ValueError when it can't
+    be read."""
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        raise ValueError("CSV must be UTF-8") from e
+    reader = csv.reader(io.StringIO(text, newline=""))
+    first = next(reader, None)
+    if first is None:
+        return iter(())
+    header = [name.strip().lower() for name in first]
+    split_date = "created_at" not in header and CSV_DATE_COLUMNS[0] in header
+    if set(header) & set(CSV_COLUMNS):
+        missing = {"amount", CSV_DATE_COLUMNS[0] if split_date else "created_at"} - set(header)
+        if missing:
+            raise ValueError(f"missing columns: {', '.join(sorted(missing))}")
+        names, lines = header, _numbered(reader)
+    else:
+        names, lines = CSV_COLUMNS, itertools.chain([(1, first)], _numbered(reader))
+    return _csv_batches({name: i for i, name in enumerate(names)}, lines, split_date)
+
+
+def _numbered(reader):
+    start = reader.line_num + 1
+    for values in reader:
+        yield start, values
+        start = reader.line_num + 1
+
+
+def _csv_batches(index: dict[str, int], lines, split_date: bool) -> Iterator[dict[str, list]]:
+    batch = []
+    for line, values in lines:
+        if not any(v.strip() for v in values):
+            continue
+        batch.append((line, values))
+        if len(batch) == READ_BATCH:
+            yield _csv_columns(batch, index, split_date)
+            batch = []
+    if batch:
+        yield _csv_columns(batch, index, split_date)
+
+
+def _csv_columns(batch: list[tuple[int, list[str]]], index: dict[str, int],
+                 split_date: bool) -> dict[str, list]:
+    def column(name: str) -> list:
+        i = index.get(name)
+        return [values[i] if i is not None and i < len(values) else None for _, values in batch]
+
+    columns = {name: column(name) for name in CSV_COLUMNS}
+    if split_date:
+        columns["created_at"] = [
+            " ".join((part or "").strip() for part in parts).strip()
+            for parts in zip(*(column(name) for name in CSV_DATE_COLUMNS))
+        ]
+    columns["id"] = [int(v.strip()) if v and v.strip().isdigit() else None for v in columns["id"]]
+    # Where each row starts in the file, for error messages.
+    columns["line"] = [line for line, _ in batch]
+    return columns
+
+
+class StreamedInputFile(InputFile):
+    """An upload whose bytes come from `make_stream()`, called when aiogram
+    sends the request, so nothing is produced before Telegram reads it."""
+
+    def __init__(self, make_stream: Callable[[], AsyncIterator[bytes]], filename: str):
+        super().__init__(filename=filename)
+        self._make_stream = make_stream
+
+    async def read(self, bot) -> AsyncIterator[bytes]:
+        async for chunk in self._make_stream():
+            if chunk:
+                yield chunk
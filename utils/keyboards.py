@@ -156,16 +156,20 @@ def get_category_keyboard(expense_id: int, lang: str = "en") -> InlineKeyboardMa
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_pending_expense_category_keyboard(lang: str = "en") -> InlineKeyboardMarkup:
+def get_pending_expense_category_keyboard(lang: str = "en", suggested: str | None = None) -> InlineKeyboardMarkup:
+    """Category buttons for a pending expense; `suggested`, the
+    categorizer's unsure guess, is marked and still has to be tapped."""
+    def button(category: str) -> InlineKeyboardButton:
+        text = t_category(lang, category)
+        return InlineKeyboardButton(text=f"✅ {text}" if category == suggested else text,
+                                    callback_data=f"pending_expense_category:{category}")
+
     keyboard = []
     for i, category in enumerate(EXPENSE_CATEGORIES):
         if i % 2 == 0:
-            row = [InlineKeyboardButton(text=t_category(lang, category),
-                                        callback_data=f"pending_expense_category:{category}")]
+            row = [button(category)]
             if i + 1 < len(EXPENSE_CATEGORIES):
-                next_category = EXPENSE_CATEGORIES[i + 1]
-                row.append(InlineKeyboardButton(text=t_category(lang, next_category),
-                                                callback_data=f"pending_expense_category:{next_category}"))
+                row.append(button(EXPENSE_CATEGORIES[i + 1]))
             keyboard.append(row)
 
     keyboard.append([InlineKeyboardButton(text=t(lang, "common.cancel"), callback_data="pending_expense_cancel")])
@@ -209,6 +213,7 @@ def get_export_keyboard(lang: str = "en") -> InlineKeyboardMarkup:
     keyboard = [
         [InlineKeyboardButton(text=t(lang, 'export.current_month'), callback_data='export_current_month')],
         [InlineKeyboardButton(text=t(lang, 'export.all'), callback_data='export_all')],
+        [InlineKeyboardButton(text=t(lang, 'export.all_parquet'), callback_data='export_all_parquet')],
         [InlineKeyboardButton(text=t(lang, 'common.cancel'), callback_data='export_cancel')],
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
\ No newline at end of file
@@ -0,0 +1,302 @@
+"""Monobank personal API helpers shared by the webapp and the bot worker:
+token encryption, a pooled rate-limited async client, the MCC/transfer/refund tables used to
+classify statement items, and turning client-info into the rows kept in
+`mono_accounts`."""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import deque
+
+import aiohttp
+from cryptography.fernet import Fernet
+
+from utils.ratelimit import RateLimited, TokenBucket
+
+# Overridable so local runs can point at scripts/fake_mono.py.
+MONO_API = os.getenv("MONO_API_URL", "https://api.monobank.ua")
+MONO_CONNECT_TIMEOUT = float(os.getenv("MONO_CONNECT_TIMEOUT", "5"))  # seconds
+MONO_READ_TIMEOUT = float(os.getenv("MONO_READ_TIMEOUT", "15"))  # seconds
+_POOL_SIZE = 20
+
+# Monobank serves each of these at most once per 60s per token.
+_RATE_LIMITED_PATHS = ("/personal/client-info", "/personal/statement")
+MONO_RATE_PERIOD = 60  # seconds
+# Monobank counts the period from when it saw the call, which is a round
+# trip later than when our bucket released it.
+_RATE_MARGIN = 1.0  # seconds
+
+MONO_CURRENCY = {980: "UAH", 978: "EUR", 840: "USD", 826: "GBP"}
+
+# Monobank MCC (merchant category code) → our canonical lowercase category.
+_MONO_MCC_GROUPS = {
+    "food":          [5411, 5412, 5441, 5451, 5462, 5499, 5812, 5813, 5814],
+    "transport":     [4111, 4121, 4131, 4784, 7511, 7512, 7513, 7519],
+    "shopping":      [5300, 5310, 5311, 5331, 5399, 5600, 5621, 5631, 5641,
+                      5651, 5661, 5691, 5699, 5732, 5734, 5999],
+    "health":        [5047, 5122, 5912, 8011, 8021, 8031, 8049, 8062, 8099],
+    "entertainment": [7832, 7922, 7929, 7941, 7991, 7993, 7994, 7995, 7999],
+    "beauty":        [7230, 7231, 7297],
+    "travel":        [3000, 4411, 4511, 4722, 7011, 7012],
+    "education":     [8211, 8220, 8241, 8244, 8249, 8299],
+    "housing":       [1520, 1711, 1731, 1740, 1750, 1761, 5200, 5211, 5251],
+}
+MONO_MCC_CATEGORY = {mcc: cat for cat, mccs in _MONO_MCC_GROUPS.items() for mcc in mccs}
+
+# Monobank stamps money transfers (card-to-card, "Між своїми", P2P to a
+# person) with MCC 4829 — never a retail purchase. Used to tell transfers
+# apart from spending when applying webhook events.
+MONO_TRANSFER_MCC = 4829
+
+# For MCC 4829, Monobank leaves counterName empty for BOTH self-transfers
+# and P2P sends to other people — the only thing that differs is the
+# free-form description. Self-transfers carry one of these generic phrases
+# (often followed by a card mask); a P2P to a person carries their name.
+# Compared lower-cased via startswith, so trailing card masks don't matter.
+MONO_OWN_TRANSFER_PHRASES = (
+    "переказ на картку",
+    "переказ між рахунками",
+    "між своїми",
+    "на свою картку",
+    "перевод на карту",
+)
+
+# Markers Monobank uses in the description of a positive-amount transaction to
+# indicate it's a reversal of a prior charge (not income). Compared lower-cased
+# via `in`, so substring matches anywhere in the description.
+MONO_REFUND_MARKERS = (
+    "повернення",
+    "refund",
+    "возврат",
+    "скасування",
+)
+
+
+def _get_fernet() -> Fernet:
+    # Read at call time: the webapp loads .env after importing this module.
+    key = os.environ.get("MONO_ENCRYPTION_KEY")
+    if not key:
+        raise RuntimeError("MONO_ENCRYPTION_KEY not configured")
+    return Fernet(key.encode())
+
+
+def encrypt_token(token: str) -> str:
+    return _get_fernet().encrypt(token.encode()).decode()
+
+
+def decrypt_token(encrypted: str) -> str:
+    return _get_fernet().decrypt(encrypted.encode()).decode()
+
+
+class MonoError(Exception):
+    """No usable answer from Monobank (network error, timeout, bad body)."""
+
+
+class MonoAPIError(MonoError):
+    """Monobank answered with an error status — e.g. a rejected token."""
+
+    def __init__(self, status: int, body: str = ""):
+        super().__init__(f"Monobank returned HTTP {status}")
+        self.status = status
+        self.body = body
+
+
+class MonoRateLimited(MonoError):
+    """The call would break Monobank's per-token limit (or Monobank said so)."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Monobank rate limit, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class MonoMetrics:
+    """Counters for the shared client; `snapshot()` is what gets logged."""
+
+    def __init__(self):
+        self.requests = 0          # calls that reached the network
+        self.errors = 0            # network failures and non-2xx answers
+        self.coalesced = 0         # callers served by another caller's call
+        self.throttled = 0         # calls that waited on the local limiter
+        self.throttle_wait = 0.0   # seconds spent waiting on it
+        self.rejected = 0          # calls refused locally instead of waiting
+        self.server_throttled = 0  # 429s from Monobank despite the limiter
+        self.latencies: deque[float] = deque(maxlen=1024)
+
+    def snapshot(self) -> dict:
+        lat = sorted(self.latencies)
+
+        def pct(p: float) -> float:
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1000, 1) if lat else 0.0
+
+        return {
+            "requests": self.requests, "errors": self.errors,
+            "coalesced": self.coalesced, "throttled": self.throttled,
+            "throttle_wait_s": round(self.throttle_wait, 2), "rejected": self.rejected,
+            "server_throttled": self.server_throttled,
+            "p50_ms": pct(0.5), "p95_ms": pct(0.95), "max_ms": pct(1.0),
+        }
+
+
+class MonoClient:
+    """Keep-alive client for the Monobank personal API.
+
+    One pooled aiohttp session per event loop. Rate-limited endpoints get a
+    token bucket per (token, endpoint), so the one-call-per-60s limit is
+    respected before Monobank has to enforce it. Concurrent GETs for the
+    same token and path share one in-flight request. The raw token travels
+    only in the X-Token header and is never used as a key, logged or raised.
+    """
+
+    def __init__(
+        self,
+        base_url: str = MONO_API,
+        connect_timeout: float = MONO_CONNECT_TIMEOUT,
+        read_timeout: float = MONO_READ_TIMEOUT,
+        rate_period: float = MONO_RATE_PERIOD,
+        pool_size: int = _POOL_SIZE,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.rate_period = rate_period
+        self._timeout = aiohttp.ClientTimeout(total=None, connect=connect_timeout,
+                                              sock_read=read_timeout)
+        self._pool_size = pool_size
+        self._session: aiohttp.ClientSession | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self._buckets: dict[tuple[str, str], TokenBucket] = {}
+        self._inflight: dict[tuple[str, str], asyncio.Task] = {}
+        self.metrics = MonoMetrics()
+
+    def _http(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self.loop = asyncio.get_running_loop()
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._pool_size, keepalive_timeout=30),
+                timeout=self._timeout,
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _bucket(self, token_key: str, path: str) -> TokenBucket | None:
+        endpoint = next((p for p in _RATE_LIMITED_PATHS if path.startswith(p)), None)
+        if endpoint is None:
+            return None
+        bucket = self._buckets.get((token_key, endpoint))
+        if bucket is None:
+            bucket = self._buckets[(token_key, endpoint)] = TokenBucket(1 / (self.rate_period + _RATE_MARGIN))
+        return bucket
+
+    async def request(self, path: str, token: str, payload: dict | None = None,
+                      max_wait: float | None = 0) -> dict:
+        """GET `path` (POST when `payload` is given) and return the decoded
+        JSON. A rate-limited call waits up to `max_wait` seconds for its turn
+        (forever if None) and raises MonoRateLimited rather than wait longer."""
+        token_key = hashlib.sha256(token.encode()).hexdigest()
+        if payload is not None:
+            return await self._send(token_key, path, token, payload, max_wait)
+
+        key = (token_key, path)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.metrics.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._send(token_key, path, token, None, max_wait))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: tuple[str, str], task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # retrieved here so an abandoned failure isn't logged as unhandled
+
+    async def _send(self, token_key: str, path: str, token: str,
+                    payload: dict | None, max_wait: float | None) -> dict:
+        bucket = self._bucket(token_key, path)
+        if bucket is not None:
+            try:
+                waited = await bucket.acquire(max_wait)
+            except RateLimited as exc:
+                self.metrics.rejected += 1
+                raise MonoRateLimited(exc.retry_after) from None
+            if waited:
+                self.metrics.throttled += 1
+                self.metrics.throttle_wait += waited
+
+        self.metrics.requests += 1
+        started = time.perf_counter()
+        try:
+            async with self._http().request(
+                "POST" if payload is not None else "GET",
+                f"{self.base_url}{path}",
+                json=payload,
+                headers={"X-Token": token},
+            ) as resp:
+                status, raw = resp.status, await resp.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            self.metrics.errors += 1
+            raise MonoError(f"could not reach Monobank: {type(exc).__name__}") from None
+        finally:
+            self.metrics.latencies.append(time.perf_counter() - started)
+
+        if status == 429:
+            self.metrics.server_throttled += 1
+            if bucket is not None:
+                bucket.penalize()
+            raise MonoRateLimited(self.rate_period)
+        if status >= 400:
+            self.metrics.errors += 1
+            raise MonoAPIError(status, raw[:200])
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError:
+            self.metrics.errors += 1
+            raise MonoError("Monobank returned invalid JSON") from None
+
+
+_client: MonoClient | None = None
+
+
+def get_mono_client() -> MonoClient:
+    """The process-wide client for the running event loop."""
+    global _client
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.loop not in (None, loop):
+        _client = MonoClient()
+    return _client
+
+
+async def close_mono_client() -> None:
+    if _client is not None:
+        await _client.close()
+
+
+async def mono_request(path: str, token: str, payload: dict | None = None,
+                       max_wait: float | None = 0) -> dict:
+    """Call the Monobank personal API through the shared client."""
+    return await get_mono_client().request(path, token, payload, max_wait)
+
+
+def account_rows(info: dict) -> list[dict]:
+    """`mono_accounts` rows for every account and jar in a client-info
+    response. IBANs are stripped and upper-cased so webhook counterIban
+    values compare equal; jars count too — money moved to your own jar is a
+    self-transfer, not spending."""
+    rows = []
+    for is_jar, items in ((False, info.get("accounts", [])), (True, info.get("jars", []))):
+        for item in items:
+            acc_id = item.get("id")
+            if not acc_id:
+                continue
+            rows.append({
+                "account_id": acc_id,
+                "iban": (item.get("iban") or "").strip().upper() or None,
+                "currency": MONO_CURRENCY.get(item.get("currencyCode")),
+                "is_jar": is_jar,
+            })
+    return rows
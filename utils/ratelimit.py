@@ -0,0 +1,56 @@
+"""Async token bucket used to stay inside third-party rate limits before
+they are hit, rather than reacting to 429s afterwards."""
+
+import asyncio
+import time
+
+
+class RateLimited(Exception):
+    """Acquiring would have meant waiting longer than the caller allowed."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"rate limited, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """`capacity` tokens, refilled at `rate` tokens per second.
+
+    Waiters reserve their token up front (the balance may go negative), so
+    concurrent callers are served in arrival order without a lock.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token would be available, without taking one."""
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+    async def acquire(self, max_wait: float | None = None) -> float:
+        """Take a token, sleeping until one is available. Raises RateLimited
+        instead when that would take longer than `max_wait` seconds.
+        Returns the time spent waiting."""
+        wait = self.delay()
+        if max_wait is not None and wait > max_wait:
+            raise RateLimited(wait)
+        self._tokens -= 1
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def penalize(self, retry_after: float | None = None) -> None:
+        """The remote side throttled us anyway: empty the bucket so the next
+        token is at least `retry_after` seconds away (one refill by default)."""
+        self._refill()
+        retry_after = retry_after if retry_after is not None else 1 / self.rate
+        self._tokens = min(self._tokens, 1 - retry_after * self.rate)
@@ -0,0 +1,145 @@
+"""Single-pass stats engine behind /api/stats.
+
+The endpoint fetches one grouped result — (day, currency, category) buckets
+with sum and count — and every field of the response is derived from it
+here in Python, instead of issuing a query per total/count/day."""
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Iterable, NamedTuple
+
+
+class Bucket(NamedTuple):
+    day: date
+    currency: str | None
+    category: str | None
+    total: float
+    count: int
+
+
+def _as_date(value) -> date:
+    # func.date() comes back as 'YYYY-MM-DD' on SQLite and a date on Postgres.
+    if isinstance(value, str):
+        return datetime.strptime(value[:10], "%Y-%m-%d").date()
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def to_buckets(rows: Iterable) -> list[Bucket]:
+    """Normalise raw (day, currency, category, sum, count) rows."""
+    return [
+        Bucket(_as_date(day), cur, cat, float(total or 0.0), int(count or 0))
+        for day, cur, cat, total, count in rows
+    ]
+
+
+def stats_window_start(
+    now: datetime,
+    period_start: datetime | None,
+    custom_start: datetime | None,
+    custom_end: datetime | None,
+    custom: bool,
+) -> datetime | None:
+    """Earliest `created_at` any field of the response can look at, so one
+    query covers the month, the 7-day sparkline and the selected period.
+    None means unbounded (a custom period without a valid range)."""
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    seven_start = (now - timedelta(days=6)).replace(hour=0, minute=0, second=0, microsecond=0)
+    starts = [month_start, seven_start]
+    if custom:
+        if not (custom_start and custom_end):
+            return None
+        starts.append(custom_start)
+    elif period_start:
+        starts.append(period_start)
+    return min(starts)
+
+
+def build_stats(
+    buckets: list[Bucket],
+    now: datetime,
+    period_start: datetime | None,
+    custom_start: datetime | None,
+    custom_end: datetime | None,
+    custom: bool,
+    currency: str | None,
+) -> dict:
+    """Assemble the /api/stats payload from day buckets. Every window the
+    endpoint uses starts at midnight, so day granularity is exact."""
+    today = now.date()
+    week_start = today - timedelta(days=today.weekday())
+    month_start = today.replace(day=1)
+    week_days = [today - timedelta(days=i) for i in range(6, -1, -1)]
+
+    since = period_start.date() if period_start else month_start
+
+    def in_period(d: date) -> bool:
+        # Custom is a [from, to+1d) window, or everything when the range is
+        # missing/invalid; the presets are open-ended `>= since`.
+        if custom:
+            if custom_start and custom_end:
+                return custom_start.date() <= d < custom_end.date()
+            return True
+        return d >= since
+
+    totals = {"today": defaultdict(float), "week": defaultdict(float), "month": defaultdict(float)}
+    counts = {"today": 0, "week": 0, "month": 0}
+    cat_today: dict[str, dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    cat_week: dict[str, dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    currencies: set[str] = set()
+    by_category: dict = defaultdict(float)
+    daily = {d: 0.0 for d in week_days}
+    daily_by_cur: dict[tuple[date, str], float] = defaultdict(float)
+
+    for b in buckets:
+        cur = b.currency or "EUR"
+        for key, start in (("today", today), ("week", week_start), ("month", month_start)):
+            if b.day >= start:
+                totals[key][cur] += b.total
+                counts[key] += b.count
+        cat_key = (b.category or "other").lower()
+        if b.day >= today:
+            cat_today[cur][cat_key] += b.total
+        if b.day >= week_start:
+            cat_week[cur][cat_key] += b.total
+
+        if in_period(b.day):
+            currencies.add(cur)
+            if not currency or b.currency == currency:
+                by_category[b.category] += b.total
+
+        if b.day in daily:
+            if not currency or b.currency == currency:
+                daily[b.day] += b.total
+            daily_by_cur[(b.day, cur)] += b.total
+
+    def rounded(d: dict) -> dict:
+        return {k: round(v, 2) for k, v in sorted(d.items())}
+
+    day_labels = [(d, d.strftime("%Y-%m-%d")) for d in week_days]
+    # `daily_last_7` keeps the legacy single-series shape (honours the
+    # `currency` filter) for Analytics; `daily_by_currency` feeds the
+    # Dashboard sparkline and is intentionally unfiltered so its currency
+    # switcher always sees every currency. `by_category_today/_week` drive
+    # the per-category budget bars — empty buckets are simply absent.
+    return {
+        "today": rounded(totals["today"]),
+        "week":  rounded(totals["week"]),
+        "month": rounded(totals["month"]),
+        "count_today": counts["today"],
+        "count_week":  counts["week"],
+        "count_month": counts["month"],
+        "currencies":  sorted(currencies),
+        "by_category": [
+            {"category": cat, "total": round(total, 2)}
+            for cat, total in sorted(by_category.items(), key=lambda kv: kv[1], reverse=True)
+        ],
+        "by_category_today": {cur: rounded(cats) for cur, cats in sorted(cat_today.items())},
+        "by_category_week":  {cur: rounded(cats) for cur, cats in sorted(cat_week.items())},
+        "daily_last_7": [{"date": label, "total": round(daily[d], 2)} for d, label in day_labels],
+        "daily_by_currency": {
+            c: [{"date": label, "total": round(daily_by_cur.get((d, c), 0.0), 2)} for d, label in day_labels]
+            for c in sorted({cur for (_, cur) in daily_by_cur})
+        },
+    }
@@ -119,10 +119,16 @@ TRANSLATIONS = {
         "export.menu_title": "Choose export option:",
         "export.current_month": "Export current month",
         "export.all": "Export all expenses",
+        "export.all_parquet": "Export all (Parquet)",
         "export.cancelled": "❌ Export cancelled",
         "export.ready": "Export ready ✅",
         "export.no_all": "You don't have any expenses to export.",
         "export.no_month": "You don't have any expenses this month to export.",
+        "import.unsupported": "📎 Send a .csv or .parquet file in the export layout to import expenses.",
+        "import.too_large": "The file is too large (max {mb} MB).",
+        "import.invalid": "Couldn't read the file: {error}",
+        "import.done": "📥 Imported: <b>{imported}</b>\nAlready saved, skipped: {skipped}\nRows with errors: {errors}",
+        "import.error_line": "• line {row}: {error}",
         "common.cancel": "❌ Cancel",
         "common.unknown_setting": "Unknown setting",
         "expense.cancelled": "❌ Cancelled.",
@@ -171,6 +177,7 @@ TRANSLATIONS = {
         "reports.chart_title": "Expenses by Category ({start} - {end})",
         "reports.chart_title_currency": "Expenses by Category ({start} - {end}) - {currency}",
         "reports.chart_caption": "Here is your pie chart by categories for this month ({start} - {end}).",
+        "reports.chart_busy": "Charts are busy right now — please try again in a minute.",
         "admin.menu_title": "🛠 Admin panel",
         "admin.feedbacks_btn": "📬 Feedbacks ({count} new)",
         "admin.broadcast_btn": "📢 Broadcast",
@@ -312,10 +319,16 @@ TRANSLATIONS = {
         "export.menu_title": "Выберите вариант экспорта:",
         "export.current_month": "Экспорт за текущий месяц",
         "export.all": "Экспорт всех расходов",
+        "export.all_parquet": "Экспорт всех (Parquet)",
         "export.cancelled": "❌ Экспорт отменён",
         "export.ready": "Экспорт готов ✅",
         "export.no_all": "У вас нет расходов для экспорта.",
         "export.no_month": "У вас нет расходов за этот месяц для экспорта.",
+        "import.unsupported": "📎 Чтобы импортировать расходы, отправьте файл .csv или .parquet в формате экспорта.",
+        "import.too_large": "Файл слишком большой (максимум {mb} МБ).",
+        "import.invalid": "Не удалось прочитать файл: {error}",
+        "import.done": "📥 Импортировано: <b>{imported}</b>\nУже были сохранены, пропущено: {skipped}\nСтрок с ошибками: {errors}",
+        "import.error_line": "• строка {row}: {error}",
         "common.cancel": "❌ Отмена",
         "common.unknown_setting": "Неизвестная настройка",
         "expense.cancelled": "❌ Отменено.",
@@ -364,6 +377,7 @@ TRANSLATIONS = {
         "reports.chart_title": "Расходы по категориям ({start} - {end})",
         "reports.chart_title_currency": "Расходы по категориям ({start} - {end}) - {currency}",
         "reports.chart_caption": "Вот ваш круговой график по категориям за этот месяц ({start} - {end}).",
+        "reports.chart_busy": "Сейчас графики перегружены — попробуйте через минуту.",
         "admin.menu_title": "🛠 Админ панель",
         "admin.feedbacks_btn": "📬 Фидбеки ({count} новых)",
         "admin.broadcast_btn": "📢 Рассылка",
@@ -505,10 +519,16 @@ TRANSLATIONS = {
         "export.menu_title": "Оберіть варіант експорту:",
         "export.current_month": "Експорт за поточний місяць",
         "export.all": "Експорт усіх витрат",
+        "export.all_parquet": "Експорт усіх (Parquet)",
         "export.cancelled": "❌ Експорт скасовано",
         "export.ready": "Експорт готовий ✅",
         "export.no_all": "У вас немає витрат для експорту.",
         "export.no_month": "У вас немає витрат за цей місяць для експорту.",
+        "import.unsupported": "📎 Щоб імпортувати витрати, надішліть файл .csv або .parquet у форматі експорту.",
+        "import.too_large": "Файл завеликий (максимум {mb} МБ).",
+        "import.invalid": "Не вдалося прочитати файл: {error}",
+        "import.done": "📥 Імпортовано: <b>{imported}</b>\nВже були збережені, пропущено: {skipped}\nРядків з помилками: {errors}",
+        "import.error_line": "• рядок {row}: {error}",
         "common.cancel": "❌ Скасувати",
         "common.unknown_setting": "Невідома опція",
         "expense.cancelled": "❌ Скасовано.",
@@ -557,6 +577,7 @@ TRANSLATIONS = {
         "reports.chart_title": "Витрати за категоріями ({start} - {end})",
         "reports.chart_title_currency": "Витрати за категоріями ({start} - {end}) - {currency}",
         "reports.chart_caption": "Ось ваша кругова діаграма за категоріями за цей місяць ({start} - {end}).",
+        "reports.chart_busy": "Зараз графіки перевантажені — спробуйте за хвилину.",
         "admin.menu_title": "🛠 Адмін панель",
         "admin.feedbacks_btn": "📬 Фідбеки ({count} нових)",
         "admin.broadcast_btn": "📢 Розсилка",
@@ -2,34 +2,42 @@
 
 import os
 import sys
-import csv
-import io
+import base64
 import hmac
 import hashlib
 import json
 import logging
-import time
-import urllib.request
-import urllib.error
-from datetime import datetime, timedelta, time as dtime, date as ddate
+from datetime import datetime, timedelta, time as dtime
 from urllib.parse import parse_qsl
 
 import jwt
-from cryptography.fernet import Fernet, InvalidToken
+from cryptography.fernet import InvalidToken
 from dotenv import load_dotenv
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, Depends, File, HTTPException, Query, Request, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy import func, and_, or_, select, update
 
 load_dotenv()
 
-from databases.db import get_session, init_db
-from databases.models import User, Expense, Subscription
+from databases.db import async_engine, engine, get_async_session, get_session, init_db
+from databases.models import User, Expense, Subscription, DailyExpenseRollup, SyncTombstone
+from databases.imports import MAX_IMPORT_BYTES, import_expenses
+from databases.subscriptions import charge_due_subscriptions
+from databases.sync import sync_state_query
+from databases.mono_accounts import store_accounts
+from databases.mono_backfill import forget_backfills
+from databases.mono_events import enqueue_event
+from utils import mono
+from utils.categorizer import load_model
+from utils.export import (
+    EXPORT_BATCH, PARQUET_COLUMNS, PARQUET_MAGIC, read_csv, read_parquet, stream_csv, stream_parquet,
+)
+from utils.stats import build_stats, stats_window_start, to_buckets
 
 
 logger = logging.getLogger("moneylytics.mono")
@@ -44,158 +52,17 @@ logger.propagate = False
 BOT_TOKEN  = os.environ["BOT_TOKEN"]
 JWT_SECRET = os.environ.get("JWT_SECRET", BOT_TOKEN + "_webapp")
 
-# Fernet key used to encrypt Monobank personal tokens at rest. MUST be set in
-# Heroku config vars (and any deploy env) — without it the Mono endpoints
-# return 500. Generate one with:
+# MONO_ENCRYPTION_KEY is the Fernet key used to encrypt Monobank personal
+# tokens at rest (read by utils.mono). MUST be set in Heroku config vars (and
+# any deploy env) — without it the Mono endpoints return 500. Generate one with:
 #   python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
-MONO_ENCRYPTION_KEY = os.environ.get("MONO_ENCRYPTION_KEY")
-
-MONO_API = "https://api.monobank.ua"
 MONO_WEBHOOK_URL = "https://moneylytics-bot-9bebd4a93154.herokuapp.com/api/mono/webhook"
 
-MONO_CURRENCY = {980: "UAH", 978: "EUR", 840: "USD", 826: "GBP"}
-
-# Monobank MCC (merchant category code) → our canonical lowercase category.
-_MONO_MCC_GROUPS = {
-    "food":          [5411, 5412, 5441, 5451, 5462, 5499, 5812, 5813, 5814],
-    "transport":     [4111, 4121, 4131, 4784, 7511, 7512, 7513, 7519],
-    "shopping":      [5300, 5310, 5311, 5331, 5399, 5600, 5621, 5631, 5641,
-                      5651, 5661, 5691, 5699, 5732, 5734, 5999],
-    "health":        [5047, 5122, 5912, 8011, 8021, 8031, 8049, 8062, 8099],
-    "entertainment": [7832, 7922, 7929, 7941, 7991, 7993, 7994, 7995, 7999],
-    "beauty":        [7230, 7231, 7297],
-    "travel":        [3000, 4411, 4511, 4722, 7011, 7012],
-    "education":     [8211, 8220, 8241, 8244, 8249, 8299],
-    "housing":       [1520, 1711, 1731, 1740, 1750, 1761, 5200, 5211, 5251],
-}
-MONO_MCC_CATEGORY = {mcc: cat for cat, mccs in _MONO_MCC_GROUPS.items() for mcc in mccs}
-
-# Monobank stamps money transfers (card-to-card, "Між своїми", P2P to a
-# person) with MCC 4829 — never a retail purchase. Used to tell transfers
-# apart from spending in the webhook.
-_MONO_TRANSFER_MCC = 4829
-
-# For MCC 4829, Monobank leaves counterName empty for BOTH self-transfers
-# and P2P sends to other people — the only thing that differs is the
-# free-form description. Self-transfers carry one of these generic phrases
-# (often followed by a card mask); a P2P to a person carries their name.
-# Compared lower-cased via startswith, so trailing card masks don't matter.
-_MONO_OWN_TRANSFER_PHRASES = (
-    "переказ на картку",
-    "переказ між рахунками",
-    "між своїми",
-    "на свою картку",
-    "перевод на карту",
-)
-
-# Markers Monobank uses in the description of a positive-amount transaction to
-# indicate it's a reversal of a prior charge (not income). Compared lower-cased
-# via `in`, so substring matches anywhere in the description.
-_MONO_REFUND_MARKERS = (
-    "повернення",
-    "refund",
-    "возврат",
-    "скасування",
-)
-
-# account id → user id, so the webhook avoids a Monobank API call per delivery.
-# Monobank rate-limits client-info to once per 60s per token, so this matters.
-_mono_account_cache: dict[str, int] = {}
-
-# user id → (set of own IBANs, fetched-at unix ts). Lets the webhook recognise
-# the user's own card-to-card / jar transfers and skip them. Refreshed lazily
-# once older than an hour to respect Monobank's client-info rate limit.
-_mono_iban_cache: dict[int, tuple[set[str], float]] = {}
-_MONO_IBAN_TTL = 3600  # seconds
-
-
-def _get_fernet() -> Fernet:
-    if not MONO_ENCRYPTION_KEY:
-        raise HTTPException(status_code=500, detail="MONO_ENCRYPTION_KEY not configured")
-    return Fernet(MONO_ENCRYPTION_KEY.encode())
-
-
 def encrypt_token(token: str) -> str:
-    return _get_fernet().encrypt(token.encode()).decode()
-
-
-def decrypt_token(encrypted: str) -> str:
-    return _get_fernet().decrypt(encrypted.encode()).decode()
-
-
-def _mono_request(path: str, token: str, payload: dict | None = None) -> dict:
-    """Call the Monobank personal API. Raises urllib errors on failure.
-    The raw token travels only in the X-Token header — never logged."""
-    data = json.dumps(payload).encode() if payload is not None else None
-    req = urllib.request.Request(
-        f"{MONO_API}{path}",
-        data=data,
-        method="POST" if data is not None else "GET",
-        headers={"X-Token": token, "Content-Type": "application/json"},
-    )
-    with urllib.request.urlopen(req, timeout=15) as resp:
-        raw = resp.read().decode()
-    return json.loads(raw) if raw else {}
-
-
-def _resolve_mono_user(db: Session, account_id: str):
-    """Map a Monobank account id to the owning User. Checks the in-memory
-    cache first; on a miss, walks users with a stored token and asks Monobank
-    for their accounts, caching every account it sees along the way."""
-    cached = _mono_account_cache.get(account_id)
-    if cached is not None:
-        user = db.query(User).filter(User.id == cached).first()
-        if user and user.mono_token:
-            return user
-        _mono_account_cache.pop(account_id, None)
-
-    users = db.query(User).filter(User.mono_token.isnot(None)).all()
-    for user in users:
-        try:
-            token = decrypt_token(user.mono_token)
-            info = _mono_request("/personal/client-info", token)
-        except (InvalidToken, urllib.error.URLError, ValueError, OSError):
-            continue
-        for acc in info.get("accounts", []):
-            acc_id = acc.get("id")
-            if acc_id:
-                _mono_account_cache[acc_id] = user.id
-        if _mono_account_cache.get(account_id) == user.id:
-            return user
-    return None
-
-
-def _user_own_ibans(user) -> set[str]:
-    """The user's own account IBANs, so the webhook can skip self-transfers.
-    Cached per user for an hour; on a fetch error we fall back to any stale
-    cached set (better than dropping a legit expense)."""
-    now = time.time()
-    cached = _mono_iban_cache.get(user.id)
-    if cached is not None and now - cached[1] < _MONO_IBAN_TTL:
-        return cached[0]
     try:
-        token = decrypt_token(user.mono_token)
-        info = _mono_request("/personal/client-info", token)
-    except (InvalidToken, urllib.error.URLError, ValueError, OSError) as exc:
-        # client-info is rate-limited to 1/60s per token; a 429 here means we
-        # fall back to any stale set rather than dropping the filter entirely.
-        logger.warning("mono client-info fetch failed for user=%s: %r", user.id, exc)
-        return cached[0] if cached else set()
-    # Normalise IBANs (strip whitespace, upper-case) so webhook counterIban
-    # values compare equal, and include jars — money moved to your own jar is
-    # still a self-transfer, not spending.
-    ibans: set[str] = set()
-    for acc in info.get("accounts", []):
-        v = (acc.get("iban") or "").strip().upper()
-        if v:
-            ibans.add(v)
-    for jar in info.get("jars", []):
-        v = (jar.get("iban") or "").strip().upper()
-        if v:
-            ibans.add(v)
-    _mono_iban_cache[user.id] = (ibans, now)
-    logger.info("mono own ibans for user=%s: %r", user.id, ibans)
-    return ibans
+        return mono.encrypt_token(token)
+    except RuntimeError:
+        raise HTTPException(status_code=500, detail="MONO_ENCRYPTION_KEY not configured")
 
 
 def get_db():
@@ -226,11 +93,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 @app.on_event("startup")
 def startup():
     init_db()
+    load_model()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await mono.close_mono_client()
 
 
 def _validate_init_data(init_data: str) -> dict:
@@ -293,16 +167,58 @@ def _custom_range(from_str: str | None, to_str: str | None):
     return start, end
 
 
+EXPENSES_PAGE_SIZE = 200
+EXPENSES_PAGE_MAX = 1000
+
+
+def _encode_cursor(created_at: datetime, expense_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{expense_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, expense_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(expense_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def _expense_fields(fields: str | None) -> tuple[str, ...]:
+    if not fields:
+        return EXPENSE_FIELDS
+    wanted = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in wanted if f not in EXPENSE_FIELDS]
+    if unknown or not wanted:
+        raise HTTPException(status_code=400, detail=f"unknown fields: {', '.join(unknown) or fields}")
+    return wanted
+
+
 @app.get("/api/expenses")
 def list_expenses(
+    response: Response,
     period: str = "week",
     from_: str | None = Query(default=None, alias="from"),
     to: str | None = None,
+    cursor: str | None = None,
+    limit: int | None = Query(default=None, ge=1, le=EXPENSES_PAGE_MAX),
+    fields: str | None = None,
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db),
 ):
-    _process_due_subscriptions(db, user_id)
-    q = db.query(Expense).filter(Expense.user_id == user_id)
+    """Newest first. Paged only when the client asks with `limit` or
+    `cursor` (EXPENSES_PAGE_SIZE rows by default); without either it is the
+    whole period, as older clients expect. When more rows follow, the
+    X-Next-Cursor header holds the `cursor` for the next page: keyset on
+    (created_at, id), so every page is an index range scan however deep
+    the user scrolls. `fields=id,amount,...` selects only those columns."""
+    wanted = _expense_fields(fields)
+    # id and created_at make the cursor; mono_tx_id decides created_at's
+    # timezone suffix.
+    columns = {"id", "created_at", "mono_tx_id", *wanted}
+    q = db.query(*(getattr(Expense, c) for c in EXPENSE_FIELDS if c in columns))
+    q = q.filter(Expense.user_id == user_id)
     if period == "custom":
         start, end = _custom_range(from_, to)
         if start and end:
@@ -311,16 +227,32 @@ def list_expenses(
         since = _period_start(period)
         if since:
             q = q.filter(Expense.created_at >= since)
-    return [_expense_dict(e) for e in q.order_by(Expense.created_at.desc()).all()]
-
-
-@app.post("/api/expenses", status_code=201)
-def create_expense(body: dict, user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    if cursor:
+        after_at, after_id = _decode_cursor(cursor)
+        q = q.filter(or_(
+            Expense.created_at < after_at,
+            and_(Expense.created_at == after_at, Expense.id < after_id),
+        ))
+    q = q.order_by(Expense.created_at.desc(), Expense.id.desc())
+    if limit is None and cursor is None:
+        return [_expense_dict(e, wanted) for e in q.all()]
+    limit = limit or EXPENSES_PAGE_SIZE
+    rows = q.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1].created_at, rows[-1].id)
+    return [_expense_dict(e, wanted) for e in rows]
+
+
+def _new_expense(body: dict, user_id: int, default_currency: str) -> Expense:
+    """An Expense from a POST body. Raises HTTPException(400) on bad input."""
     amount = body.get("amount")
-    if not amount or float(amount) <= 0:
+    try:
+        if not amount or float(amount) <= 0:
+            raise HTTPException(status_code=400, detail="amount must be positive")
+    except (TypeError, ValueError):
         raise HTTPException(status_code=400, detail="amount must be positive")
-    user = db.query(User).filter(User.id == user_id).first()
-    currency = body.get("currency") or (user.currency if user else "EUR")
+    currency = body.get("currency") or default_currency
 
     # Store the client's local wall-clock time. Prefer the ready-made local
     # ISO string; otherwise shift utcnow() by timezone_offset, which uses JS
@@ -354,9 +286,9 @@ def create_expense(body: dict, user_id: int = Depends(get_current_user_id), db:
         except (TypeError, ValueError):
             pass
 
-    category = body.get("category", "other").lower()
+    category = (body.get("category") or "other").lower()
     recipient = (body.get("recipient") or "").strip()
-    expense = Expense(
+    return Expense(
         user_id=user_id,
         amount=float(amount),
         category=category,
@@ -366,12 +298,93 @@ def create_expense(body: dict, user_id: int = Depends(get_current_user_id), db:
         date_edited=date_edited,
         mono_counter_name=(recipient or None) if category == "transfer" else None,
     )
+
+
+def _default_currency(db: Session, user_id: int) -> str:
+    user = db.query(User).filter(User.id == user_id).first()
+    return user.currency if user else "EUR"
+
+
+@app.post("/api/expenses", status_code=201)
+def create_expense(body: dict, user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    expense = _new_expense(body, user_id, _default_currency(db, user_id))
     db.add(expense)
     db.commit()
     db.refresh(expense)
     return _expense_dict(expense)
 
 
+EXPENSES_BATCH_MAX = 500
+IDEMPOTENCY_KEY_MAX = 64
+
+
+def _create_batch(db: Session, user_id: int, items: list[dict]) -> list[dict]:
+    """Add every new item in one flush and return the per-item results.
+    An item whose key is already stored, or repeats an earlier item of
+    the batch, is reported as a duplicate of that expense."""
+    keys = [item.get("idempotency_key") if isinstance(item, dict) else None for item in items]
+    wanted = [k for k in keys if isinstance(k, str) and 0 < len(k) <= IDEMPOTENCY_KEY_MAX]
+    stored = {
+        e.idempotency_key: e
+        for e in db.query(Expense).filter(Expense.user_id == user_id, Expense.idempotency_key.in_(wanted))
+    } if wanted else {}
+
+    default_currency = _default_currency(db, user_id)
+    results: list[dict] = []
+    created: dict[str, Expense] = {}
+    for item, key in zip(items, keys):
+        if not isinstance(key, str) or not 0 < len(key) <= IDEMPOTENCY_KEY_MAX:
+            results.append({"idempotency_key": key, "status": "error",
+                            "error": f"idempotency_key must be a string of 1-{IDEMPOTENCY_KEY_MAX} characters"})
+            continue
+        if key in stored or key in created:
+            results.append({"idempotency_key": key, "status": "duplicate",
+                            "expense": stored.get(key) or created[key]})
+            continue
+        try:
+            expense = _new_expense(item, user_id, default_currency)
+        except HTTPException as e:
+            results.append({"idempotency_key": key, "status": "error", "error": e.detail})
+            continue
+        expense.idempotency_key = key
+        created[key] = expense
+        results.append({"idempotency_key": key, "status": "created", "expense": expense})
+
+    db.add_all(created.values())
+    db.flush()
+    return results
+
+
+@app.post("/api/expenses/batch")
+def create_expenses_batch(
+    items: list[dict],
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    """Expenses queued offline, each a POST /api/expenses body plus a
+    client-generated `idempotency_key`, inserted in one transaction.
+    Returns one result per item, in order: created, duplicate (the key
+    was seen before; the stored expense is returned, so resending a batch
+    after a lost response is safe) or error, which doesn't stop the rest."""
+    if len(items) > EXPENSES_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"at most {EXPENSES_BATCH_MAX} expenses per batch")
+    for attempt in range(2):
+        try:
+            results = _create_batch(db, user_id, items)
+            db.commit()
+            break
+        except IntegrityError:
+            # The same batch racing itself (a retry sent before the first
+            # request finished): the keys it stored are duplicates now.
+            db.rollback()
+            if attempt:
+                raise HTTPException(status_code=409, detail="conflicting batch in progress, retry")
+    for result in results:
+        if "expense" in result:
+            result["expense"] = _expense_dict(result["expense"])
+    return {"results": results}
+
+
 @app.put("/api/expenses/{expense_id}")
 def update_expense(
     expense_id: int,
@@ -422,124 +435,24 @@ def get_stats(
     user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db),
 ):
-    # Materialise any due subscription charges so this request reflects them.
-    _process_due_subscriptions(db, user_id)
-
     now = datetime.now()
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_start  = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-    def totals_by_currency_since(dt):
-        rows = db.query(Expense.currency, func.sum(Expense.amount)).filter(
-            and_(Expense.user_id == user_id, Expense.created_at >= dt)
-        ).group_by(Expense.currency).all()
-        return {row[0] or "EUR": round(float(row[1] or 0.0), 2) for row in rows}
-
-    def count_since(dt):
-        return db.query(func.count(Expense.id)).filter(
-            and_(Expense.user_id == user_id, Expense.created_at >= dt)
-        ).scalar() or 0
-
-    # Build the period filter. Custom uses an [from, to+1d) window; the other
-    # presets are an open-ended `created_at >= since` window.
-    custom_start, custom_end = (None, None)
-    if period == "custom":
-        custom_start, custom_end = _custom_range(from_, to)
-    since = None if period == "custom" else (_period_start(period) or month_start)
-
-    def apply_period(q):
-        if period == "custom":
-            if custom_start and custom_end:
-                return q.filter(Expense.created_at >= custom_start,
-                                Expense.created_at < custom_end)
-            return q
-        return q.filter(Expense.created_at >= since)
-
-    # Distinct currencies in the period — drives the Analytics currency switcher.
-    # Computed before the currency filter so the full set stays visible.
-    cur_rows = apply_period(
-        db.query(Expense.currency).filter(Expense.user_id == user_id)
-    ).distinct().all()
-    currencies = sorted({row[0] or "EUR" for row in cur_rows})
-
-    cat_q = apply_period(
-        db.query(Expense.category, func.sum(Expense.amount).label("total"))
-          .filter(Expense.user_id == user_id)
-    )
-    if currency:
-        cat_q = cat_q.filter(Expense.currency == currency)
-    by_category = cat_q.group_by(Expense.category).order_by(func.sum(Expense.amount).desc()).all()
-
-    # Last-7-day window. `daily` keeps the legacy single-series shape (honors
-    # the `currency` filter) for Analytics; `daily_by_currency` is the per
-    # currency breakdown the Dashboard sparkline needs and is intentionally
-    # NOT filtered, so its currency switcher always sees every currency.
-    week_days = [
-        (now - timedelta(days=i)).replace(hour=0, minute=0, second=0, microsecond=0)
-        for i in range(6, -1, -1)
-    ]
-    seven_start = week_days[0]
-    seven_end = week_days[-1] + timedelta(days=1)
-
-    daily = []
-    for day_start in week_days:
-        day_end = day_start + timedelta(days=1)
-        day_q = db.query(func.sum(Expense.amount)).filter(
-            and_(Expense.user_id == user_id, Expense.created_at >= day_start, Expense.created_at < day_end)
-        )
-        if currency:
-            day_q = day_q.filter(Expense.currency == currency)
-        r = day_q.scalar()
-        daily.append({"date": day_start.strftime("%Y-%m-%d"), "total": round(r or 0.0, 2)})
-
-    by_cur_rows = db.query(
-        func.date(Expense.created_at), Expense.currency, func.sum(Expense.amount)
-    ).filter(
-        and_(Expense.user_id == user_id,
-             Expense.created_at >= seven_start, Expense.created_at < seven_end)
-    ).group_by(func.date(Expense.created_at), Expense.currency).all()
-
-    sums = {}
-    for day_val, cur, total in by_cur_rows:
-        key = day_val if isinstance(day_val, str) else day_val.strftime("%Y-%m-%d")
-        sums[(key, cur or "EUR")] = round(float(total or 0.0), 2)
-    day_labels = [d.strftime("%Y-%m-%d") for d in week_days]
-    daily_by_currency = {
-        c: [{"date": d, "total": sums.get((d, c), 0.0)} for d in day_labels]
-        for c in {cur for (_, cur) in sums}
-    }
+    custom = period == "custom"
+    custom_start, custom_end = _custom_range(from_, to) if custom else (None, None)
+    period_start = None if custom else _period_start(period)
 
-    # Per-category totals bucketed by currency, for both the day and the week
-    # — drives the per-category budget progress bars on the Dashboard. Empty
-    # buckets are omitted so the frontend can do a simple lookup with default 0.
-    def cat_totals_since(dt):
-        rows = db.query(
-            Expense.currency, Expense.category, func.sum(Expense.amount)
-        ).filter(
-            and_(Expense.user_id == user_id, Expense.created_at >= dt)
-        ).group_by(Expense.currency, Expense.category).all()
-        out: dict[str, dict[str, float]] = {}
-        for cur, cat, total in rows:
-            cur_k = cur or "EUR"
-            cat_k = (cat or "other").lower()
-            out.setdefault(cur_k, {})[cat_k] = round(float(total or 0.0), 2)
-        return out
+    # One read of the (day, currency, category) rollup covering the month,
+    # the 7-day sparkline and the selected period; utils.stats derives every
+    # total, count and breakdown of the response from these buckets.
+    q = db.query(
+        DailyExpenseRollup.day, DailyExpenseRollup.currency, DailyExpenseRollup.category,
+        DailyExpenseRollup.total, DailyExpenseRollup.count,
+    ).filter(DailyExpenseRollup.user_id == user_id)
+    window_start = stats_window_start(now, period_start, custom_start, custom_end, custom)
+    if window_start is not None:
+        q = q.filter(DailyExpenseRollup.day >= window_start.date())
+    buckets = to_buckets(q.all())
 
-    return {
-        "today": totals_by_currency_since(today_start),
-        "week":  totals_by_currency_since(week_start),
-        "month": totals_by_currency_since(month_start),
-        "count_today": count_since(today_start),
-        "count_week":  count_since(week_start),
-        "count_month": count_since(month_start),
-        "currencies":  currencies,
-        "by_category":  [{"category": row.category, "total": round(row.total, 2)} for row in by_category],
-        "by_category_today": cat_totals_since(today_start),
-        "by_category_week":  cat_totals_since(week_start),
-        "daily_last_7": daily,
-        "daily_by_currency": daily_by_currency,
-    }
+    return build_stats(buckets, now, period_start, custom_start, custom_end, custom, currency)
 
 
 @app.get("/api/stats/alltime")
@@ -547,11 +460,13 @@ def get_alltime_stats(user_id: int = Depends(get_current_user_id), db: Session =
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404)
-    total_count = db.query(func.count(Expense.id)).filter(Expense.user_id == user_id).scalar() or 0
-    rows = db.query(Expense.currency, func.sum(Expense.amount)).filter(
-        Expense.user_id == user_id
-    ).group_by(Expense.currency).all()
-    total_by_currency = {(cur or "EUR"): round(float(total or 0.0), 2) for cur, total in rows}
+    rows = db.query(
+        DailyExpenseRollup.currency,
+        func.sum(DailyExpenseRollup.total),
+        func.sum(DailyExpenseRollup.count),
+    ).filter(DailyExpenseRollup.user_id == user_id).group_by(DailyExpenseRollup.currency).all()
+    total_count = sum(int(n or 0) for _, _, n in rows)
+    total_by_currency = {(cur or "EUR"): round(float(total or 0.0), 2) for cur, total, _ in rows}
     return {
         "total_count": int(total_count),
         "total_by_currency": total_by_currency,
@@ -562,64 +477,6 @@ def get_alltime_stats(user_id: int = Depends(get_current_user_id), db: Session =
 _SUB_PERIODS = ("monthly", "weekly")
 
 
-def _advance_due_date(d: ddate, period: str) -> ddate:
-    """Step a recurring charge's due date forward by one period. Weekly is
-    a flat 7 days. Monthly tries the same day-of-month; when the next month
-    is shorter (e.g. Jan 31 → Feb), it clamps to that month's last day."""
-    if period == "weekly":
-        return d + timedelta(days=7)
-    # monthly
-    month = d.month + 1
-    year = d.year
-    if month > 12:
-        month = 1
-        year += 1
-    # Find last valid day of target month.
-    if month == 12:
-        next_first = ddate(year + 1, 1, 1)
-    else:
-        next_first = ddate(year, month + 1, 1)
-    last_day = (next_first - timedelta(days=1)).day
-    return ddate(year, month, min(d.day, last_day))
-
-
-def _process_due_subscriptions(db: Session, user_id: int) -> int:
-    """Fire any of the user's active subscriptions whose `next_due_date` has
-    arrived: create an Expense per period missed and advance the date. Runs
-    on every /api/stats hit so we don't need a cron. Returns the number of
-    expenses created (mostly for logging/tests)."""
-    today = datetime.now().date()
-    subs = db.query(Subscription).filter(
-        and_(
-            Subscription.user_id == user_id,
-            Subscription.active == True,  # noqa: E712
-            Subscription.next_due_date <= today,
-        )
-    ).all()
-    if not subs:
-        return 0
-    created = 0
-    for sub in subs:
-        # Catch up across long absences in case the user didn't open the app
-        # for several periods. Capped at 24 iterations as a runaway guard.
-        steps = 0
-        while sub.next_due_date <= today and steps < 24:
-            expense = Expense(
-                user_id=user_id,
-                amount=float(sub.amount),
-                category=(sub.category or "other").lower(),
-                currency=sub.currency or "EUR",
-                description=sub.name,
-                created_at=datetime.combine(sub.next_due_date, dtime(12, 0)),
-            )
-            db.add(expense)
-            sub.next_due_date = _advance_due_date(sub.next_due_date, sub.period)
-            created += 1
-            steps += 1
-    db.commit()
-    return created
-
-
 def _sub_dict(s: Subscription) -> dict:
     return {
         "id": s.id,
@@ -676,9 +533,6 @@ def _parse_sub_body(body: dict, partial: bool = False) -> dict:
 
 @app.get("/api/subscriptions")
 def list_subscriptions(user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
-    # Fire any due charges before listing so the next_due_date displayed is
-    # always the upcoming one, never a stale past date.
-    _process_due_subscriptions(db, user_id)
     subs = db.query(Subscription).filter(Subscription.user_id == user_id).order_by(
         Subscription.next_due_date.asc()
     ).all()
@@ -690,12 +544,13 @@ def create_subscription(body: dict, user_id: int = Depends(get_current_user_id),
     fields = _parse_sub_body(body, partial=False)
     sub = Subscription(user_id=user_id, **fields)
     db.add(sub)
+    db.flush()
+    # If next_due_date is today/past, fire it in the same transaction so the
+    # user sees the expense materialise right away; everything else is left
+    # to the worker's background sweep (databases/subscriptions.py).
+    charge_due_subscriptions(db.connection(), user_id=user_id)
     db.commit()
     db.refresh(sub)
-    # If next_due_date is today/past, fire immediately so the user sees the
-    # expense materialise right away.
-    _process_due_subscriptions(db, user_id)
-    db.refresh(sub)
     return _sub_dict(sub)
 
 
@@ -713,6 +568,10 @@ def update_subscription(
     fields = _parse_sub_body(body, partial=True)
     for k, v in fields.items():
         setattr(sub, k, v)
+    db.flush()
+    # Moving the due date into the past (or re-activating) charges now,
+    # same as on create.
+    charge_due_subscriptions(db.connection(), user_id=user_id)
     db.commit()
     db.refresh(sub)
     return _sub_dict(sub)
@@ -730,29 +589,136 @@ def delete_subscription(sub_id: int, user_id: int = Depends(get_current_user_id)
     return {"ok": True}
 
 
+@app.get("/api/sync")
+def sync_changes(
+    since: int = Query(default=0, ge=0),
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    """Expenses and subscriptions created, edited or deleted after change
+    version `since` (0: everything), and the version to pass next time.
+    Apply `deleted` before upserting the rest. With `reset` the client's
+    version predates deletions we no longer remember: drop the local
+    copy and keep only what is returned."""
+    state = db.execute(sync_state_query(user_id)).first()
+    version, pruned = (state.version, state.pruned_version) if state else (0, 0)
+    reset = 0 < since < pruned
+    if reset:
+        since = 0
+    if since >= version:
+        return {"version": version, "reset": False, "expenses": [], "subscriptions": [],
+                "deleted": {"expenses": [], "subscriptions": []}}
+
+    # Anything stamped after `version` was committed after we read it and
+    # is left for the next sync, so every change is sent exactly once.
+    expenses = db.query(Expense).filter(
+        Expense.user_id == user_id, Expense.version > since, Expense.version <= version,
+    ).order_by(Expense.id).all()
+    subs = db.query(Subscription).filter(
+        Subscription.user_id == user_id, Subscription.version > since, Subscription.version <= version,
+    ).order_by(Subscription.id).all()
+    deleted = {"expenses": [], "subscriptions": []}
+    if since:
+        for kind, object_id in db.query(SyncTombstone.kind, SyncTombstone.object_id).filter(
+            SyncTombstone.user_id == user_id,
+            SyncTombstone.version > since, SyncTombstone.version <= version,
+        ):
+            deleted[kind + "s"].append(object_id)
+    return {
+        "version": version,
+        "reset": reset,
+        "expenses": [_expense_dict(e) for e in expenses],
+        "subscriptions": [_sub_dict(s) for s in subs],
+        "deleted": deleted,
+    }
+
+
+_EXPORT_HEADER = ["date", "time", "amount", "currency", "category", "description"]
+_EXPORT_FORMATS = ("csv", "parquet")
+
+
+def _export_row(row) -> list:
+    created_at, amount, currency, category, description = row
+    return [
+        created_at.strftime("%Y-%m-%d") if created_at else "",
+        created_at.strftime("%H:%M") if created_at else "",
+        f"{amount:.2f}",
+        currency or "",
+        category or "",
+        description or "",
+    ]
+
+
+def _export_rows(user_id: int, columns: list):
+    """Batches of at most EXPORT_BATCH rows of `columns`, newest first."""
+    # Its own connection: FastAPI closes get_db's session before the
+    # response body is sent, and this generator runs while it is.
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=EXPORT_BATCH).execute(
+            select(*columns).where(Expense.user_id == user_id).order_by(Expense.created_at.desc())
+        )
+        yield from result.partitions()
+
+
 @app.get("/api/expenses/export")
-def export_expenses_csv(user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
-    expenses = db.query(Expense).filter(Expense.user_id == user_id).order_by(Expense.created_at.desc()).all()
-    buf = io.StringIO()
-    writer = csv.writer(buf)
-    writer.writerow(["date", "time", "amount", "currency", "category", "description"])
-    for e in expenses:
-        writer.writerow([
-            e.created_at.strftime("%Y-%m-%d") if e.created_at else "",
-            e.created_at.strftime("%H:%M") if e.created_at else "",
-            f"{e.amount:.2f}",
-            e.currency or "",
-            e.category or "",
-            e.description or "",
-        ])
-    buf.seek(0)
+def export_expenses(
+    request: Request,
+    format: str = "csv",
+    user_id: int = Depends(get_current_user_id),
+):
+    """The user's whole history, streamed as it is read: CSV (gzipped
+    when the client accepts it) or, with format=parquet, Parquet in the
+    bot's export layout. POST /api/expenses/import takes either back; the
+    CSV has no ids, so its rows are matched by minute, amount, currency and
+    description instead."""
+    if format not in _EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be csv or parquet")
+    if format == "parquet":
+        columns = [getattr(Expense, name) for name, _ in PARQUET_COLUMNS]
+        return StreamingResponse(
+            stream_parquet(_export_rows(user_id, columns)),
+            media_type="application/vnd.apache.parquet",
+            headers={"Content-Disposition": 'attachment; filename="moneylytics_export.parquet"'},
+        )
+
+    gzip = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {"Content-Disposition": 'attachment; filename="moneylytics_export.csv"', "Vary": "Accept-Encoding"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    columns = [Expense.created_at, Expense.amount, Expense.currency, Expense.category, Expense.description]
+    rows = (row for batch in _export_rows(user_id, columns) for row in batch)
     return StreamingResponse(
-        iter([buf.getvalue()]),
+        stream_csv(rows, _EXPORT_HEADER, _export_row, gzip=gzip),
         media_type="text/csv",
-        headers={"Content-Disposition": 'attachment; filename="moneylytics_export.csv"'},
+        headers=headers,
     )
 
 
+@app.post("/api/expenses/import")
+def import_expenses_file(
+    file: UploadFile = File(...),
+    user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    """Load a CSV (the bot's or the Mini App's export layout) or Parquet
+    export in one transaction. Rows that are already stored (same id, or
+    same minute, amount, currency and description) are skipped; bad rows
+    are reported by line without stopping the rest."""
+    data = file.file.read(MAX_IMPORT_BYTES + 1)
+    if len(data) > MAX_IMPORT_BYTES:
+        raise HTTPException(status_code=413, detail="file too large")
+    user = db.query(User).filter(User.id == user_id).first()
+    try:
+        batches = read_parquet(data) if data[:4] == PARQUET_MAGIC else read_csv(data)
+        result = import_expenses(db.connection(), user_id, batches,
+                                 default_currency=(user.currency if user and user.currency else "EUR"))
+    except ValueError as e:
+        # Nothing is committed: the session rolls back on close.
+        raise HTTPException(status_code=400, detail=str(e))
+    db.commit()
+    return result
+
+
 @app.get("/api/user")
 def get_user(user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
     user = db.query(User).filter(User.id == user_id).first()
@@ -839,54 +805,89 @@ def _user_dict(u):
             "budgets": u.budgets or {},
             "created_at": u.created_at.isoformat() if u.created_at else None}
 
-def _expense_dict(e):
-    # Mono expenses store a naive UTC timestamp (Monobank's unix `time`), so we
-    # tag them with a 'Z' suffix and the frontend's new Date(...) converts them
-    # to the viewer's local time. Manually-added expenses already hold the
-    # client's local wall-clock, so they stay suffix-free.
-    created_at = e.created_at.isoformat()
-    if e.mono_tx_id:
-        created_at += "Z"
-    return {"id": e.id, "amount": e.amount, "category": e.category, "currency": e.currency,
-            "description": e.description, "created_at": created_at,
-            "date_edited": bool(e.date_edited), "mono_tx_id": e.mono_tx_id,
-            "mono_counter_name": e.mono_counter_name}
+EXPENSE_FIELDS = ("id", "amount", "category", "currency", "description", "created_at",
+                  "date_edited", "mono_tx_id", "mono_counter_name")
+
+
+def _expense_dict(e, fields: tuple[str, ...] = EXPENSE_FIELDS):
+    """An Expense (or a row of its columns) as JSON, limited to `fields`."""
+    out = {}
+    for field in fields:
+        if field == "created_at":
+            # Mono expenses store a naive UTC timestamp (Monobank's unix `time`), so we
+            # tag them with a 'Z' suffix and the frontend's new Date(...) converts them
+            # to the viewer's local time. Manually-added expenses already hold the
+            # client's local wall-clock, so they stay suffix-free.
+            value = e.created_at.isoformat()
+            if e.mono_tx_id:
+                value += "Z"
+        elif field == "date_edited":
+            value = bool(e.date_edited)
+        else:
+            value = getattr(e, field)
+        out[field] = value
+    return out
 
 
 @app.post("/api/mono/setup")
-def mono_setup(body: dict, user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
+async def mono_setup(body: dict, user_id: int = Depends(get_current_user_id)):
+    # Async so the Monobank round trips wait on the event loop instead of
+    # holding a threadpool worker (and a DB connection) for up to 15s.
     raw_token = (body.get("token") or "").strip()
     if not raw_token:
         raise HTTPException(status_code=400, detail="token required")
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404)
+    async with get_async_session() as session:
+        if await session.get(User, user_id) is None:
+            raise HTTPException(status_code=404)
 
     # Register the webhook with Monobank using the raw token. Errors here must
     # not leak the token — only a generic message is surfaced or logged.
     try:
-        _mono_request("/personal/webhook", raw_token, {"webHookUrl": MONO_WEBHOOK_URL})
-    except urllib.error.HTTPError:
+        await mono.mono_request("/personal/webhook", raw_token, {"webHookUrl": MONO_WEBHOOK_URL})
+    except mono.MonoAPIError:
         return {"ok": False, "error": "Monobank rejected the token"}
-    except (urllib.error.URLError, OSError, ValueError):
+    except mono.MonoError:
         return {"ok": False, "error": "Could not reach Monobank"}
+    encrypted = encrypt_token(raw_token)
 
-    user.mono_token = encrypt_token(raw_token)
-    db.commit()
+    # Map the user's accounts now so the first webhook resolves. If Monobank
+    # refuses (client-info is limited to once a minute per token), the
+    # worker's periodic refresh fills them in.
+    try:
+        rows = mono.account_rows(await mono.mono_request("/personal/client-info", raw_token))
+    except mono.MonoError as exc:
+        logger.warning("mono client-info fetch failed for user=%s: %r", user_id, exc)
+        rows = None
+
+    async with async_engine.begin() as conn:
+        await conn.execute(update(User).where(User.id == user_id).values(mono_token=encrypted))
+        if rows is not None:
+            await conn.run_sync(store_accounts, user_id, rows)
     return {"ok": True}
 
 
 @app.delete("/api/mono/setup")
-def mono_disconnect(user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404)
-    user.mono_token = None
-    db.commit()
-    for acc_id, uid in list(_mono_account_cache.items()):
-        if uid == user_id:
-            _mono_account_cache.pop(acc_id, None)
-    _mono_iban_cache.pop(user_id, None)
+async def mono_disconnect(user_id: int = Depends(get_current_user_id)):
+    async with get_async_session() as session:
+        user = await session.get(User, user_id)
+        if not user:
+            raise HTTPException(status_code=404)
+        encrypted = user.mono_token
+
+    # Tell Monobank to stop sending statements. Best effort: a revoked token
+    # can't unregister anything, and deliveries that still arrive are marked
+    # 'disconnected' by the queue (databases/mono_events.py).
+    if encrypted:
+        try:
+            await mono.mono_request("/personal/webhook", mono.decrypt_token(encrypted), {"webHookUrl": ""})
+        except (InvalidToken, mono.MonoError) as exc:
+            logger.warning("mono webhook unregister failed for user=%s: %r", user_id, exc)
+
+    # The user's mono_accounts rows stay, so the queue can tell their
+    # accounts from ones not mapped yet.
+    async with async_engine.begin() as conn:
+        await conn.execute(update(User).where(User.id == user_id).values(mono_token=None))
+        await conn.run_sync(forget_backfills, user_id)
     return {"ok": True}
 
 
@@ -906,180 +907,17 @@ async def mono_webhook_verify():
 
 
 @app.post("/api/mono/webhook")
-def mono_webhook(body: dict, db: Session = Depends(get_db)):
-    # Always 200 — Monobank retries any non-200. Every skip/error path below
-    # returns a plain dict so FastAPI replies 200.
+async def mono_webhook(body: dict):
+    # Always 200 — Monobank retries any non-200. The delivery is only queued
+    # here; the worker applies it (databases/mono_events.py), so a burst of
+    # card transactions never ties up the threadpool.
     try:
-        if body.get("type") != "StatementItem":
+        if not await enqueue_event(body):
             return {"status": "ignored"}
-
-        data = body.get("data") or {}
-        item = data.get("statementItem") or {}
-        amount = item.get("amount")
-        tx_id = item.get("id")
-        if amount is None or tx_id is None:
-            return {"status": "ignored"}
-
-        mono_desc_raw = (item.get("description") or "").strip()
-        if amount > 0:
-            desc_l = mono_desc_raw.lower()
-            is_refund = any(m in desc_l for m in _MONO_REFUND_MARKERS)
-            if not is_refund:
-                # Genuine income (salary, top-up, etc) — we only track spending.
-                return {"status": "skipped"}
-
-            # Refund: undo the original charge. Find the user first so we can
-            # scope the search to their expenses.
-            account_id = data.get("account")
-            user = _resolve_mono_user(db, account_id) if account_id else None
-            if not user:
-                logger.info(
-                    "mono webhook reversal: no matching expense found for tx=%s "
-                    "(unknown account)", tx_id,
-                )
-                return {"status": "no_user"}
-
-            # Monobank sometimes references the original tx id explicitly.
-            original_tx = (
-                item.get("originalTxId")
-                or item.get("originalTxID")
-                or item.get("counterTxId")
-            )
-            target = None
-            if original_tx:
-                target = db.query(Expense).filter(
-                    and_(Expense.user_id == user.id,
-                         Expense.mono_tx_id == str(original_tx))
-                ).first()
-            if target is None:
-                # Fall back to matching by amount within the last 30 days.
-                refund_amount = abs(amount) / 100
-                cutoff = datetime.utcnow() - timedelta(days=30)
-                target = db.query(Expense).filter(
-                    and_(
-                        Expense.user_id == user.id,
-                        Expense.amount == refund_amount,
-                        Expense.created_at >= cutoff,
-                        Expense.mono_tx_id.isnot(None),
-                    )
-                ).order_by(Expense.created_at.desc()).first()
-
-            if target is None:
-                logger.info(
-                    "mono webhook reversal: no matching expense found for tx=%s",
-                    tx_id,
-                )
-                return {"status": "reversal_no_match"}
-
-            logger.info(
-                "mono webhook reversal: deleted expense id=%s tx=%s",
-                target.id, tx_id,
-            )
-            db.delete(target)
-            db.commit()
-            return {"status": "reversal"}
-
-        if db.query(Expense.id).filter(Expense.mono_tx_id == str(tx_id)).first():
-            return {"status": "duplicate"}
-
-        account_id = data.get("account")
-        user = _resolve_mono_user(db, account_id) if account_id else None
-        if not user:
-            return {"status": "no_user"}
-
-        counter_iban = (item.get("counterIban") or "").strip().upper()
-        counter_edrpou = (item.get("counterEdrpou") or "").strip()
-        counter_name = (item.get("counterName") or "").strip()
-        mcc = item.get("mcc")
-        # Monobank's auto `description` (merchant name / self-transfer phrase /
-        # P2P recipient name) is distinct from `comment`, the note the user
-        # types when sending money. They serve different roles below.
-        mono_desc = (item.get("description") or "").strip()
-        comment = (item.get("comment") or "").strip()
-        own_ibans = _user_own_ibans(user)
-        logger.info(
-            "mono webhook tx=%s user=%s mcc=%s counterIban=%r counterEdrpou=%r "
-            "counterName=%r description=%r comment=%r own_ibans=%r",
-            tx_id, user.id, mcc, counter_iban, counter_edrpou,
-            counter_name, mono_desc, comment, own_ibans,
-        )
-
-        # Monobank tags money transfers (not retail purchases) with MCC 4829.
-        # A non-empty counterEdrpou means the counterparty is a registered
-        # business, so it's a real payment, not a personal transfer.
-        is_transfer = mcc == _MONO_TRANSFER_MCC and not counter_edrpou
-
-        # Skip the user's own movements between their own accounts/jars
-        # (not spending). Two shapes:
-        #   * IBAN transfer to one of the user's own IBANs.
-        #   * MCC 4829 with no counterName and a generic Monobank
-        #     self-transfer phrase as the description ("Переказ на
-        #     картку ...", "Між своїми", etc). A real P2P to another
-        #     person also has an empty counterName, but its description
-        #     is the recipient's name, not one of these phrases.
-        desc_lower = mono_desc.lower()
-        is_own_phrase = any(
-            desc_lower.startswith(p) for p in _MONO_OWN_TRANSFER_PHRASES
-        )
-        own_transfer = (counter_iban and counter_iban in own_ibans) or (
-            is_transfer and not counter_name and is_own_phrase
-        )
-        if own_transfer:
-            logger.info("mono webhook tx=%s skipped: own transfer", tx_id)
-            return {"status": "own_transfer"}
-
-        # Monobank sends two currency fields: `currencyCode` is the account's
-        # currency and `amount` is the charge in that currency; for foreign
-        # purchases `operationCurrencyCode` + `operationAmount` carry the
-        # original currency of the transaction. Prefer the operation currency
-        # when it differs so a USD purchase shows up as USD, not UAH.
-        currency_code = item.get("currencyCode")
-        op_currency_code = item.get("operationCurrencyCode")
-        op_amount = item.get("operationAmount")
-        if (op_currency_code and op_amount is not None
-                and op_currency_code != currency_code):
-            expense_amount = abs(op_amount) / 100
-            currency = MONO_CURRENCY.get(op_currency_code, "UAH")
-        else:
-            expense_amount = abs(amount) / 100
-            currency = MONO_CURRENCY.get(currency_code, "UAH")
-        # Monobank's `time` is a unix timestamp in UTC — keep it naive UTC.
-        created_at = datetime.utcfromtimestamp(item.get("time")) if item.get("time") else datetime.utcnow()
-        # The expense description is always the user-written `comment` when
-        # present. For a (non-skipped) MCC 4829 P2P transfer the recipient
-        # is counterName, or Monobank's auto description when that's empty,
-        # and is kept only in its dedicated column. For everything else the
-        # comment falls back to Monobank's merchant description.
-        if is_transfer:
-            category = "transfer"
-            counter_name = counter_name or mono_desc or None
-            description = comment
-        else:
-            category = MONO_MCC_CATEGORY.get(mcc, "other")
-            counter_name = counter_name or None
-            description = comment or mono_desc
-
-        expense = Expense(
-            user_id=user.id,
-            amount=expense_amount,
-            category=category,
-            currency=currency,
-            description=description,
-            created_at=created_at,
-            mono_tx_id=str(tx_id),
-            mono_counter_name=counter_name,
-        )
-        db.add(expense)
-        try:
-            db.commit()
-        except IntegrityError:
-            # Concurrent delivery of the same tx won the unique-index race.
-            db.rollback()
-            return {"status": "duplicate"}
-        return {"status": "ok"}
     except Exception:
-        db.rollback()
+        logger.exception("mono webhook: could not queue delivery")
         return {"status": "error"}
+    return {"status": "queued"}
 
 
 app.mount("/", StaticFiles(directory="frontend/dist", html=True), name="static")
\ No newline at end of file